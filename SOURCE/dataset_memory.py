@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import shutil
+import numpy as np
+
+
+def dataset_memory_size(in_data):
+    # Uncompressed variables size of an opened dataset, initial in memory size of the datasets derived from it
+    # (in memory datasets buffers grow as needed)
+    return int(np.sum([in_data.variables[variable].size * in_data.variables[variable].dtype.itemsize
+                       for variable in in_data.variables.keys()
+                       if not isinstance(in_data.variables[variable].dtype, type)]))
+
+
+def dataset_contents(in_file, in_memory=None):
+    # netCDF contents of a dataset already loaded in memory or stored in in_file
+    if in_memory is not None:
+        return in_memory
+    with open(in_file, 'rb') as in_stream:
+        return in_stream.read()
+
+
+def dataset_contents_write(out_file, out_memory):
+    with open(out_file, 'wb') as out_stream:
+        out_stream.write(out_memory)
+
+
+def dataset_copy(in_file, out_file, in_memory=None, out_memory=False):
+    # Unchanged dataset from disk or memory (in_memory contents) to disk or memory:
+    # returns the netCDF contents if out_memory, writes out_file otherwise
+    if out_memory:
+        return dataset_contents(in_file, in_memory)
+    if in_memory is not None:
+        dataset_contents_write(out_file, in_memory)
+    else:
+        shutil.copy2(in_file, out_file)
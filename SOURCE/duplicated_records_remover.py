@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
-import shutil
 import time
 import numpy as np
 import netCDF4
+from SOURCE import dataset_memory
 
 # Global variables
 sleep_time = 0.1  # seconds
@@ -19,7 +19,7 @@ def string_to_bool(string):
 
 
 # Functional version
-def duplicated_records_remover(in_file=None, out_file=None, verbose=True):
+def duplicated_records_remover(in_file=None, out_file=None, in_memory=None, out_memory=False, verbose=True):
     # if __name__ == '__main__':
     #     return
     if verbose:
@@ -39,7 +39,8 @@ def duplicated_records_remover(in_file=None, out_file=None, verbose=True):
         print(' Output file = ' + out_file)
         print(' Verbosity switch = ' + str(verbose))
 
-    in_data = netCDF4.Dataset(in_file, mode='r')
+    # Open input dataset (from its netCDF contents if already loaded in memory)
+    in_data = netCDF4.Dataset(in_file, mode='r', memory=in_memory)
     in_time_data = in_data.variables['time'][:]
 
     [out_time_data, unique_indices, reverse_indices, duplicated_counts] = \
@@ -51,8 +52,7 @@ def duplicated_records_remover(in_file=None, out_file=None, verbose=True):
             print(' No Duplicated time steps found. Copying input file to output file and exiting.')
             print(' -------------------------')
         in_data.close()
-        shutil.copy2(in_file, out_file)
-        return
+        return dataset_memory.dataset_copy(in_file, out_file, in_memory, out_memory)
 
     if verbose:
         print(' Starting process...')
@@ -62,8 +62,12 @@ def duplicated_records_remover(in_file=None, out_file=None, verbose=True):
 
     if verbose:
         print(' Creating output dataset.')
-    # Create output dataset
-    out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
+    # Create output dataset (in memory if out_memory, returning its netCDF contents)
+    if out_memory:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4',
+                                   memory=dataset_memory.dataset_memory_size(in_data))
+    else:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
 
     # Copy fixed dimensions in output dataset
     if verbose:
@@ -133,6 +137,8 @@ def duplicated_records_remover(in_file=None, out_file=None, verbose=True):
         print(' -------------------------')
     # Close input and output datasets
     in_data.close()
+    if out_memory:
+        return bytes(out_data.close())
     out_data.close()
 
 
@@ -152,4 +158,4 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
     except (IndexError, ValueError):
         verbose = True
 
-    duplicated_records_remover(in_file, out_file, verbose)
+    duplicated_records_remover(in_file, out_file, None, False, verbose)
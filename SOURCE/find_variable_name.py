@@ -15,6 +15,18 @@ def string_to_bool(string):
         return False
 
 
+def dataset_variable_name(in_data, in_variable_attribute_name, in_variable_attribute_value):
+    # Same search of the functional version on an already opened dataset (raises KeyError if not found)
+    for variable in in_data.variables.keys():
+        try:
+            variable_attribute = getattr(in_data.variables[variable], in_variable_attribute_name)
+        except AttributeError:
+            continue
+        if variable_attribute == in_variable_attribute_value:
+            return variable
+    raise KeyError(in_variable_attribute_name)
+
+
 # Functional version
 def find_variable_name(in_file=None, in_variable_attribute_name=None, in_variable_attribute_value=None, verbose=True):
     # if __name__ == '__main__':
@@ -6,7 +6,7 @@ import pandas as pd
 import netCDF4
 import time
 import calendar
-from SOURCE import find_variable_name
+from SOURCE import find_variable_name, time_calc
 
 # Global variables
 sleep_time = 0.1  # seconds
@@ -568,11 +568,9 @@ def model_datasets_concatenator(in_list=None, in_variable_standard_name=None, in
         out_time_stamps = pd.date_range(start_date, end_date, freq='H')
         out_left_time_stamps = out_time_stamps - pd.Timedelta(minutes=30)
         out_right_time_stamps = out_time_stamps + pd.Timedelta(minutes=30)
-    out_time_data = np.array([t.value / 1e9 for t in out_time_stamps])
-    out_time_bounds_data = np.transpose(np.array(
-        [[t.value / 1e9 for t in out_left_time_stamps], [t.value / 1e9 for t in out_right_time_stamps]]))
-    out_index_time_data = \
-        [index for index in range(out_time_data.shape[0]) if out_time_data[index] in aggregated_time_data]
+    [out_time_data, out_time_bounds_data] = \
+        time_calc.time_axis_seconds(out_time_stamps, out_left_time_stamps, out_right_time_stamps)
+    out_index_time_data = np.flatnonzero(np.isin(out_time_data, aggregated_time_data))
 
     for location in range(probes_indices.shape[0]):
         probe_index = probes_indices[location]
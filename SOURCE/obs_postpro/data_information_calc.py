@@ -5,7 +5,6 @@ import time
 import numpy as np
 import netCDF4
 import calendar
-from SOURCE import find_variable_name
 
 # Global variables
 sleep_time = 0.1  # seconds
@@ -18,27 +17,36 @@ def string_to_bool(string):
         return False
 
 
+def last_true_index(in_mask):
+    # Index of the last True element along the first axis, -1 if there are none
+    last_index = in_mask.shape[0] - 1 - np.argmax(in_mask[::-1, ...], axis=0)
+    return np.where(np.any(in_mask, axis=0), last_index, -1)
+
+
 def data_information_calc(in_file=None, in_variable_standard_name=None, valid_qc_values=None, in_depth_index=None,
-                          first_date_str=None, last_date_str=None, verbose=True):
+                          first_date_str=None, last_date_str=None, all_depths=False, verbose=True):
     if __name__ == '__main__':
         return
     if verbose:
         print(' -------------------------' + ' ' + __file__ + ' -------------------------')
         print(' Script to calculate total, valid, invalid, no QC and filled data number for a depth sliced variable.')
         print(' -------------------------')
-    if in_file is None or in_variable_standard_name is None or valid_qc_values is None or in_depth_index is None:
+    if in_file is None or in_variable_standard_name is None or valid_qc_values is None or \
+            (in_depth_index is None and not all_depths):
         time.sleep(sleep_time)
-        print(' Error: 4 of 7 maximum arguments (3 optionals) not provided.', file=sys.stderr)
+        print(' Error: 4 of 8 maximum arguments (4 optionals) not provided.', file=sys.stderr)
         print(' 1) input file;', file=sys.stderr)
         print(' 2) input variable standard_name;', file=sys.stderr)
         print(' 3) input variable valid qc values to consider (spaced valued string, example: "0 1 2");',
               file=sys.stderr)
-        print(' 4) input file depth index to check;', file=sys.stderr)
+        print(' 4) input file depth index to check (not needed with all depths switch);', file=sys.stderr)
         print(' 5) (optional) first cut date in YYYYMMDD or YYYY-MM-DD HH:MM:SS format'
               ' (default: first recorded data);', file=sys.stderr)
         print(' 6) (optional) last cut date in YYYYMMDD or YYYY-MM-DD HH:MM:SS format'
               '  default: last recorded data).', file=sys.stderr)
-        print(' 7) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
+        print(' 7) (optional) all depths switch: compute statistics and last record times of every depth level'
+              ' in one pass (True or False) (default: False);', file=sys.stderr)
+        print(' 8) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
         time.sleep(sleep_time)
         return
 
@@ -63,6 +71,7 @@ def data_information_calc(in_file=None, in_variable_standard_name=None, valid_qc
         print(' Input variable standard_name = ' + in_variable_standard_name)
         print(' Valid qc values to consider = ' + valid_qc_values)
         print(' Input depth slice index = ' + str(in_depth_index))
+        print(' All depths switch = ' + str(all_depths))
         print(' First date to process = ' + str(first_date_str) +
               ' (if None it will be the first available date)')
         print(' Last date to process = ' + str(last_date_str) +
@@ -134,19 +143,25 @@ def data_information_calc(in_file=None, in_variable_standard_name=None, valid_qc
 
     total_records_number = len(out_time_indices)
 
-    out_data_array = np.array([total_records_number], dtype=int)
-
-    in_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', in_variable_standard_name,
-                                                             verbose=False)
+    # Variable name is searched on the already opened dataset (same first match of find_variable_name)
+    in_variables = in_data.get_variables_by_attributes(standard_name=in_variable_standard_name)
+    if not in_variables:
+        in_data.close()
+        raise KeyError('standard_name')
+    in_variable_name = in_variables[0].name
 
     in_variable_qc = in_data.variables[in_variable_name + '_qc']
-    in_variable_qc_data = in_variable_qc[out_time_indices, in_depth_index]
+    if all_depths:
+        in_variable_qc_data = in_variable_qc[out_time_indices, ...]
+    else:
+        in_variable_qc_data = in_variable_qc[out_time_indices, in_depth_index][..., np.newaxis]
 
     if np.ma.is_masked(in_variable_qc_data):
         in_variable_qc_data_fill_value = in_variable_qc_data.fill_value
         in_variable_qc_data = in_variable_qc_data.data
     else:
         in_variable_qc_data_fill_value = None
+        in_variable_qc_data = np.ma.getdata(in_variable_qc_data)
 
     try:
         flag_values = in_variable_qc.flag_values
@@ -169,42 +184,11 @@ def data_information_calc(in_file=None, in_variable_standard_name=None, valid_qc
         except IndexError:
             pass
         no_qc_data_mask = in_variable_qc_data == no_qc_value
-        no_qc_data = in_variable_qc_data[no_qc_data_mask]
-        no_qc_values_number = no_qc_data.shape[0]
-        no_qc_indices = np.where(no_qc_data_mask)[0]
-        try:
-            last_no_qc_index = no_qc_indices[-1]
-        except IndexError:
-            last_no_qc_index = -1
     else:
-        no_qc_values_number = 0
-        last_no_qc_index = -1
-
-    out_data_array = np.append(out_data_array, [no_qc_values_number, last_no_qc_index])
-
-    if no_qc_value:
-        if verbose:
-            print(' Total number of no qc values for field ' + in_variable_standard_name + ' :')
-            print('     ' + str(no_qc_values_number) + ' / ' + str(in_variable_qc_data.shape[0]))
-
-    valid_data_mask = np.zeros(in_variable_qc_data.shape, dtype=bool)
-    invalid_data_mask = np.ones(in_variable_qc_data.shape, dtype=bool)
-    for valid_qc_value in valid_qc_values:
-        valid_data_mask = np.logical_or(valid_data_mask, in_variable_qc_data == valid_qc_value)
-        invalid_data_mask = np.logical_and(invalid_data_mask, in_variable_qc_data != valid_qc_value)
-    valid_data = in_variable_qc_data[valid_data_mask]
-    valid_values_number = valid_data.shape[0]
-    valid_indices = np.where(valid_data_mask)[0]
-    try:
-        last_valid_index = valid_indices[-1]
-    except IndexError:
-        last_valid_index = -1
-
-    out_data_array = np.append(out_data_array, [valid_values_number, last_valid_index])
+        no_qc_data_mask = np.zeros(in_variable_qc_data.shape, dtype=bool)
 
-    if verbose:
-        print(' Total number of valid values for field ' + in_variable_standard_name + ' :')
-        print('     ' + str(valid_values_number) + ' / ' + str(in_variable_qc_data.shape[0]))
+    valid_data_mask = np.isin(in_variable_qc_data, valid_qc_values)
+    invalid_data_mask = np.invert(valid_data_mask)
 
     if in_variable_qc_data_fill_value is not None:
         filled_data_mask = in_variable_qc_data == in_variable_qc_data_fill_value
@@ -221,38 +205,47 @@ def data_information_calc(in_file=None, in_variable_standard_name=None, valid_qc
     except (AttributeError, IndexError, ValueError):
         pass
 
-    filled_data = in_variable_qc_data[filled_data_mask]
-    filled_values_number = filled_data.shape[0]
-    filled_indices = np.where(filled_data_mask)[0]
-    try:
-        last_filled_index = filled_indices[-1]
-    except IndexError:
-        last_filled_index = -1
-
-    out_data_array = np.append(out_data_array, [filled_values_number, last_filled_index])
+    # One column per depth level: total, then number and last record index of
+    # no qc, valid, filled and invalid values (-1 if there are none)
+    out_data_array = np.empty(shape=(in_variable_qc_data.shape[-1], 9), dtype=int)
+    out_data_array[:, 0] = total_records_number
+    for category_column, category_mask in zip([1, 3, 5, 7],
+                                              [no_qc_data_mask, valid_data_mask, filled_data_mask, invalid_data_mask]):
+        out_data_array[:, category_column] = np.sum(category_mask, axis=0)
+        out_data_array[:, category_column + 1] = last_true_index(category_mask)
 
     if verbose:
-        print(' Total number of filled values for field ' + in_variable_standard_name + ' :')
-        print('     ' + str(filled_values_number) + ' / ' + str(in_variable_qc_data.shape[0]))
+        for depth in range(out_data_array.shape[0]):
+            if all_depths:
+                print(' Depth level ' + str(depth + 1) + ':')
+            if no_qc_value:
+                print(' Total number of no qc values for field ' + in_variable_standard_name + ' :')
+                print('     ' + str(out_data_array[depth, 1]) + ' / ' + str(in_variable_qc_data.shape[0]))
+            print(' Total number of valid values for field ' + in_variable_standard_name + ' :')
+            print('     ' + str(out_data_array[depth, 3]) + ' / ' + str(in_variable_qc_data.shape[0]))
+            print(' Total number of filled values for field ' + in_variable_standard_name + ' :')
+            print('     ' + str(out_data_array[depth, 5]) + ' / ' + str(in_variable_qc_data.shape[0]))
+            print(' Total number of invalid values for field ' + in_variable_standard_name + ' :')
+            print('     ' + str(out_data_array[depth, 7]) + ' / ' + str(in_variable_qc_data.shape[0]))
 
-    invalid_data = in_variable_qc_data[invalid_data_mask]
-    invalid_values_number = invalid_data.shape[0]
-    invalid_indices = np.where(invalid_data_mask)[0]
-    try:
-        last_invalid_index = invalid_indices[-1]
-    except IndexError:
-        last_invalid_index = -1
-
-    out_data_array = np.append(out_data_array, [invalid_values_number, last_invalid_index])
+            print(' -------------------------')
 
-    if verbose:
-        print(' Total number of invalid values for field ' + in_variable_standard_name + ' :')
-        print('     ' + str(invalid_data.shape[0]) + ' / ' + str(in_variable_qc_data.shape[0]))
+    if not all_depths:
+        in_data.close()
+        return out_data_array[0, :]
 
-        print(' -------------------------')
+    # Last record times in seconds since 1970-01-01 of no qc, valid, filled and invalid values
+    # (same values of time_from_index, -1 if there are none)
+    out_time_array = np.full(shape=(out_data_array.shape[0], 4), fill_value=-1, dtype=int)
+    for category_index in range(4):
+        last_indices = out_data_array[:, 2 * category_index + 2]
+        for depth in np.where(last_indices > -1)[0]:
+            last_time = in_time_data[out_time_indices[last_indices[depth]]]
+            if not np.ma.is_masked(last_time):
+                out_time_array[depth, category_index] = int(np.round(last_time))
 
     in_data.close()
-    return out_data_array
+    return out_data_array, out_time_array
 
 
 # Stand alone version
@@ -291,11 +284,24 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
             last_date_str = None
 
     try:
-        verbose = string_to_bool(sys.argv[7])
+        all_depths = string_to_bool(sys.argv[7])
+    except (IndexError, ValueError):
+        all_depths = False
+
+    try:
+        verbose = string_to_bool(sys.argv[8])
     except (IndexError, ValueError):
         verbose = True
 
-    out_data_array = data_information_calc(in_file, in_variable_standard_name, valid_qc_values, in_depth_index,
-                                           first_date_str, last_date_str, verbose)
-    out_data_list = map(str, out_data_array)
-    print(' '.join(out_data_list))
+    if all_depths:
+        [out_data_array, out_time_array] = \
+            data_information_calc(in_file, in_variable_standard_name, valid_qc_values, in_depth_index,
+                                  first_date_str, last_date_str, all_depths, verbose)
+        for depth in range(out_data_array.shape[0]):
+            out_data_list = map(str, np.append(out_data_array[depth, :], out_time_array[depth, :]))
+            print(' '.join(out_data_list))
+    else:
+        out_data_array = data_information_calc(in_file, in_variable_standard_name, valid_qc_values, in_depth_index,
+                                               first_date_str, last_date_str, all_depths, verbose)
+        out_data_list = map(str, out_data_array)
+        print(' '.join(out_data_list))
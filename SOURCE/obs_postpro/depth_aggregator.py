@@ -5,13 +5,12 @@ import time
 import calendar
 import numpy as np
 import netCDF4
+from SOURCE import dataset_memory
+from SOURCE.obs_postpro import depth_calc
 
 # Global variables
 sleep_time = 0.1  # seconds
 out_fill_value = 1.e20
-depth_minimum_space = 0.5  # m
-depth_average_threshold = 5 / 100  # %
-threshold_tolerance = 20 / 100  # %
 
 
 def string_to_bool(string):
@@ -23,7 +22,8 @@ def string_to_bool(string):
 
 # Functional version
 def depth_aggregator(in_file=None, depth_array_str=None, out_file=None,
-                     first_date_str=None, last_date_str=None, verbose=True):
+                     first_date_str=None, last_date_str=None, out_depth_cell_methods=None, out_history=None,
+                     out_memory=False, verbose=True):
     # if __name__ == '__main__':
     #     return
     if verbose:
@@ -152,8 +152,12 @@ def depth_aggregator(in_file=None, depth_array_str=None, out_file=None,
     out_depth_data = np.array(np.float32(depth_array_str.split(' ')))
 
     print(' Creating output dataset.')
-    # Create output dataset
-    out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
+    # Create output dataset (in memory if out_memory, returning its netCDF contents)
+    if out_memory:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4',
+                                   memory=dataset_memory.dataset_memory_size(in_data))
+    else:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
 
     # Copy fixed dimensions in output dataset
     if verbose:
@@ -214,30 +218,16 @@ def depth_aggregator(in_file=None, depth_array_str=None, out_file=None,
     out_variables = [variable for variable in in_data.variables.keys()
                      if variable not in ['lon', 'lat', 'depth', 'time']]
 
-    for variable_name in out_variables:
+    if verbose:
+        print(' Aggregating depth levels on variables ' + ' '.join(out_variables))
+    # Assign every depth sample to its output depth level once and average all variables in one grouped reduction
+    depth_bins = depth_calc.depth_levels_bins(in_depth_data, out_depth_data)
+    out_variables_data = depth_calc.depth_levels_means([in_data.variables[variable_name][...][out_time_indices, ...]
+                                                        for variable_name in out_variables],
+                                                       depth_bins, out_depth_data.shape[0])[0]
+
+    for variable_name, out_variable_data in zip(out_variables, out_variables_data):
         in_variable = in_data.variables[variable_name]
-        in_variable_data = in_variable[...]
-        if not np.ma.is_masked(in_variable_data):
-            in_variable_data = np.ma.array(in_variable_data,
-                                           mask=np.zeros(shape=in_variable_data.shape, dtype=bool),
-                                           fill_value=out_fill_value, dtype=float)
-        in_variable_data = in_variable_data[out_time_indices]
-        if verbose:
-            print(' Aggregating depth levels on variable ' + variable_name)
-        work_variable_data = np.ma.copy(in_variable_data)
-        out_variable_data = np.ma.empty(shape=(in_variable_data.shape[0], 0),
-                                        fill_value=out_fill_value, dtype=in_variable.dtype)
-        for depth in out_depth_data:
-            indices = np.abs(in_depth_data - depth) <= \
-                      np.max([np.abs(depth) * depth_average_threshold, depth_minimum_space]) * \
-                      (1 + threshold_tolerance)
-            temp_variable = np.ma.masked_all(shape=in_variable_data.shape, dtype=in_variable.datatype)
-            temp_variable = np.ma.where(indices, work_variable_data, temp_variable)
-            mean_variable = np.ma.mean(temp_variable, axis=1)
-            out_variable_data = np.ma.append(out_variable_data, mean_variable[:, np.newaxis], axis=1)
-            work_variable_data[indices] = out_fill_value
-            work_variable_data.mask[indices] = True
-
         # Create output variable
         out_variable = out_data.createVariable(variable_name, in_variable.datatype,
                                                dimensions=in_variable.dimensions,
@@ -252,12 +242,19 @@ def depth_aggregator(in_file=None, depth_array_str=None, out_file=None,
         print(' Setting global attributes.')
     # Set global attributes
     out_data.setncatts({attribute: in_data.getncattr(attribute) for attribute in in_data.ncattrs()})
+    # Depth cell methods and history set by the caller (functional version only)
+    if out_depth_cell_methods is not None:
+        out_depth.cell_methods = out_depth_cell_methods
+    if out_history is not None:
+        out_data.history = out_history
 
     if verbose:
         print(' Closing datasets.')
         print(' -------------------------')
     # Close input and output datasets
     in_data.close()
+    if out_memory:
+        return bytes(out_data.close())
     out_data.close()
 
 
@@ -288,4 +285,4 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
     except (IndexError, ValueError):
         verbose = True
 
-    depth_aggregator(in_file, depth_array_str, out_file, first_date_str, last_date_str, verbose)
+    depth_aggregator(in_file, depth_array_str, out_file, first_date_str, last_date_str, None, None, False, verbose)
@@ -21,6 +21,46 @@ def string_to_bool(string):
         return False
 
 
+def depth_levels_bins(in_depth_data, depth_levels):
+    # Index of the first depth level whose tolerance interval contains each input depth sample (-1 if none or masked).
+    # Levels are tested once on the distinct input depths and mapped back to the samples with the unique inverse
+    depth_mask = np.ma.getmaskarray(in_depth_data)
+    [unique_depths, unique_inverse] = np.unique(np.ma.getdata(in_depth_data)[~depth_mask], return_inverse=True)
+    unique_bins = np.full(unique_depths.shape, -1)
+    # Reversed levels order, so that the first matching level wins on overlapping intervals
+    for level in reversed(range(len(depth_levels))):
+        depth = depth_levels[level]
+        unique_bins[np.abs(unique_depths - depth) <=
+                    np.max([np.abs(depth) * depth_average_threshold, depth_minimum_space]) *
+                    (1 + threshold_tolerance)] = level
+    depth_bins = np.full(in_depth_data.shape, -1)
+    depth_bins[~depth_mask] = unique_bins[unique_inverse]
+    return depth_bins
+
+
+def depth_levels_means(in_variables_data, depth_bins, levels_number):
+    # Per record means on depth levels of (record, depth) variables (masked values excluded), computed for all
+    # variables with one grouped reduction over (variable, record, level) groups.
+    # Returns masked means (variable, record, level) and filled records numbers (variable, level)
+    if len(in_variables_data) == 0:
+        return [np.ma.masked_all(shape=(0, 0, levels_number)), np.zeros(shape=(0, levels_number), dtype=int)]
+    records_number = in_variables_data[0].shape[0]
+    shape = (len(in_variables_data), records_number, levels_number)
+    groups_indices = []
+    groups_values = []
+    for variable_index, variable_data in enumerate(in_variables_data):
+        variable_bins = np.broadcast_to(depth_bins, variable_data.shape)
+        valid = np.logical_and(variable_bins >= 0, np.logical_not(np.ma.getmaskarray(variable_data)))
+        groups_indices.append((variable_index * records_number + np.nonzero(valid)[0]) * levels_number +
+                              variable_bins[valid])
+        groups_values.append(np.ma.getdata(variable_data)[valid].astype(np.float64))
+    groups_indices = np.concatenate(groups_indices)
+    sums = np.bincount(groups_indices, weights=np.concatenate(groups_values), minlength=np.prod(shape))
+    counts = np.bincount(groups_indices, minlength=np.prod(shape)).reshape(shape)
+    means = np.ma.array(sums.reshape(shape) / np.maximum(counts, 1), mask=counts == 0, fill_value=out_fill_value)
+    return [means, np.sum(counts > 0, axis=1)]
+
+
 # Functional version
 def depth_calc(in_file=None, in_variable_standard_name=None, verbose=True):
     # if __name__ == '__main__':
@@ -118,48 +158,24 @@ def depth_calc(in_file=None, in_variable_standard_name=None, verbose=True):
                        if 'time' in in_data.variables[variable].dimensions]
     check_variables = [variable for variable in check_variables if variable not in ['lon', 'lat', 'depth', 'time']]
     
-    good_data_depth_levels = True
-    double_break = False
+    # Assign every depth sample to its rounded depth level once and compute levels means of all variables
+    depth_bins = depth_levels_bins(in_depth_data, unique_rounded_depths)
+    in_variables_data = []
     for variable_name in check_variables:
-        if double_break:
-            break
         in_variable = in_data.variables[variable_name]
-        work_variable_data = in_variable[...]
-        if not np.ma.is_masked(work_variable_data):
-            work_variable_data = np.ma.array(work_variable_data,
-                                             mask=np.zeros(shape=work_variable_data.shape, dtype=bool),
-                                             fill_value=out_fill_value, dtype=float)
-        for depth in unique_rounded_depths:
-            indices = np.abs(in_depth_data - depth) <= \
-                      np.max([np.abs(depth) * depth_average_threshold, depth_minimum_space]) * \
-                      (1 + threshold_tolerance)
-            if np.any(indices):
-                temp_variable = np.ma.masked_all(shape=work_variable_data.shape, dtype=in_variable.datatype)
-                temp_variable = np.ma.where(indices, work_variable_data, temp_variable)
-                mean_variable = np.ma.mean(temp_variable, axis=1)
-                work_variable_data = np.ma.where(indices, out_fill_value, work_variable_data)
-                if len(in_depth_data.shape) > 1:
-                    work_variable_data[indices] = out_fill_value
-                    try:
-                        work_variable_data.mask[indices] = True
-                    except TypeError:
-                        pass
-                else:
-                    work_variable_data[:, indices] = out_fill_value
-                    try:
-                        work_variable_data.mask[:, indices] = True
-                    except TypeError:
-                        pass
-                not_filled_data_number = mean_variable.shape[0] - np.ma.count_masked(mean_variable)
-                if not_filled_data_number < mean_variable.shape[0] * filled_data_threshold:
-                    good_data_depth_levels = False
-                    double_break = True
-                    break
-            else:
-                good_data_depth_levels = False
-                double_break = True
-                break
-                    
+        try:
+            in_variables_data.append(in_variable[:, :, 0, 0])
+        except ValueError:
+            in_variables_data.append(in_variable[...])
+    filled_records_numbers = depth_levels_means(in_variables_data, depth_bins, unique_rounded_depths.shape[0])[1]
+    if in_variables_data:
+        records_number = in_variables_data[0].shape[0]
+    else:
+        records_number = in_data.dimensions['time'].size
+
+    # Every variable needs filled data on every depth level
+    good_data_depth_levels = bool(np.all(filled_records_numbers >= records_number * filled_data_threshold))
+
     if verbose:
         print(' Good data depth levels switch = ' + str(good_data_depth_levels))
 
@@ -173,42 +189,20 @@ def depth_calc(in_file=None, in_variable_standard_name=None, verbose=True):
     if verbose:
         print(' Depth is positive switch = ' + str(depth_is_positive))
 
+    # Variable with the most data quantity on each depth level (first one on ties)
     not_filled_data_numbers = np.zeros(shape=unique_rounded_depths.shape[0])
     not_filled_data_names = [''] * unique_rounded_depths.shape[0]
-    for variable_name in check_variables:
-        in_variable = in_data.variables[variable_name]
-        try:
-            work_variable_data = in_variable[:, :, 0, 0]
-        except ValueError:
-            work_variable_data = in_variable[...]
-        if not np.ma.is_masked(work_variable_data):
-            work_variable_data = np.ma.array(work_variable_data,
-                                             mask=np.zeros(shape=work_variable_data.shape, dtype=bool),
-                                             fill_value=out_fill_value, dtype=float)
-        for depth in range(unique_rounded_depths.shape[0]):
-            indices = np.abs(in_depth_data - unique_rounded_depths[depth]) <= \
-                      np.max([np.abs(unique_rounded_depths[depth]) * depth_average_threshold, depth_minimum_space]) * \
-                      (1 + threshold_tolerance)
-            if np.any(indices):
-                temp_variable = np.ma.masked_all(shape=work_variable_data.shape, dtype=in_variable.datatype)
-                temp_variable = np.ma.where(indices, work_variable_data, temp_variable)
-                mean_variable = np.ma.mean(temp_variable, axis=1)
-                if len(in_depth_data.shape) > 1:
-                    work_variable_data[indices] = out_fill_value
-                    work_variable_data.mask[indices] = True
-                else:
-                    work_variable_data[:, indices] = out_fill_value
-                    work_variable_data.mask[:, indices] = True
-                if not_filled_data_numbers[depth] < mean_variable.shape[0] - np.ma.count_masked(mean_variable):
-                    not_filled_data_numbers[depth] = mean_variable.shape[0] - np.ma.count_masked(mean_variable)
-                    not_filled_data_names[depth] = variable_name
+    if filled_records_numbers.shape[0] > 0:
+        not_filled_data_numbers[...] = np.max(filled_records_numbers, axis=0)
+        not_filled_data_names = [check_variables[variable] if not_filled_data_numbers[depth] > 0 else ''
+                                 for depth, variable in enumerate(np.argmax(filled_records_numbers, axis=0))]
     if verbose:
         print(' -------------------------')
         print(' Data information:')
     for depth in range(unique_rounded_depths.shape[0]):
         if verbose:
             print(' ' + str(unique_rounded_depths[depth]) + ' meters: ' + str(int(not_filled_data_numbers[depth])) +
-                  ', ' + str(int(not_filled_data_numbers[depth] * 100 / mean_variable.shape[0])) +
+                  ', ' + str(int(not_filled_data_numbers[depth] * 100 / records_number)) +
                   '% of good data (variable with the most data quantity is '
                   + not_filled_data_names[depth] + ').')
     if verbose:
@@ -223,7 +217,7 @@ def depth_calc(in_file=None, in_variable_standard_name=None, verbose=True):
         good_depth_data = np.empty(shape=0, dtype=in_depth.dtype)
         for depth in range(unique_rounded_depths.shape[0]):
             depth_value = unique_rounded_depths[depth]
-            if not_filled_data_numbers[depth] >= mean_variable.shape[0] * filled_data_threshold:
+            if not_filled_data_numbers[depth] >= records_number * filled_data_threshold:
                 good_depth_data = np.ma.append(good_depth_data, depth_value)
             else:
                 continue
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import sys
+import os
+import numpy as np
+import pandas as pd
+import netCDF4
+import time
+import calendar
+
+# Global variables
+sleep_time = 0.1  # seconds
+
+# Global attributes stored in catalog (None if not present in the dataset)
+catalog_attributes = ['platform_code', 'institution', 'institution_edmo_code', 'institution_references',
+                      'platform_name', 'wmo_platform_code', 'references', 'source']
+catalog_columns = catalog_attributes + ['standard_names', 'long_names',
+                                        'longitude_mean', 'longitude_variance',
+                                        'latitude_mean', 'latitude_variance',
+                                        'start_time', 'end_time']
+
+
+def string_to_bool(string):
+    if string == 'True':
+        return True
+    elif string == 'False':
+        return False
+
+
+def masked_to_nan(value):
+    if np.ma.is_masked(value):
+        return np.nan
+    return value
+
+
+def header_catalog_row(in_file):
+    in_data = netCDF4.Dataset(in_file, mode='r')
+    catalog_row = dict()
+    for attribute_name in catalog_attributes:
+        try:
+            catalog_row[attribute_name] = in_data.getncattr(attribute_name)
+        except AttributeError:
+            catalog_row[attribute_name] = None
+    standard_names = list()
+    long_names = list()
+    in_longitude_name = None
+    in_latitude_name = None
+    in_time_name = None
+    for variable in in_data.variables.keys():
+        try:
+            variable_standard_name = in_data.variables[variable].standard_name
+        except AttributeError:
+            continue
+        try:
+            variable_long_name = in_data.variables[variable].long_name
+        except AttributeError:
+            variable_long_name = ''
+        standard_names.append(variable_standard_name)
+        long_names.append(variable_long_name)
+        if (variable_standard_name == 'longitude') and (in_longitude_name is None):
+            in_longitude_name = variable
+        if (variable_standard_name == 'latitude') and (in_latitude_name is None):
+            in_latitude_name = variable
+        if (variable_standard_name == 'time') and (in_time_name is None):
+            in_time_name = variable
+    catalog_row['standard_names'] = standard_names
+    catalog_row['long_names'] = long_names
+
+    # Same rounding of mean_variance_nc_variable to keep the values comparable
+    for coordinate_name, in_coordinate_name in zip(['longitude', 'latitude'], [in_longitude_name, in_latitude_name]):
+        if in_coordinate_name is None:
+            catalog_row[coordinate_name + '_mean'] = np.nan
+            catalog_row[coordinate_name + '_variance'] = np.nan
+            continue
+        in_coordinate_data = in_data.variables[in_coordinate_name][...]
+        catalog_row[coordinate_name + '_mean'] = masked_to_nan(np.around(np.mean(in_coordinate_data), decimals=3))
+        catalog_row[coordinate_name + '_variance'] = masked_to_nan(np.around(np.var(in_coordinate_data), decimals=3))
+
+    catalog_row['start_time'] = np.nan
+    catalog_row['end_time'] = np.nan
+    if in_time_name is not None:
+        in_time = in_data.variables[in_time_name]
+        in_time_reference = in_time.units
+        in_time_data = None
+        if 'days' in in_time_reference:
+            in_time_data = np.round(in_time[...] * 86400.)
+        elif 'seconds' in in_time_reference:
+            in_time_data = np.round(in_time[...])
+        if in_time_data is not None:
+            in_time_reference = in_time_reference[in_time_reference.find('since ') + len('since '):]
+            try:
+                in_reference_data = abs(calendar.timegm(time.strptime(in_time_reference, '%Y-%m-%dT%H:%M:%SZ')))
+            except ValueError:
+                in_reference_data = abs(calendar.timegm(time.strptime(in_time_reference, '%Y-%m-%d %H:%M:%S')))
+            in_time_data = in_time_data - in_reference_data
+            catalog_row['start_time'] = masked_to_nan(np.min(in_time_data))
+            catalog_row['end_time'] = masked_to_nan(np.max(in_time_data))
+
+    in_data.close()
+    return catalog_row
+
+
+# Functional version
+def insitu_tac_headers_catalog(in_list=None, verbose=True):
+    # if __name__ == '__main__':
+    #     return
+    if verbose:
+        print('-------------------------' + ' ' + __file__ + ' -------------------------')
+        print(' Local time is ' + time.strftime("%a %b %d %H:%M:%S %Z %Y", time.gmtime()))
+        print(' -------------------------')
+        print(' CMEMS IN SITU TAC datasets headers catalog.')
+        print(' -------------------------')
+    if in_list is None:
+        time.sleep(sleep_time)
+        print(' ERROR: 1 of 2 maximum arguments (1 optional) not provided.', file=sys.stderr)
+        print(' 1) Input datasets list;', file=sys.stderr)
+        print(' 2) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
+        time.sleep(sleep_time)
+        return
+    try:
+        in_list = in_list.split(' ')
+    except AttributeError:
+        pass
+    file_list = [element for element in in_list if element.endswith('.nc')]
+    if not file_list:
+        file_list = [in_list[0] + '/' + in_file for in_file in os.listdir(in_list[0]) if in_file.endswith('.nc')]
+        if not file_list:
+            time.sleep(sleep_time)
+            print(' Error. No processable files in input directory.', file=sys.stderr)
+            time.sleep(sleep_time)
+            print(' -------------------------')
+            return
+    if verbose:
+        print(' Input datasets number = ' + str(len(file_list)))
+        print(' verbosity switch = ' + str(verbose))
+        print(' -------------------------')
+        print(' Starting process...')
+        print(' -------------------------')
+
+    # Every header is read only once: values are stored as objects to keep original attribute and numeric types
+    catalog_rows = list()
+    for in_file in file_list:
+        if verbose:
+            print(' Reading header of ' + os.path.basename(in_file))
+        catalog_rows.append(header_catalog_row(in_file))
+    headers_catalog = pd.DataFrame(catalog_rows, index=file_list, columns=catalog_columns, dtype=object)
+
+    if verbose:
+        print(' -------------------------')
+        print(' Catalogued datasets: ' + str(headers_catalog.shape[0]))
+        print(' -------------------------')
+
+    return headers_catalog
+
+
+# Stand alone version
+if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
+    # Load input arguments
+    try:
+        in_list = sys.argv[1]
+    except (IndexError, ValueError):
+        in_list = None
+
+    try:
+        verbose = string_to_bool(sys.argv[2])
+    except (IndexError, ValueError):
+        verbose = True
+
+    headers_catalog = insitu_tac_headers_catalog(in_list, verbose)
+    if headers_catalog is not None:
+        print(headers_catalog.to_string())
@@ -2,10 +2,10 @@
 import sys
 import os
 import numpy as np
-import netCDF4
 import time
 import calendar
 import unidecode
+from SOURCE.obs_postpro import insitu_tac_headers_catalog
 
 # Global variables
 sleep_time = 0.1  # seconds
@@ -45,6 +45,21 @@ def string_intersection(string_1, string_2):
     return out_string
 
 
+def grid_cell(longitude, latitude):
+    return int(np.floor(longitude / mean_duplicate_threshold)), int(np.floor(latitude / mean_duplicate_threshold))
+
+
+def platforms_grid_index(headers_catalog):
+    # Uniform grid of mean_duplicate_threshold sized cells: co-located datasets can only lie in neighbouring cells
+    grid_index = dict()
+    for file_position, (in_longitude_mean, in_latitude_mean) in \
+            enumerate(zip(headers_catalog['longitude_mean'], headers_catalog['latitude_mean'])):
+        if np.isnan(in_longitude_mean) or np.isnan(in_latitude_mean):
+            continue
+        grid_index.setdefault(grid_cell(in_longitude_mean, in_latitude_mean), list()).append(file_position)
+    return grid_index
+
+
 def string_to_bool(string):
     if string == 'True':
         return True
@@ -55,7 +70,8 @@ def string_to_bool(string):
 # Functional version
 def insitu_tac_platforms_finder(in_list=None, longitude_mean=None, latitude_mean=None,
                                 in_fields_standard_name_str=None,
-                                first_date_str=None, last_date_str=None, verbose=True):
+                                first_date_str=None, last_date_str=None, headers_catalog=None, grid_index=None,
+                                analyzed_set=None, verbose=True):
     # if __name__ == '__main__':
     #     return
     if verbose:
@@ -66,7 +82,7 @@ def insitu_tac_platforms_finder(in_list=None, longitude_mean=None, latitude_mean
         print(' -------------------------')
     if in_list is None or longitude_mean is None or latitude_mean is None:
         time.sleep(sleep_time)
-        print(' ERROR: 3 of 7 maximum arguments (4 optionals) not provided.', file=sys.stderr)
+        print(' ERROR: 3 of 10 maximum arguments (7 optionals) not provided.', file=sys.stderr)
         print(' 1) Input datasets list;', file=sys.stderr)
         print(' 2) average longitude for surrounding search;', file=sys.stderr)
         print(' 3) average latitude for surrounding search;', file=sys.stderr)
@@ -76,22 +92,33 @@ def insitu_tac_platforms_finder(in_list=None, longitude_mean=None, latitude_mean
               ' (default: first recorded date for each device);', file=sys.stderr)
         print(' 6) (optional) Last date to evaluate in YYYYMMDD or YYYY-MM-DD HH:MM:SS format'
               ' (default: last recorded date for each device);', file=sys.stderr)
-        print(' 7) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
+        print(' 7) (optional) Input datasets headers catalog (default: computed from input datasets list);',
+              file=sys.stderr)
+        print(' 8) (optional) Input datasets headers catalog spatial grid index'
+              ' (default: computed from headers catalog);', file=sys.stderr)
+        print(' 9) (optional) Already analyzed datasets set to exclude from search (default: None);',
+              file=sys.stderr)
+        print(' 10) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
         time.sleep(sleep_time)
         return
     try:
         in_list = in_list.split(' ')
     except AttributeError:
         pass
-    file_list = [element for element in in_list if element.endswith('.nc')]
-    if not file_list:
-        file_list = [in_list[0] + '/' + in_file for in_file in os.listdir(in_list[0]) if in_file.endswith('.nc')]
+    if headers_catalog is not None:
+        # Input datasets list already resolved in the headers catalog
+        file_list = in_list
+    else:
+        file_list = [element for element in in_list if element.endswith('.nc')]
         if not file_list:
-            time.sleep(sleep_time)
-            print(' Error. No processable files in input directory.', file=sys.stderr)
-            time.sleep(sleep_time)
-            print(' -------------------------')
-            return
+            file_list = [in_list[0] + '/' + in_file for in_file in os.listdir(in_list[0])
+                         if in_file.endswith('.nc')]
+            if not file_list:
+                time.sleep(sleep_time)
+                print(' Error. No processable files in input directory.', file=sys.stderr)
+                time.sleep(sleep_time)
+                print(' -------------------------')
+                return
     if verbose:
         print(' Input list = ' + ', '.join(file_list))
         print(' average longitude = ' + str(longitude_mean))
@@ -141,79 +168,63 @@ def insitu_tac_platforms_finder(in_list=None, longitude_mean=None, latitude_mean
     found_list = list()
     if verbose:
         print(' Searching all surroundings datasets matching this platform_code...')
+    if headers_catalog is None:
+        headers_catalog = insitu_tac_headers_catalog.insitu_tac_headers_catalog(file_list, verbose=False)
+    if grid_index is None:
+        grid_index = platforms_grid_index(headers_catalog)
+
+    # Only datasets in the 3x3 cells around the searched position can satisfy the horizontal condition
+    if analyzed_set is None:
+        analyzed_set = set()
+    [longitude_cell, latitude_cell] = grid_cell(longitude_mean, latitude_mean)
+    candidate_positions = list()
+    for longitude_shift in [-1, 0, 1]:
+        for latitude_shift in [-1, 0, 1]:
+            candidate_positions += \
+                grid_index.get((longitude_cell + longitude_shift, latitude_cell + latitude_shift), list())
+    candidate_list = [headers_catalog.index[file_position] for file_position in sorted(candidate_positions)]
+    candidate_list = [in_file for in_file in candidate_list if in_file not in analyzed_set]
+
     first_file = True
     out_platform_code = ''
-    for in_file in file_list:
-        in_data = netCDF4.Dataset(in_file, mode='r')
-        in_platform_code = in_data.platform_code
-        try:
-            in_probe_name = unidecode.unidecode(in_data.platform_name.replace(',', ''))
-        except AttributeError:
+    for in_file in candidate_list:
+        in_header = headers_catalog.loc[in_file]
+        in_platform_code = in_header['platform_code']
+        if in_header['platform_name'] is not None:
+            in_probe_name = unidecode.unidecode(in_header['platform_name'].replace(',', ''))
+        else:
             in_probe_name = ''
-        try:
-            in_probe_wmo = in_data.wmo_platform_code
-        except AttributeError:
+        in_probe_wmo = in_header['wmo_platform_code']
+        if (in_probe_wmo is None) or (in_probe_wmo == ' '):
             in_probe_wmo = ''
-        if in_probe_wmo == ' ':
-            in_probe_wmo = ''
-        try:
-            in_probe_type = in_data.source
-        except AttributeError:
-            in_probe_type = ''
-        if (in_probe_type == '') or (in_probe_type == ' '):
+        in_probe_type = in_header['source']
+        if (in_probe_type is None) or (in_probe_type == '') or (in_probe_type == ' '):
             in_probe_type = 'undefined'
-        try:
-            in_probe_organization = unidecode.unidecode(in_data.institution.replace(',', ''))
-        except AttributeError:
+        if in_header['institution'] is not None:
+            in_probe_organization = unidecode.unidecode(in_header['institution'].replace(',', ''))
+        else:
             in_probe_organization = ''
         if in_probe_organization == ' ':
             in_probe_organization = ''
-        try:
-            in_probe_link = in_data.references
-        except AttributeError:
+        in_probe_link = in_header['references']
+        if (in_probe_link is None) or (in_probe_link == ' '):
             in_probe_link = ''
-        if in_probe_link == ' ':
-            in_probe_link = ''
-        in_data_standard_names = list()
-        for variable in in_data.variables.keys():
-            try:
-                variable_standard_name = in_data.variables[variable].standard_name
-                in_data_standard_names.append(variable_standard_name)
-            except AttributeError:
-                continue
-            if variable_standard_name == 'longitude':
-                in_longitude_name = variable
-            if variable_standard_name == 'latitude':
-                in_latitude_name = variable
-            if variable_standard_name == 'time':
-                in_time_name = variable
-        in_time_reference = in_data.variables[in_time_name].units
-        if 'days' in in_time_reference:
-            in_time_data = np.round(in_data.variables[in_time_name][...] * 86400.)
-        elif 'seconds' in in_time_reference:
-            in_time_data = np.round(in_data.variables[in_time_name][...])
-
-        in_longitude_mean = np.around(np.mean(in_data.variables[in_longitude_name][...]), decimals=3)
-        in_longitude_variance = np.around(np.var(in_data.variables[in_longitude_name][...]), decimals=3)
-        in_latitude_mean = np.around(np.mean(in_data.variables[in_latitude_name][...]), decimals=3)
-        in_latitude_variance = np.around(np.var(in_data.variables[in_latitude_name][...]), decimals=3)
-
-        in_data.close()
+        in_data_standard_names = in_header['standard_names']
+
+        in_longitude_mean = in_header['longitude_mean']
+        in_longitude_variance = in_header['longitude_variance']
+        in_latitude_mean = in_header['latitude_mean']
+        in_latitude_variance = in_header['latitude_variance']
+
         list_intersection =\
             [standard_name for standard_name in in_fields_standard_name_list if standard_name in in_data_standard_names]
         if not list_intersection:
             continue
-        in_time_reference = in_time_reference[in_time_reference.find('since ') + len('since '):]
-        try:
-            in_reference_data = abs(calendar.timegm(time.strptime(in_time_reference, '%Y-%m-%dT%H:%M:%SZ')))
-        except ValueError:
-            in_reference_data = abs(calendar.timegm(time.strptime(in_time_reference, '%Y-%m-%d %H:%M:%S')))
-        in_time_data += - in_reference_data
 
-        start_time = np.min(in_time_data)
+        start_time = in_header['start_time']
         if not first_file:
             previous_end_time = end_time
-        end_time = np.max(in_time_data)
+        end_time = in_header['end_time']
 
         if first_date_str is not None:
             if end_time < first_date_seconds:
@@ -334,4 +345,4 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
         verbose = True
 
     insitu_tac_platforms_finder(in_list, longitude_mean, latitude_mean,
-                                in_fields_standard_name_str, first_date_str, last_date_str, verbose)
+                                in_fields_standard_name_str, first_date_str, last_date_str, verbose=verbose)
@@ -22,9 +22,33 @@ def string_to_bool(string):
         return False
 
 
+def time_variable_read(in_time, time_valid_min=None):
+    # Time variable masked as netCDF4 does, with valid_min attribute replaced by time_valid_min if provided
+    if time_valid_min is None:
+        return in_time[...]
+    in_time.set_auto_mask(False)
+    in_time_data = in_time[...]
+    in_time.set_auto_mask(True)
+    invalid_mask = in_time_data < time_valid_min
+    try:
+        invalid_mask |= in_time_data > in_time.valid_max
+    except AttributeError:
+        pass
+    try:
+        invalid_mask |= in_time_data == in_time._FillValue
+    except AttributeError:
+        invalid_mask |= in_time_data == netCDF4.default_fillvals[in_time.dtype.str[1:]]
+    try:
+        invalid_mask |= in_time_data == in_time.missing_value
+    except AttributeError:
+        pass
+    return np.ma.array(in_time_data, mask=invalid_mask)
+
+
 # Functional version
 def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None, out_file=None,
-                                    first_date_str=None, last_date_str=None, verbose=True):
+                                    first_date_str=None, last_date_str=None, time_valid_min=None, in_memory=None,
+                                    verbose=True):
     if __name__ == '__main__':
         return
     if verbose:
@@ -33,7 +57,7 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
         print(' -------------------------')
     if in_file is None or in_variable_standard_name is None or out_file is None:
         time.sleep(sleep_time)
-        print(' Error: 3 of 6 maximum arguments (3 optionals) not provided.', file=sys.stderr)
+        print(' Error: 3 of 7 maximum arguments (4 optionals) not provided.', file=sys.stderr)
         print(' 1) input file;', file=sys.stderr)
         print(' 2) input variable standard_name;', file=sys.stderr)
         print(' 3) output file;', file=sys.stderr)
@@ -41,7 +65,9 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
               ' (default: first recorded data);', file=sys.stderr)
         print(' 5) (optional) last cut date in YYYYMMDD or YYYY-MM-DD HH:MM:SS format'
               '  default: last recorded data).', file=sys.stderr)
-        print(' 6) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
+        print(' 6) (optional) time valid_min attribute replacement (default: None, attribute of input file);',
+              file=sys.stderr)
+        print(' 7) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
         time.sleep(sleep_time)
         return
     if verbose:
@@ -52,6 +78,7 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
               ' (if None it will be the first available date)')
         print(' Last date to process = ' + str(last_date_str) +
               ' (if None it will be the last available date)')
+        print(' Time valid_min replacement = ' + str(time_valid_min))
         print(' Verbosity switch = ' + str(verbose))
 
         print(' Starting process...')
@@ -72,8 +99,8 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
     if verbose:
         print(' Opening input dataset.')
 
-    # Open input dataset
-    in_data = netCDF4.Dataset(in_file, mode='r')
+    # Open input dataset (from its netCDF contents if already loaded in memory)
+    in_data = netCDF4.Dataset(in_file, mode='r', memory=in_memory)
 
     # Loading record coordinate
     record_dimension = None
@@ -106,25 +133,38 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
             return
     in_time_reference = in_time.units
     if 'days' in in_time_reference:
-        in_time_data = np.round(in_time[...] * 86400.)
+        in_time_data = np.round(time_variable_read(in_time, time_valid_min) * 86400.)
     elif 'seconds' in in_time_reference:
-        in_time_data = np.round(in_time[...])
+        in_time_data = np.round(time_variable_read(in_time, time_valid_min))
     in_time_reference = in_time_reference[in_time_reference.find('since ') + len('since '):]
     in_reference_data = abs(calendar.timegm(time.strptime(in_time_reference, '%Y-%m-%dT%H:%M:%SZ')))
     in_time_data += - in_reference_data
 
+    # Records window: on sorted time coordinates the selected period is a contiguous records range found by binary
+    # search, so only its hyperslab is read from all the record variables (whole file otherwise)
+    first_record = 0
+    last_record = in_time_data.shape[0]
+    if ((first_date_str is not None) or (last_date_str is not None)) and (not np.ma.is_masked(in_time_data)) and \
+            np.all(np.diff(in_time_data) >= 0):
+        if first_date_str is not None:
+            first_record = np.searchsorted(in_time_data, first_date_seconds, side='left')
+        if last_date_str is not None:
+            last_record = np.searchsorted(in_time_data, last_date_seconds, side='right')
+    record_window = slice(first_record, max(first_record, last_record))
+    in_time_data = in_time_data[record_window]
+
     try:
         in_time_qc = in_data.variables['TIME_QC']
-        in_time_qc_data = in_time_qc[...]
+        in_time_qc_data = in_time_qc[record_window]
         if np.ma.is_masked(in_time_qc_data):
             in_time_qc_data = in_time_qc_data.data
         time_qc_mask = in_time_qc_data[...] <= 2
     except KeyError:
-        time_qc_mask = np.ones(in_time.shape, dtype=bool)
+        time_qc_mask = np.ones(in_time_data.shape, dtype=bool)
 
     try:
         in_position_qc = in_data.variables['POSITION_QC']
-        if len(in_position_qc[...]) != len(in_time_data):
+        if in_position_qc.shape[0] != in_time.shape[0]:
             if len(in_position_qc[...]) == 1:
                 in_position_qc_data = np.ones(shape=in_time_data.shape) * in_position_qc[0]
             else:
@@ -134,13 +174,13 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
                 print(' -------------------------')
                 return
         else:
-            in_position_qc_data = in_position_qc[...]
+            in_position_qc_data = in_position_qc[record_window]
         if np.ma.is_masked(in_position_qc_data):
             in_position_qc_data = in_position_qc_data.data
         in_position_qc_data = np.where(in_position_qc_data == 7, 2, in_position_qc_data)
         position_qc_mask = in_position_qc_data[...] <= 2
     except KeyError:
-        position_qc_mask = np.ones(in_time.shape, dtype=bool)
+        position_qc_mask = np.ones(in_time_data.shape, dtype=bool)
 
     try:
         depth_dimension_name = 'DEPTH'
@@ -176,11 +216,10 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
     in_time_data = in_time_data[out_time_indices]
 
     # Retrieve variables that will be copied in output dataset
-    in_longitude_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', 'longitude',
-                                                                       verbose=False)
+    in_longitude_variable_name = find_variable_name.dataset_variable_name(in_data, 'standard_name', 'longitude')
     in_longitude = in_data.variables[in_longitude_variable_name]
     try:
-        in_longitude_data = in_longitude[good_time_mask]
+        in_longitude_data = in_longitude[record_window][good_time_mask]
     except IndexError:
         if len(in_longitude[...]) == 1:
             in_longitude_data = np.ones(shape=good_time_mask.shape) * in_longitude[0]
@@ -191,11 +230,10 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
             print(' -------------------------')
             return
     in_longitude_data = in_longitude_data[out_time_indices]
-    in_latitude_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', 'latitude',
-                                                                      verbose=False)
+    in_latitude_variable_name = find_variable_name.dataset_variable_name(in_data, 'standard_name', 'latitude')
     in_latitude = in_data.variables[in_latitude_variable_name]
     try:
-        in_latitude_data = in_latitude[good_time_mask]
+        in_latitude_data = in_latitude[record_window][good_time_mask]
     except IndexError:
         if len(in_latitude[...]) == 1:
             in_latitude_data = np.ones(shape=good_time_mask.shape) * in_latitude[0]
@@ -209,9 +247,9 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
 
     in_depth = False
     try:
-        in_depth_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', 'depth', verbose=False)
+        in_depth_variable_name = find_variable_name.dataset_variable_name(in_data, 'standard_name', 'depth')
         in_depth = in_data.variables[in_depth_variable_name]
-        in_depth_data = in_depth[good_time_mask]
+        in_depth_data = in_depth[record_window][good_time_mask]
         in_depth_data = in_depth_data[out_time_indices]
     except KeyError:
         pass
@@ -226,7 +264,7 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
 
         try:
             in_depth_qc = in_data.variables['DEPH_QC']
-            in_depth_qc_data = in_depth_qc[good_time_mask]
+            in_depth_qc_data = in_depth_qc[record_window][good_time_mask]
             in_depth_qc_data = in_depth_qc_data[out_time_indices]
             if np.ma.is_masked(in_depth_qc_data):
                 in_depth_qc_data = in_depth_qc_data.data
@@ -240,10 +278,9 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
 
     in_pres = False
     try:
-        in_pres_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', 'sea_water_pressure',
-                                                                      verbose=False)
+        in_pres_variable_name = find_variable_name.dataset_variable_name(in_data, 'standard_name', 'sea_water_pressure')
         in_pres = in_data.variables[in_pres_variable_name]
-        in_pres_data = in_pres[good_time_mask]
+        in_pres_data = in_pres[record_window][good_time_mask]
         in_pres_data = in_pres_data[out_time_indices]
     except KeyError:
         pass
@@ -257,7 +294,7 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
                                        fill_value=out_fill_value, dtype=np.float32)
         try:
             in_pres_qc = in_data.variables['PRES_QC']
-            in_pres_qc_data = in_pres_qc[good_time_mask]
+            in_pres_qc_data = in_pres_qc[record_window][good_time_mask]
             in_pres_qc_data = in_pres_qc_data[out_time_indices]
             if np.ma.is_masked(in_pres_qc_data):
                 in_pres_qc_data = in_pres_qc_data.data
@@ -271,8 +308,7 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
     else:
         in_pres_qc = False
 
-    in_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', in_variable_standard_name,
-                                                             verbose=False)
+    in_variable_name = find_variable_name.dataset_variable_name(in_data, 'standard_name', in_variable_standard_name)
 
     if in_variable_name == 'PRRD':
         time.sleep(sleep_time)
@@ -286,17 +322,18 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
     # Unset netCDF4-python valid_range mask
     in_variable.set_auto_mask(False)
     in_variable.set_auto_scale(False)
+    in_variable_window_data = in_variable[record_window][good_time_mask]
     try:
         in_variable_fill_value = in_variable._FillValue
         try:
             in_variable_scale_factor = in_variable.scale_factor
-            in_variable_data = np.ma.array(in_variable[good_time_mask] * in_variable_scale_factor,
-                                           mask=np.isclose(in_variable[good_time_mask], in_variable_fill_value))
+            in_variable_data = np.ma.array(in_variable_window_data * in_variable_scale_factor,
+                                           mask=np.isclose(in_variable_window_data, in_variable_fill_value))
         except AttributeError:
-            in_variable_data = np.ma.array(in_variable[good_time_mask], mask=np.isclose(in_variable[good_time_mask],
-                                                                                        in_variable_fill_value))
+            in_variable_data = np.ma.array(in_variable_window_data, mask=np.isclose(in_variable_window_data,
+                                                                                    in_variable_fill_value))
     except (AttributeError, TypeError):
-        in_variable_data = in_variable[good_time_mask]
+        in_variable_data = in_variable_window_data
     in_variable_data = in_variable_data[out_time_indices]
     if np.ma.is_masked(in_variable_data):
         in_variable_data = np.ma.array(np.where(in_variable_data.data == in_variable_data.fill_value, out_fill_value,
@@ -321,7 +358,7 @@ def insitu_tac_timeseries_extractor(in_file=None, in_variable_standard_name=None
 
     try:
         in_variable_qc = in_data.variables[in_variable_name + '_QC']
-        in_variable_qc_data = in_variable_qc[good_time_mask]
+        in_variable_qc_data = in_variable_qc[record_window][good_time_mask]
         in_variable_qc_data = in_variable_qc_data[out_time_indices]
         if np.ma.is_masked(in_variable_qc_data):
             in_variable_qc_data = np.ma.array(np.where(in_variable_qc_data.data == in_variable_qc_data.fill_value,
@@ -569,9 +606,14 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
             last_date_str = None
 
     try:
-        verbose = string_to_bool(sys.argv[6])
+        time_valid_min = float(sys.argv[6])
+    except (IndexError, ValueError):
+        time_valid_min = None
+
+    try:
+        verbose = string_to_bool(sys.argv[7])
     except (IndexError, ValueError):
         verbose = True
 
     insitu_tac_timeseries_extractor(in_file, in_variable_standard_name, out_file,
-                                    first_date_str, last_date_str, verbose)
+                                    first_date_str, last_date_str, time_valid_min, None, verbose)
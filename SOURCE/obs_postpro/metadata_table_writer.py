@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+# Global variables
+sync_rows_interval = 100  # rows written between two forced disk synchronizations
+sync_time_interval = 60  # seconds between two forced disk synchronizations
+
+
+def metadata_line_format(out_line):
+    # Same quoting and delimiters of np.savetxt(..., fmt='"%s"', delimiter=',', comments='')
+    return ','.join(['"%s"' % value for value in out_line]) + '\n'
+
+
+def metadata_table_sync(out_table):
+    out_table['stream'].flush()
+    os.fsync(out_table['stream'].fileno())
+    out_table['unsynced_rows'] = 0
+    out_table['sync_time'] = time.time()
+
+
+def metadata_table_open(out_file, header_line):
+    # Tables are appended row by row: every row is flushed to the operating system as soon as it is written
+    # (as the old per-row rewrite did) and the file is periodically synchronized to disk
+    out_table = dict()
+    out_table['file_name'] = out_file
+    out_table['stream'] = open(out_file, 'w', encoding='latin1')
+    out_table['stream'].write(metadata_line_format(header_line))
+    metadata_table_sync(out_table)
+    return out_table
+
+
+def metadata_table_append(out_table, out_line):
+    out_table['stream'].write(metadata_line_format(out_line))
+    out_table['stream'].flush()
+    out_table['unsynced_rows'] += 1
+    if (out_table['unsynced_rows'] >= sync_rows_interval) or \
+            (time.time() - out_table['sync_time'] >= sync_time_interval):
+        metadata_table_sync(out_table)
+
+
+def metadata_table_close(out_table):
+    if out_table['stream'].closed:
+        return
+    metadata_table_sync(out_table)
+    out_table['stream'].close()
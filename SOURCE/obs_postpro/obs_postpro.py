@@ -3,42 +3,22 @@ import sys
 import os
 import shlex
 import shutil
+import concurrent.futures
 import numpy as np
 import pandas as pd
 import netCDF4
 import time
 import calendar
 from SOURCE.obs_postpro import time_averager, time_series_post_processing, \
-    quality_check_applier, depth_aggregator, depth_calc
-from SOURCE import duplicated_records_remover, records_monotonicity_fixer, time_check, time_calc
+    quality_check_applier, depth_aggregator, depth_calc, metadata_table_writer, region_mask_calc
+from SOURCE import duplicated_records_remover, records_monotonicity_fixer, time_check, time_calc, dataset_memory
 
 # Global variables
 sleep_time = 0.1  # seconds
 time_step_tolerance = 10  # percent, to accept datasets input sampling slightly greater than selected output sampling
-
-# Biscay Gulf limits
-biscay_gulf_min_lon = -9.25
-biscay_gulf_max_lon = -1.15
-biscay_gulf_min_lat = 43.28
-biscay_gulf_max_lat = 46
-
-# Marmara Sea Limits
-marmara_sea_min_lon = 26.83
-marmara_sea_max_lon = 29.94
-marmara_sea_min_lat = 40.3
-marmara_sea_max_lat = 41.08
-
-# Black Sea Limits
-black_sea_min_lon = 27.32
-black_sea_max_lon = 41.96
-black_sea_min_lat = 40.91
-black_sea_max_lat = 46.8
-
-# Azov Sea Limits
-azov_sea_min_lon = 34.81
-azov_sea_max_lon = 39.3
-azov_sea_min_lat = 45.28
-azov_sea_max_lat = 47.28
+record_folders = ['hm', 'dm', 'dm_shift', 'mm', 'ym']
+debug_checkpoints = False  # to also write the intermediate datasets chained in memory in the work directory
+time_average_chunk_records = 1000000  # input records read at once when computing time averages
 
 # Global range check
 global_range_check_enabled = True
@@ -55,9 +35,421 @@ def string_to_bool(string):
         return False
 
 
+def quality_checked_last_time(quality_checked_file, in_file, in_memory=None):
+    # Last record time (seconds) of an existing quality checked product,
+    # None if empty or if its depth levels are not the input ones
+    quality_checked_data = netCDF4.Dataset(quality_checked_file, mode='r')
+    in_data = netCDF4.Dataset(in_file, mode='r', memory=in_memory)
+    quality_checked_depth_data = quality_checked_data.variables['depth'][...]
+    in_depth_data = in_data.variables['depth'][...]
+    last_time = None
+    if (quality_checked_data.dimensions['time'].size > 0) and \
+            (quality_checked_depth_data.shape == in_depth_data.shape) and \
+            np.ma.allclose(quality_checked_depth_data, in_depth_data):
+        last_time = float(quality_checked_data.variables['time'][-1])
+    in_data.close()
+    quality_checked_data.close()
+    return last_time
+
+
+def quality_checked_records_append(quality_checked_file, new_quality_checked_file, out_file):
+    # Existing quality checked product with the new records after its last one appended, written in out_file.
+    # Returns the number of appended records
+    shutil.copy2(quality_checked_file, out_file)
+    out_data = netCDF4.Dataset(out_file, mode='a')
+    new_data = netCDF4.Dataset(new_quality_checked_file, mode='r')
+    records_number = out_data.dimensions['time'].size
+    first_new_record = int(np.searchsorted(new_data.variables['time'][...], out_data.variables['time'][-1],
+                                           side='right'))
+    appended_records_number = new_data.dimensions['time'].size - first_new_record
+    if appended_records_number > 0:
+        for variable_name in out_data.variables.keys():
+            out_variable = out_data.variables[variable_name]
+            if 'time' not in out_variable.dimensions:
+                continue
+            new_variable = new_data.variables[variable_name]
+            # Valid range widened before writing (values outside it would be masked when read)
+            if ('valid_min' in out_variable.ncattrs()) and ('valid_min' in new_variable.ncattrs()):
+                out_variable.valid_min = np.minimum(out_variable.valid_min, new_variable.valid_min)
+                out_variable.valid_max = np.maximum(out_variable.valid_max, new_variable.valid_max)
+            out_variable[records_number:, ...] = new_variable[first_new_record:, ...]
+        out_data.history = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()) + \
+            ' : Appended ' + str(appended_records_number) + ' incremental update quality checked records\n' + \
+            out_data.history
+    new_data.close()
+    out_data.close()
+    return appended_records_number
+
+
+def probe_variable_processing(in_dir, work_dir, out_dir, climatology_dir, update_mode, incremental_update,
+                              routine_qc_iterations, first_date_str, last_date_str, out_file_name,
+                              variable_standard_name, probe_depth, probe_record_start, probe_record_end,
+                              probe_sampling_time, field_notes_str, print_prefix, verbose):
+    # Depth aggregation, time fixes and routine quality checks of a probe variable (one job for parallel workers).
+    # In incremental update only the records after the last one of the existing output quality checked product
+    # are checked and then appended to it.
+    # Returns record start, record end, sampling time, depth levels and rejection statistics,
+    # None if the variable is skipped or False if the processing must stop
+    out_stat_variable = None
+    in_field_dir = in_dir + '/' + variable_standard_name + '/'
+    out_field_file_name = out_file_name + '_' + variable_standard_name
+    file_list = [in_field_dir + '/' + file for file in os.listdir(in_field_dir)
+                 if file.startswith(out_field_file_name)]
+    if not file_list:
+        time.sleep(sleep_time)
+        print(' Warning:' + print_prefix + ' pre processed file for variable ' + variable_standard_name +
+              ' not found in input directory. Skipping...', file=sys.stderr)
+        time.sleep(sleep_time)
+        print(print_prefix + ' -------------------------')
+        return
+    in_file = file_list[0]
+    if probe_depth == 'floating':
+        is_floating_probe = True
+    else:
+        is_floating_probe = False
+        [depth_information_array, out_depth_levels] = depth_calc.depth_calc(in_file, variable_standard_name,
+                                                                            verbose=False)
+        if len(out_depth_levels) == 0:
+            time.sleep(sleep_time)
+            print(' Warning:' + print_prefix + ' no valid depth levels for variable ' + variable_standard_name +
+                  '. Skipping...', file=sys.stderr)
+            time.sleep(sleep_time)
+            print(print_prefix + ' -------------------------')
+            return
+        probe_depth = ' '.join(list(map(str, out_depth_levels)))
+        print(print_prefix + ' Output depths for this variable: ' + probe_depth + ' meters.')
+    in_data = netCDF4.Dataset(in_file, mode='r')
+    depth_dimension_length = len(in_data.dimensions['depth'])
+    print(print_prefix + ' input file depth levels: ' + str(depth_dimension_length))
+    in_record_dimension = in_data.dimensions['time'].size
+    try:
+        out_history = in_data.history
+    except AttributeError:
+        out_history = ''
+    in_data.close()
+    print(print_prefix + ' record coordinate size: ' + str(in_record_dimension) + ' records.')
+    work_field_dir = work_dir + '/' + variable_standard_name + '/'
+    if not os.path.exists(work_field_dir):
+        print(print_prefix + ' Creating work ' + variable_standard_name + ' data folder.')
+        os.makedirs(work_field_dir, exist_ok=True)
+
+    # Intermediate datasets are chained in memory (netCDF contents), only raw and quality checked files are written
+    depth_aggregated_file = work_field_dir + out_field_file_name + '_depth-aggregated.nc'
+    if not is_floating_probe:
+        out_depth_cell_methods = ''
+        if update_mode:
+            out_depth_cell_methods = 'depth: rescaled on predefined depth levels'
+        elif ('rescaled depth' not in field_notes_str) and \
+                ('rounded depth levels' not in field_notes_str):
+            out_depth_cell_methods = 'time: mean and rearrange'
+        if ('rescaled depth' in field_notes_str) or ('rounded depth levels' in field_notes_str):
+            if out_depth_cell_methods == '':
+                out_depth_cell_methods = 'depth: rescaled'
+            else:
+                out_depth_cell_methods += ' depth: rescaled'
+
+        if ('rescaled depth' in field_notes_str) or \
+                ('rounded depth levels' in field_notes_str):
+            out_history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) \
+                          + ' : Computed depth dimension average\n' + out_history
+
+        if update_mode:
+            out_history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
+                ' : Computed depth dimension average on predefined depth levels\n' + out_history
+        else:
+            out_history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
+                ' : Created depth time constant dimension variable\n' + out_history
+        depth_aggregated_memory = \
+            depth_aggregator.depth_aggregator(in_file, probe_depth, depth_aggregated_file,
+                                              first_date_str, last_date_str, out_depth_cell_methods or None,
+                                              out_history, out_memory=True, verbose=verbose)
+        if depth_aggregated_memory is None:
+            time.sleep(sleep_time)
+            print(' Warning:' + print_prefix + ' depth aggregated file not produced.', file=sys.stderr)
+            time.sleep(sleep_time)
+            print(print_prefix + ' -------------------------')
+            return
+    else:
+        depth_aggregated_memory = dataset_memory.dataset_contents(in_file)
+    if debug_checkpoints:
+        dataset_memory.dataset_contents_write(depth_aggregated_file, depth_aggregated_memory)
+
+    print(print_prefix + ' checking time step.')
+    time_step_check = time_check.time_check(depth_aggregated_file, depth_aggregated_memory, verbose=False)
+    if time_step_check == 0:
+        print(print_prefix +
+              ' Time monotonically increases without duplicates'
+              ' between one time step and another.')
+    elif time_step_check == 1:
+        time.sleep(sleep_time)
+        print(' Warning:' + print_prefix +
+              ' duplicated time records for field ' + variable_standard_name + '.', file=sys.stderr)
+        time.sleep(sleep_time)
+    elif time_step_check == 2:
+        time.sleep(sleep_time)
+        print(' Warning:' + print_prefix +
+              ' wrong positioning records for field ' + variable_standard_name + '.', file=sys.stderr)
+        time.sleep(sleep_time)
+    elif time_step_check == 3:
+        time.sleep(sleep_time)
+        print(' Warning:' + print_prefix +
+              ' duplicated entries and wrong positioning records for field '
+              + variable_standard_name + '.', file=sys.stderr)
+        time.sleep(sleep_time)
+    no_duplicates_file = work_field_dir + out_field_file_name + '_no-duplicates.nc'
+    if (time_step_check == 1) or (time_step_check == 3):
+        print(print_prefix + ' removing time step duplicates.')
+        no_duplicates_memory = \
+            duplicated_records_remover.duplicated_records_remover(depth_aggregated_file, no_duplicates_file,
+                                                                  depth_aggregated_memory, out_memory=True,
+                                                                  verbose=verbose)
+    else:
+        no_duplicates_memory = depth_aggregated_memory
+    if no_duplicates_memory is None:
+        time.sleep(sleep_time)
+        print(' Warning:' + print_prefix + ' no duplicates file not produced.', file=sys.stderr)
+        time.sleep(sleep_time)
+        print(print_prefix + ' -------------------------')
+        return
+    if debug_checkpoints:
+        dataset_memory.dataset_contents_write(no_duplicates_file, no_duplicates_memory)
+    in_situ_raw_file = work_field_dir + out_field_file_name + '_raw.nc'
+    if (time_step_check == 2) or (time_step_check == 3):
+        print(print_prefix + ' fixing time step monotonicity.')
+        in_situ_raw_memory = \
+            records_monotonicity_fixer.records_monotonicity_fixer(no_duplicates_file, in_situ_raw_file,
+                                                                  no_duplicates_memory, out_memory=True,
+                                                                  verbose=verbose)
+    else:
+        in_situ_raw_memory = no_duplicates_memory
+    if in_situ_raw_memory is None:
+        time.sleep(sleep_time)
+        print(' Warning:' + print_prefix + ' in situ raw file not produced.', file=sys.stderr)
+        time.sleep(sleep_time)
+        print(print_prefix + ' -------------------------')
+        return
+    dataset_memory.dataset_contents_write(in_situ_raw_file, in_situ_raw_memory)
+
+    if routine_qc_iterations >= 0:
+        quality_checked_file = work_field_dir + out_field_file_name + '_quality-checked.nc'
+        if update_mode:
+            if not os.path.exists(climatology_dir):
+                time.sleep(sleep_time)
+                print(' Error. platform climatology directory not found.', file=sys.stderr)
+                time.sleep(sleep_time)
+                print(' -------------------------')
+                return False
+        else:
+            climatology_dir = out_dir + '/climatology/'
+            if not os.path.exists(climatology_dir):
+                print(' Creating platform climatology directory.')
+                print(' -------------------------')
+                os.makedirs(climatology_dir, exist_ok=True)
+        climatology_field_dir = climatology_dir + '/' + variable_standard_name + '/'
+        if not os.path.exists(climatology_field_dir) and not update_mode:
+            print(print_prefix + ' Creating climatology ' + variable_standard_name + ' data folder.')
+            os.makedirs(climatology_field_dir, exist_ok=True)
+        climatology_file = climatology_field_dir + '/' + out_field_file_name + '_climatology.nc'
+        if update_mode and not os.path.isfile(climatology_file):
+            time.sleep(sleep_time)
+            print(' Warning:' + print_prefix + ' Climatology file not present in climatology directory.',
+                  file=sys.stderr)
+            time.sleep(sleep_time)
+            print(print_prefix + ' -------------------------')
+            return
+        last_processed_time = None
+        out_quality_checked_file = out_dir + '/quality-checked/' + variable_standard_name + '/' + \
+            out_field_file_name + '_quality-checked.nc'
+        if incremental_update and os.path.isfile(out_quality_checked_file):
+            last_processed_time = quality_checked_last_time(out_quality_checked_file, in_situ_raw_file,
+                                                            in_situ_raw_memory)
+            if last_processed_time is None:
+                time.sleep(sleep_time)
+                print(' Warning:' + print_prefix + ' quality checked product not compatible with the incremental'
+                      ' update. Processing all the records...', file=sys.stderr)
+                time.sleep(sleep_time)
+            else:
+                print(print_prefix + ' Incremental update after ' +
+                      time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(last_processed_time)) + '.')
+        post_processed_file = work_field_dir + out_field_file_name + '_post-processed.nc'
+        print(print_prefix + ' Producing post processed field file for analysis...')
+        post_processing_results = \
+            time_series_post_processing.time_series_post_processing(in_situ_raw_file,
+                                                                    variable_standard_name,
+                                                                    update_mode,
+                                                                    routine_qc_iterations,
+                                                                    climatology_file,
+                                                                    post_processed_file,
+                                                                    in_situ_raw_memory,
+                                                                    out_memory=True,
+                                                                    last_processed_time=last_processed_time,
+                                                                    verbose=verbose)
+        if not post_processing_results or not post_processing_results[0]:
+            time.sleep(sleep_time)
+            print(' Warning:' + print_prefix + ' post processed file not produced.', file=sys.stderr)
+            time.sleep(sleep_time)
+            print(print_prefix + ' -------------------------')
+            return
+        [out_stat_variable, post_processed_memory] = post_processing_results
+        if debug_checkpoints:
+            dataset_memory.dataset_contents_write(post_processed_file, post_processed_memory)
+        if last_processed_time is not None:
+            new_quality_checked_file = work_field_dir + out_field_file_name + '_quality-checked-increment.nc'
+        else:
+            new_quality_checked_file = quality_checked_file
+        quality_check_applier.quality_check_applier(post_processed_file, variable_standard_name, "1",
+                                                    new_quality_checked_file, routine_qc_iterations,
+                                                    post_processed_memory, verbose=verbose)
+        if (last_processed_time is not None) and os.path.isfile(new_quality_checked_file):
+            appended_records_number = quality_checked_records_append(out_quality_checked_file,
+                                                                     new_quality_checked_file, quality_checked_file)
+            print(print_prefix + ' Appended ' + str(appended_records_number) + ' quality checked records.')
+            if not debug_checkpoints:
+                os.remove(new_quality_checked_file)
+        if not os.path.isfile(quality_checked_file):
+            time.sleep(sleep_time)
+            print(' Warning:' + print_prefix + ' quality checked file not produced for field '
+                  + variable_standard_name + '.', file=sys.stderr)
+            time.sleep(sleep_time)
+            print(print_prefix + ' -------------------------')
+            return
+
+        quality_checked_data = netCDF4.Dataset(quality_checked_file, mode='r')
+        quality_checked_time_data = quality_checked_data.variables['time'][...]
+        quality_checked_data.close()
+        start_date_seconds = np.min(quality_checked_time_data)
+        probe_record_start = str(time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start_date_seconds)))
+        end_date_seconds = np.max(quality_checked_time_data)
+        probe_record_end = str(time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(end_date_seconds)))
+        probe_sampling_time_seconds = time_calc.time_calc(quality_checked_file, verbose=False)
+        probe_sampling_time_days = probe_sampling_time_seconds // 86400
+        probe_sampling_time_modulus = probe_sampling_time_seconds - probe_sampling_time_days * 86400
+        probe_sampling_time_hours = time.strftime('%H:%M:%S', time.gmtime(probe_sampling_time_modulus))
+        if probe_sampling_time_days < 9:
+            probe_sampling_time = '00' + str(probe_sampling_time_days) + ' ' + probe_sampling_time_hours
+        elif probe_sampling_time_days < 99:
+            probe_sampling_time = '0' + str(probe_sampling_time_days) + ' ' + probe_sampling_time_hours
+        elif probe_sampling_time_days < 999:
+            probe_sampling_time = str(probe_sampling_time_days) + ' ' + probe_sampling_time_hours
+
+    return [probe_record_start, probe_record_end, probe_sampling_time, probe_depth, out_stat_variable]
+
+
+def probe_variable_averaging(work_dir, out_dir, out_file_name, variable_standard_name, routine_qc_iterations,
+                             print_prefix, verbose):
+    # Output copies and time averages of a processed probe variable (one job for parallel workers)
+    work_field_dir = work_dir + '/' + variable_standard_name + '/'
+    out_field_file_name = out_file_name + '_' + variable_standard_name
+    in_situ_raw_file = work_field_dir + out_field_file_name + '_raw.nc'
+    if not os.path.isfile(in_situ_raw_file):
+        in_situ_raw_file = work_field_dir + out_field_file_name + '_derived.nc'
+        if not os.path.isfile(in_situ_raw_file):
+            return
+    out_raw_dir = out_dir + '/raw/'
+    if not os.path.exists(out_raw_dir):
+        print(' Creating raw data folder.')
+        os.makedirs(out_raw_dir, exist_ok=True)
+    out_raw_field_dir = out_raw_dir + variable_standard_name + '/'
+    if not os.path.exists(out_raw_field_dir):
+        print(' Creating ' + variable_standard_name + ' raw data folder.')
+        os.makedirs(out_raw_field_dir, exist_ok=True)
+    out_raw_file = out_raw_field_dir + out_field_file_name + '_raw.nc'
+    print(print_prefix + ' copying raw file to output directory.')
+    shutil.copy2(in_situ_raw_file, out_raw_file)
+    if routine_qc_iterations >= 0:
+        quality_checked_file = work_field_dir + out_field_file_name + '_quality-checked.nc'
+        if not os.path.isfile(quality_checked_file):
+            quality_checked_file = work_field_dir + out_field_file_name + '_derived.nc'
+            if not os.path.isfile(quality_checked_file):
+                return
+        out_quality_checked_dir = out_dir + '/quality-checked/'
+        if not os.path.exists(out_quality_checked_dir):
+            print(' Creating quality checked data folder.')
+            os.makedirs(out_quality_checked_dir, exist_ok=True)
+        out_quality_checked_field_dir = out_quality_checked_dir + variable_standard_name + '/'
+        if not os.path.exists(out_quality_checked_field_dir):
+            print(' Creating ' + variable_standard_name + ' quality checked data folder.')
+            os.makedirs(out_quality_checked_field_dir, exist_ok=True)
+        out_quality_checked_file = out_quality_checked_field_dir + out_field_file_name + '_quality-checked.nc'
+        print(print_prefix + ' copying file to output directory.')
+        shutil.copy2(quality_checked_file, out_quality_checked_file)
+        to_average_file = quality_checked_file
+    else:
+        to_average_file = in_situ_raw_file
+    to_average_sampling_time_seconds = time_calc.time_calc(to_average_file, verbose=False)
+    under_one_hour = True
+    under_one_day = True
+    under_one_month = True
+    under_one_year = True
+    if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600:
+        under_one_hour = False
+    if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600 * 24:
+        under_one_day = False
+    if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600 * 24 * 31:
+        under_one_month = False
+    if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600 * 24 * 365:
+        under_one_year = False
+    # Averaged record types, half time step shifted ones apart: the others are computed in one pass
+    averaged_record_types = [[], []]
+    for record_type in record_folders:
+        if (record_type == 'hm') and not under_one_hour:
+            continue
+        if ((record_type == 'dm') or (record_type == 'dm_shift')) and not under_one_day:
+            continue
+        if (record_type == 'mm') and not under_one_month:
+            continue
+        if (record_type == 'ym') and not under_one_year:
+            continue
+        out_record_dir = out_dir + '/' + record_type + '/'
+        if not os.path.exists(out_record_dir):
+            print(' Creating ' + record_type + ' data folder.')
+            os.makedirs(out_record_dir, exist_ok=True)
+        out_field_dir = out_record_dir + variable_standard_name + '/'
+        if not os.path.exists(out_field_dir):
+            print(' Creating ' + variable_standard_name + ' ' + record_type + ' data folder.')
+            os.makedirs(out_field_dir, exist_ok=True)
+        if record_type == 'dm_shift':
+            averaged_record_types[1].append(record_type)
+        else:
+            averaged_record_types[0].append(record_type)
+    for half_time_step_shift, record_types in zip([False, True], averaged_record_types):
+        if len(record_types) == 0:
+            continue
+        out_record_time_strings = []
+        for record_type in record_types:
+            if record_type == 'hm':
+                out_record_time_strings.append('01:00:00')
+            elif (record_type == 'dm') or (record_type == 'dm_shift'):
+                out_record_time_strings.append('24:00:00')
+            elif record_type == 'mm':
+                out_record_time_strings.append('01')
+            elif record_type == 'ym':
+                out_record_time_strings.append('12')
+        averaged_files = [work_field_dir + out_field_file_name + '_' + record_type + '.nc'
+                          for record_type in record_types]
+        print(print_prefix + ' computing weighted ' + ' '.join(record_types) + ' time average.')
+        time_averager.time_averager(to_average_file, ' '.join(out_record_time_strings),
+                                    ' '.join(averaged_files), variable_standard_name,
+                                    half_time_step_shift=half_time_step_shift,
+                                    chunk_records_number=time_average_chunk_records, verbose=verbose)
+        for record_type, averaged_file in zip(record_types, averaged_files):
+            out_averaged_file = out_dir + '/' + record_type + '/' + variable_standard_name + '/' + \
+                out_field_file_name + '_' + record_type + '.nc'
+            if os.path.isfile(averaged_file):
+                print(print_prefix + ' copying ' + record_type + ' file to output directory.')
+                shutil.copy2(averaged_file, out_averaged_file)
+            else:
+                time.sleep(sleep_time)
+                print(' Warning:' + print_prefix + ' ' + record_type + ' mean files not produced for field '
+                      + variable_standard_name + '.', file=sys.stderr)
+                time.sleep(sleep_time)
+                print(print_prefix + ' -------------------------')
+
+
 def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None, work_dir=None, out_dir=None,
                 routine_qc_iterations=None, climatology_dir=None, first_date_str=None, last_date_str=None,
-                region_boundaries_str=None, med_sea_masking=False, in_instrument_types_str=None, verbose=True):
+                region_boundaries_str=None, med_sea_masking=False, in_instrument_types_str=None, workers=1,
+                incremental_mode=False, verbose=True):
     """
     Script to post process in situ devices datasets
     from an already downloaded database with optional real time execution CSV table needed.
@@ -107,7 +499,12 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
             the attribute string, PLEASE put attributes with spaces with quotes to protect them
             from character escaping);
 
-        13) verbosity switch (OPTIONAL).
+        13) Number of parallel probe variables processing workers (OPTIONAL);
+
+        14) Incremental update switch (OPTIONAL, update mode only): only the records after the last one of the
+            existing output quality checked products are checked and appended to them;
+
+        15) verbosity switch (OPTIONAL).
 
     Output:
 
@@ -183,7 +580,7 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
     if in_csv_dir is None or in_dir is None or in_fields_standard_name_str is None or work_dir is None or\
             out_dir is None or routine_qc_iterations is None:
         time.sleep(sleep_time)
-        print(' ERROR: 6 of 13 maximum arguments (7 optionals) not provided.', file=sys.stderr)
+        print(' ERROR: 6 of 15 maximum arguments (9 optionals) not provided.', file=sys.stderr)
         print(' 1) Pre processed in situ information CSV directory;', file=sys.stderr)
         print(' 2) Pre processed observations netCDF database directory;', file=sys.stderr)
         print(' 3) Input fields standard_name space separated string to process'
@@ -206,43 +603,31 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
               ' (default: False).', file=sys.stderr)
         print(' 12) (optional) Input "instrument type" metadata filter (space separated string, '
               ' for example: \'"mooring" "coastal structure"\');', file=sys.stderr)
-        print(' 13) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
+        print(' 13) (optional) Number of parallel probe variables processing workers (default: 1);',
+              file=sys.stderr)
+        print(' 14) (optional) Incremental update switch (True or False), update mode only (default: False);',
+              file=sys.stderr)
+        print(' 15) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
         time.sleep(sleep_time)
         return
 
     if (region_boundaries_str is None) or (region_boundaries_str == 'None') or (region_boundaries_str == ''):
         region_boundaries_str = '-180 180 -90 90'
 
-    # Box boundaries to process devices
-    west_boundary = np.float32(region_boundaries_str.split(' ')[0])
-    east_boundary = np.float32(region_boundaries_str.split(' ')[1])
-    south_boundary = np.float32(region_boundaries_str.split(' ')[2])
-    north_boundary = np.float32(region_boundaries_str.split(' ')[3])
-
-    # Biscay Gulf masking condition (mask only if there is no connection between the Atlantic Ocean and the Biscay Gulf)
-    biscay_gulf_masking = False
-    if (west_boundary > biscay_gulf_min_lon) and (west_boundary < biscay_gulf_max_lon) and \
-            (east_boundary > biscay_gulf_min_lon) and \
-            (south_boundary < biscay_gulf_max_lat) and (north_boundary > biscay_gulf_min_lat) and med_sea_masking:
-        biscay_gulf_masking = True
-
-    # Marmara Sea Masking condition
-    marmara_sea_masking = False
-    if (west_boundary < marmara_sea_max_lon) and (east_boundary > marmara_sea_min_lon) and \
-            (south_boundary < marmara_sea_max_lat) and (north_boundary > marmara_sea_min_lat) and med_sea_masking:
-        marmara_sea_masking = True
-
-    # Black Sea Masking condition
-    black_sea_masking = False
-    if (west_boundary < black_sea_max_lon) and (east_boundary > black_sea_min_lon) and\
-            (south_boundary < black_sea_max_lat) and (north_boundary > marmara_sea_min_lat) and med_sea_masking:
-        black_sea_masking = True
-
-    # Azov Sea Masking condition
-    azov_sea_masking = False
-    if (west_boundary < azov_sea_max_lon) and (east_boundary > azov_sea_min_lon) and\
-            (south_boundary < azov_sea_max_lat) and (north_boundary > azov_sea_min_lat) and med_sea_masking:
-        azov_sea_masking = True
+    if (workers is None) or (workers == 'None') or (workers == ''):
+        workers = 1
+    try:
+        workers = int(workers)
+    except ValueError:
+        time.sleep(sleep_time)
+        print(' Error. Wrong workers number.', file=sys.stderr)
+        time.sleep(sleep_time)
+        print(' -------------------------')
+        return
+
+    # Box boundaries to process devices and foreign seas to mask
+    region_boundaries = region_mask_calc.region_boundaries_parse(region_boundaries_str)
+    region_basins = region_mask_calc.masked_basins(region_boundaries, med_sea_masking)
 
     print(' Pre processed in situ information CSV directory = ' + in_csv_dir)
     print(' Pre processed directory = ' + in_dir)
@@ -261,13 +646,13 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
     print(' Masking foreign seas switch for Med Sea processing switch = ' + str(med_sea_masking))
     print(' Input "instrument / type" metadata filter string = ' + str(in_instrument_types_str) +
           ' (if None all instruments will be processed)')
+    print(' Probe variables processing workers = ' + str(workers))
+    print(' Incremental update switch = ' + str(incremental_mode))
     print(' verbosity switch = ' + str(verbose))
     print(' -------------------------')
     print(' Starting process...')
     print(' -------------------------')
 
-    record_folders = ['hm', 'dm', 'dm_shift', 'mm', 'ym']
-
     print(' Loading devices information CSV file...')
     try:
         in_devices_data = open(in_csv_dir + '/devices.csv', 'rb')
@@ -359,6 +744,12 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
                 continue
     probes_longitudes = [longitudes.split(';') for longitudes in in_probes_data[:, 7]]
     probes_latitudes = [latitudes.split(';') for latitudes in in_probes_data[:, 8]]
+    # Region and foreign seas masks of all the probes variables positions are computed at once
+    probes_in_area = region_mask_calc.region_mask(
+        region_mask_calc.positions_parse([longitude for longitudes in probes_longitudes for longitude in longitudes]),
+        region_mask_calc.positions_parse([latitude for latitudes in probes_latitudes for latitude in latitudes]),
+        region_boundaries, region_basins)
+    probes_in_area = np.split(probes_in_area, np.cumsum([len(longitudes) for longitudes in probes_longitudes])[:-1])
     probes_record_starts = [record_starts.split(';') for record_starts in in_probes_data[:, 9]]
     probes_record_ends = [record_ends.split(';') for record_ends in in_probes_data[:, 10]]
     probes_sampling_times = [sampling_times.split(';') for sampling_times in in_probes_data[:, 11]]
@@ -428,47 +819,49 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
         print(' -------------------------')
 
     out_devices_file = out_dir + '/devices.csv'
-    out_devices_data = np.empty(shape=(1, 2), dtype=object)
-    out_devices_data[0, :] = ['id', 'name']
     print(' Writing output devices CSV file header...')
-    np.savetxt(out_devices_file, out_devices_data, fmt='"%s"', delimiter=',', comments='')
+    out_devices_table = metadata_table_writer.metadata_table_open(out_devices_file, ['id', 'name'])
+    out_devices_ids = dict()
 
     out_organizations_file = out_dir + '/organizations.csv'
-    out_organizations_data = np.empty(shape=(1, 4), dtype=object)
-    out_organizations_data[0, :] = ['id', 'name', 'country', 'link']
     print(' Writing output organizations CSV file header...')
-    np.savetxt(out_organizations_file, out_organizations_data, fmt='"%s"', delimiter=',', comments='')
+    out_organizations_table = \
+        metadata_table_writer.metadata_table_open(out_organizations_file, ['id', 'name', 'country', 'link'])
+    out_organizations_ids = dict()
 
     out_variables_file = out_dir + '/variables.csv'
-    out_variables_data = np.empty(shape=(1, 4), dtype=object)
-    out_variables_data[0, :] = ['id', 'standard_name', 'long_name', 'units']
     print(' Writing output variables CSV file header...')
-    np.savetxt(out_variables_file, out_variables_data, fmt='"%s"', delimiter=',', comments='')
+    out_variables_table = \
+        metadata_table_writer.metadata_table_open(out_variables_file, ['id', 'standard_name', 'long_name', 'units'])
+    out_variable_ids = set()
 
     out_probes_file = out_dir + '/probes.csv'
-    out_probes_data = np.empty(shape=(1, 16), dtype=object)
-    out_probes_data[0, :] = ['id', 'platform_code', 'name', 'wmo', 'device_id', 'organization_id', 'variable_ids',
-                             'longitudes', 'latitudes', 'record_starts', 'record_ends',
-                             'sampling_times', 'depths', 'quality_controls', 'notes', 'link']
     print(' Writing output probes CSV file header...')
-    np.savetxt(out_probes_file, out_probes_data, fmt='"%s"', delimiter=',', comments='')
+    out_probes_table = \
+        metadata_table_writer.metadata_table_open(out_probes_file,
+                                                  ['id', 'platform_code', 'name', 'wmo', 'device_id',
+                                                   'organization_id', 'variable_ids',
+                                                   'longitudes', 'latitudes', 'record_starts', 'record_ends',
+                                                   'sampling_times', 'depths', 'quality_controls', 'notes', 'link'])
+    out_probes_platform_codes = set()
+    out_tables = [out_devices_table, out_organizations_table, out_variables_table, out_probes_table]
 
     if routine_qc_iterations >= 0:
         out_rejection_file = out_dir + '/rejection_process.csv'
-        out_rejection_data = np.array([['platform_code', 'standard_names', 'data_total', 'filled_data']], dtype=object)
+        out_rejection_header = ['platform_code', 'standard_names', 'data_total', 'filled_data']
         if global_range_check_enabled:
-            out_rejection_data = np.append(out_rejection_data, np.array([['global_range_check_rejection']]), axis=1)
+            out_rejection_header.append('global_range_check_rejection')
         if spike_test_enabled:
-            out_rejection_data = np.append(out_rejection_data, np.array([['spike_test_rejection']]), axis=1)
+            out_rejection_header.append('spike_test_rejection')
         if stuck_value_test_enabled:
-            out_rejection_data = np.append(out_rejection_data, np.array([['stuck_value_rejection']]), axis=1)
+            out_rejection_header.append('stuck_value_rejection')
         if routine_qc_iterations >= 1:
             for iteration in range(1, routine_qc_iterations + 1):
-                out_rejection_data = \
-                    np.append(out_rejection_data, np.array([['statistic_rejection_' + str(iteration)]]), axis=1)
+                out_rejection_header.append('statistic_rejection_' + str(iteration))
 
         print(' Writing output probes CSV file header...')
-        np.savetxt(out_rejection_file, out_rejection_data, fmt='"%s"', delimiter=',', comments='')
+        out_rejection_table = metadata_table_writer.metadata_table_open(out_rejection_file, out_rejection_header)
+        out_tables.append(out_rejection_table)
 
     if first_date_str is not None:
         try:
@@ -491,22 +884,12 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
             return
 
     progression_percentage_list = list()
-    device_id = 0
-    organization_id = 0
-    probe_id = 0
-    in_variable_ids = np.arange(1, len(in_fields_standard_name_list) + 1)
+    probe_tasks = list()
     for in_csv_row in range(len(probes_platform_codes)):
         platform_code = probes_platform_codes[in_csv_row]
         completion_percentage = \
             np.around(len(progression_percentage_list) / len(probes_platform_codes) * 100, decimals=1)
         progression_percentage_list.append(platform_code)
-        if platform_code in out_probes_data[:, 1]:
-            time.sleep(sleep_time)
-            print(' Warning:' + print_prefix + ' duplicated platform_code in input probes table. Skipping...',
-                  file=sys.stderr)
-            time.sleep(sleep_time)
-            print(print_prefix + ' -------------------------')
-            continue
         # if platform_code != '':
         #     continue
         print_prefix = ' (' + platform_code + ')'
@@ -556,18 +939,7 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
         probe_quality_controls = probes_quality_controls[in_csv_row]
         probe_notes = probes_notes[in_csv_row]
         out_file_name = 'insitu-data_' + platform_code
-        out_standard_names = list()
-        mean_longitudes = list()
-        mean_latitudes = list()
-        start_dates = list()
-        end_dates = list()
-        sampling_times = list()
-        valid_depth_levels = list()
-        quality_controls = list()
-        notes_array = list()
-        if routine_qc_iterations >= 0:
-            rejection_standard_names = list()
-            out_stat = dict()
+        variable_tasks = list()
         for variable_standard_name in intersection_standard_names:
             print(print_prefix + ' analyzing variable ' + variable_standard_name + '...')
             variable_index = probe_standard_names.index(variable_standard_name)
@@ -578,22 +950,7 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
             probe_latitude = probe_latitudes[variable_index]
             print(print_prefix + ' mean sensor latitude : ' + probe_latitude + ' degrees west')
             probe_record_start = probe_record_starts[variable_index]
-            out_of_area = False
-            if (not west_boundary < np.float32(probe_longitude) < east_boundary) or \
-                    (not south_boundary < np.float32(probe_latitude) < north_boundary):
-                out_of_area = True
-            if ((biscay_gulf_min_lon < np.float32(probe_longitude) < biscay_gulf_max_lon) and
-                    (biscay_gulf_min_lat < np.float32(probe_latitude) < biscay_gulf_max_lat)) and biscay_gulf_masking:
-                out_of_area = True
-            if ((marmara_sea_min_lon < np.float32(probe_longitude) < marmara_sea_max_lon) and
-                    (marmara_sea_min_lat < np.float32(probe_latitude) < marmara_sea_max_lat)) and marmara_sea_masking:
-                out_of_area = True
-            if ((black_sea_min_lon < np.float32(probe_longitude) < black_sea_max_lon) and
-                    (black_sea_min_lat < np.float32(probe_latitude) < black_sea_max_lat)) and black_sea_masking:
-                out_of_area = True
-            if ((azov_sea_min_lon < np.float32(probe_longitude) < azov_sea_max_lon) and
-                    (azov_sea_min_lat < np.float32(probe_latitude) < azov_sea_max_lat)) and azov_sea_masking:
-                out_of_area = True
+            out_of_area = not probes_in_area[in_csv_row][variable_index]
             if out_of_area:
                 time.sleep(sleep_time)
                 print(' Warning:' + print_prefix + ' in situ device location is outside the selected area.',
@@ -631,422 +988,201 @@ def obs_postpro(in_csv_dir=None, in_dir=None, in_fields_standard_name_str=None,
                 field_notes_str = probe_notes[variable_index]
             except IndexError:
                 field_notes_str = probe_notes[0]
-            in_field_dir = in_dir + '/' + variable_standard_name + '/'
-            out_field_file_name = out_file_name + '_' + variable_standard_name
-            file_list = [in_field_dir + '/' + file for file in os.listdir(in_field_dir)
-                         if file.startswith(out_field_file_name)]
-            if not file_list:
-                time.sleep(sleep_time)
-                print(' Warning:' + print_prefix + ' pre processed file for variable ' + variable_standard_name +
-                      ' not found in input directory. Skipping...', file=sys.stderr)
-                time.sleep(sleep_time)
-                print(print_prefix + ' -------------------------')
-                continue
-            in_file = file_list[0]
             probe_depth = ' '.join(probe_depths[variable_index])
-            if probe_depth == 'floating':
-                is_floating_probe = True
-            else:
-                is_floating_probe = False
-                [depth_information_array, out_depth_levels] = depth_calc.depth_calc(in_file, variable_standard_name,
-                                                                                    verbose=False)
-                if len(out_depth_levels) == 0:
-                    time.sleep(sleep_time)
-                    print(' Warning:' + print_prefix + ' no valid depth levels for variable ' + variable_standard_name +
-                          '. Skipping...', file=sys.stderr)
-                    time.sleep(sleep_time)
-                    print(print_prefix + ' -------------------------')
-                    continue
-                probe_depth = ' '.join(list(map(str, out_depth_levels)))
-                print(print_prefix + ' Output depths for this variable: ' + probe_depth + ' meters.')
-            in_data = netCDF4.Dataset(in_file, mode='r')
-            depth_dimension_length = len(in_data.dimensions['depth'])
-            print(print_prefix + ' input file depth levels: ' + str(depth_dimension_length))
-            in_record_dimension = in_data.dimensions['time'].size
-            in_data.close()
-            print(print_prefix + ' record coordinate size: ' + str(in_record_dimension) + ' records.')
-            work_field_dir = work_dir + '/' + variable_standard_name + '/'
-            if not os.path.exists(work_field_dir):
-                print(print_prefix + ' Creating work ' + variable_standard_name + ' data folder.')
-                os.makedirs(work_field_dir)
-
-            if not is_floating_probe:
-                depth_aggregated_file = work_field_dir + out_field_file_name + '_depth-aggregated.nc'
-                depth_aggregator.depth_aggregator(in_file, probe_depth, depth_aggregated_file,
-                                                  first_date_str, last_date_str, verbose=verbose)
-                if not os.path.isfile(depth_aggregated_file):
-                    time.sleep(sleep_time)
-                    print(' Warning:' + print_prefix + ' depth aggregated file not produced.', file=sys.stderr)
-                    time.sleep(sleep_time)
-                    print(print_prefix + ' -------------------------')
+            variable_arguments = [in_dir, work_dir, out_dir, climatology_dir, update_mode,
+                                  update_mode and incremental_mode, routine_qc_iterations, first_date_str,
+                                  last_date_str, out_file_name, variable_standard_name, probe_depth,
+                                  probe_record_start, probe_record_end, probe_sampling_time, field_notes_str,
+                                  print_prefix, verbose]
+            variable_tasks.append([probe_longitude, probe_latitude, field_quality_controls_str, field_notes_str,
+                                   variable_arguments])
+        probe_metadata = [probe_name, probe_wmo, probe_type, probe_organization, organization_country,
+                          organization_link]
+        probe_tasks.append([platform_code, print_prefix, run_time, out_file_name, probe_metadata, variable_tasks])
+
+    executor = None
+    variable_jobs = dict()
+    averaging_jobs = list()
+    try:
+        if workers > 1:
+            # Rows with an already submitted platform code are processed in the merging loop, only if still needed,
+            # to keep the serial skipping and overwrite order of duplicated platform codes
+            submitted_platform_codes = set()
+            for task_index in range(len(probe_tasks)):
+                if probe_tasks[task_index][0] in submitted_platform_codes:
                     continue
-                depth_aggregated_data = netCDF4.Dataset(depth_aggregated_file, mode='r+')
-                out_depth = depth_aggregated_data.variables['depth']
-                out_depth_cell_methods = ''
-                if update_mode:
-                    out_depth_cell_methods = 'depth: rescaled on predefined depth levels'
-                elif ('rescaled depth' not in field_notes_str) and \
-                        ('rounded depth levels' not in field_notes_str):
-                    out_depth_cell_methods = 'time: mean and rearrange'
-                if ('rescaled depth' in field_notes_str) or ('rounded depth levels' in field_notes_str):
-                    if out_depth_cell_methods == '':
-                        out_depth_cell_methods = 'depth: rescaled'
-                    else:
-                        out_depth_cell_methods += ' depth: rescaled'
-                if out_depth_cell_methods != '':
-                    out_depth.cell_methods = out_depth_cell_methods
-                try:
-                    out_history = depth_aggregated_data.history
-                except AttributeError:
-                    out_history = ''
-
-                if ('rescaled depth' in field_notes_str) or \
-                        ('rounded depth levels' in field_notes_str):
-                    out_history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) \
-                                  + ' : Computed depth dimension average\n' + out_history
-
-                depth_aggregated_data.history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
-                    ' : Created depth time constant dimension variable\n' + out_history
-                if update_mode:
-                    depth_aggregated_data.history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
-                        ' : Computed depth dimension average on predefined depth levels\n' + out_history
-                depth_aggregated_data.close()
-            else:
-                shutil.copy2(in_file, depth_aggregated_file)
-
-            print(print_prefix + ' checking time step.')
-            time_step_check = time_check.time_check(depth_aggregated_file, verbose=False)
-            if time_step_check == 0:
-                print(print_prefix +
-                      ' Time monotonically increases without duplicates'
-                      ' between one time step and another.')
-            elif time_step_check == 1:
-                time.sleep(sleep_time)
-                print(' Warning:' + print_prefix +
-                      ' duplicated time records for field ' + variable_standard_name + '.', file=sys.stderr)
-                time.sleep(sleep_time)
-            elif time_step_check == 2:
-                time.sleep(sleep_time)
-                print(' Warning:' + print_prefix +
-                      ' wrong positioning records for field ' + variable_standard_name + '.', file=sys.stderr)
-                time.sleep(sleep_time)
-            elif time_step_check == 3:
-                time.sleep(sleep_time)
-                print(' Warning:' + print_prefix +
-                      ' duplicated entries and wrong positioning records for field '
-                      + variable_standard_name + '.', file=sys.stderr)
-                time.sleep(sleep_time)
-            no_duplicates_file = work_field_dir + out_field_file_name + '_no-duplicates.nc'
-            if (time_step_check == 1) or (time_step_check == 3):
-                print(print_prefix + ' removing time step duplicates.')
-                duplicated_records_remover.duplicated_records_remover(depth_aggregated_file, no_duplicates_file,
-                                                                      verbose=verbose)
-            else:
-                shutil.copy2(depth_aggregated_file, no_duplicates_file)
-            if not os.path.isfile(no_duplicates_file):
-                time.sleep(sleep_time)
-                print(' Warning:' + print_prefix + ' no duplicates file not produced.', file=sys.stderr)
-                time.sleep(sleep_time)
-                print(print_prefix + ' -------------------------')
-                continue
-            in_situ_raw_file = work_field_dir + out_field_file_name + '_raw.nc'
-            if (time_step_check == 2) or (time_step_check == 3):
-                print(print_prefix + ' fixing time step monotonicity.')
-                records_monotonicity_fixer.records_monotonicity_fixer(no_duplicates_file, in_situ_raw_file,
-                                                                      verbose=verbose)
-            else:
-                shutil.copy2(no_duplicates_file, in_situ_raw_file)
-            if not os.path.isfile(in_situ_raw_file):
+                submitted_platform_codes.add(probe_tasks[task_index][0])
+                for variable_position in range(len(probe_tasks[task_index][5])):
+                    variable_jobs[task_index, variable_position] = None
+            print(' Processing ' + str(len(variable_jobs)) + ' probe variables with ' + str(workers) + ' workers.')
+            print(' -------------------------')
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            for [task_index, variable_position] in variable_jobs.keys():
+                variable_jobs[task_index, variable_position] = \
+                    executor.submit(probe_variable_processing, *probe_tasks[task_index][5][variable_position][4])
+
+        device_id = 0
+        organization_id = 0
+        probe_id = 0
+        in_variable_ids = np.arange(1, len(in_fields_standard_name_list) + 1)
+        for task_index in range(len(probe_tasks)):
+            [platform_code, print_prefix, run_time, out_file_name, probe_metadata, variable_tasks] = \
+                probe_tasks[task_index]
+            [probe_name, probe_wmo, probe_type, probe_organization, organization_country, organization_link] = \
+                probe_metadata
+            if platform_code in out_probes_platform_codes:
                 time.sleep(sleep_time)
-                print(' Warning:' + print_prefix + ' in situ raw file not produced.', file=sys.stderr)
+                print(' Warning:' + print_prefix + ' duplicated platform_code in input probes table. Skipping...',
+                      file=sys.stderr)
                 time.sleep(sleep_time)
                 print(print_prefix + ' -------------------------')
                 continue
-
+            out_standard_names = list()
+            mean_longitudes = list()
+            mean_latitudes = list()
+            start_dates = list()
+            end_dates = list()
+            sampling_times = list()
+            valid_depth_levels = list()
+            quality_controls = list()
+            notes_array = list()
             if routine_qc_iterations >= 0:
-                quality_checked_file = work_field_dir + out_field_file_name + '_quality-checked.nc'
-                if update_mode:
-                    if not os.path.exists(climatology_dir):
-                        time.sleep(sleep_time)
-                        print(' Error. platform climatology directory not found.', file=sys.stderr)
-                        time.sleep(sleep_time)
-                        print(' -------------------------')
-                        return
+                rejection_standard_names = list()
+                out_stat = dict()
+            for variable_position in range(len(variable_tasks)):
+                [probe_longitude, probe_latitude, field_quality_controls_str, field_notes_str, variable_arguments] = \
+                    variable_tasks[variable_position]
+                variable_standard_name = variable_arguments[10]
+                if (task_index, variable_position) in variable_jobs:
+                    variable_results = variable_jobs[task_index, variable_position].result()
                 else:
-                    climatology_dir = out_dir + '/climatology/'
-                    if not os.path.exists(climatology_dir):
-                        print(' Creating platform climatology directory.')
-                        print(' -------------------------')
-                        os.makedirs(climatology_dir)
-                climatology_field_dir = climatology_dir + '/' + variable_standard_name + '/'
-                if not os.path.exists(climatology_field_dir) and not update_mode:
-                    print(print_prefix + ' Creating climatology ' + variable_standard_name + ' data folder.')
-                    os.makedirs(climatology_field_dir)
-                climatology_file = climatology_field_dir + '/' + out_field_file_name + '_climatology.nc'
-                if update_mode and not os.path.isfile(climatology_file):
-                    time.sleep(sleep_time)
-                    print(' Warning:' + print_prefix + ' Climatology file not present in climatology directory.',
-                          file=sys.stderr)
-                    time.sleep(sleep_time)
-                    print(print_prefix + ' -------------------------')
-                    continue
-                post_processed_file = work_field_dir + out_field_file_name + '_post-processed.nc'
-                print(print_prefix + ' Producing post processed field file for analysis...')
-                out_stat_variable = \
-                    time_series_post_processing.time_series_post_processing(in_situ_raw_file,
-                                                                            variable_standard_name,
-                                                                            update_mode,
-                                                                            routine_qc_iterations,
-                                                                            climatology_file,
-                                                                            post_processed_file,
-                                                                            verbose=verbose)
-                if not os.path.isfile(post_processed_file) or not out_stat_variable:
-                    time.sleep(sleep_time)
-                    print(' Warning:' + print_prefix + ' post processed file not produced.', file=sys.stderr)
-                    time.sleep(sleep_time)
-                    print(print_prefix + ' -------------------------')
-                    continue
-                quality_check_applier.quality_check_applier(post_processed_file, variable_standard_name, "1",
-                                                            quality_checked_file, routine_qc_iterations,
-                                                            verbose=verbose)
-                if not os.path.isfile(quality_checked_file):
-                    time.sleep(sleep_time)
-                    print(' Warning:' + print_prefix + ' quality checked file not produced for field '
-                          + variable_standard_name + '.', file=sys.stderr)
-                    time.sleep(sleep_time)
-                    print(print_prefix + ' -------------------------')
+                    variable_results = probe_variable_processing(*variable_arguments)
+                if variable_results is False:
+                    return
+                if variable_results is None:
                     continue
-                rejection_standard_names.append(variable_standard_name)
-                if not out_stat:
-                    out_stat = out_stat_variable
-                else:
-                    for stat_column in out_stat_variable.keys():
-                        out_stat[stat_column] += ';' + out_stat_variable[stat_column]
-
-                quality_checked_data = netCDF4.Dataset(quality_checked_file, mode='r')
-                quality_checked_time_data = quality_checked_data.variables['time'][...]
-                quality_checked_data.close()
-                start_date_seconds = np.min(quality_checked_time_data)
-                probe_record_start = str(time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start_date_seconds)))
-                end_date_seconds = np.max(quality_checked_time_data)
-                probe_record_end = str(time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(end_date_seconds)))
-                probe_sampling_time_seconds = time_calc.time_calc(quality_checked_file, verbose=False)
-                probe_sampling_time_days = probe_sampling_time_seconds // 86400
-                probe_sampling_time_modulus = probe_sampling_time_seconds - probe_sampling_time_days * 86400
-                probe_sampling_time_hours = time.strftime('%H:%M:%S', time.gmtime(probe_sampling_time_modulus))
-                if probe_sampling_time_days < 9:
-                    probe_sampling_time = '00' + str(probe_sampling_time_days) + ' ' + probe_sampling_time_hours
-                elif probe_sampling_time_days < 99:
-                    probe_sampling_time = '0' + str(probe_sampling_time_days) + ' ' + probe_sampling_time_hours
-                elif probe_sampling_time_days < 999:
-                    probe_sampling_time = str(probe_sampling_time_days) + ' ' + probe_sampling_time_hours
-
-            out_standard_names.append(variable_standard_name)
-            mean_longitudes.append(probe_longitude)
-            mean_latitudes.append(probe_latitude)
-            start_dates.append(probe_record_start)
-            end_dates.append(probe_record_end)
-            sampling_times.append(probe_sampling_time)
-            valid_depth_levels.append(probe_depth)
-            quality_controls.append(field_quality_controls_str)
-            notes_array.append(field_notes_str)
-
-        if len(out_standard_names) > 0:
-            if probe_type not in out_devices_data[:, 1]:
-                device_id += 1
-                out_devices_line = np.array([[device_id, probe_type]], dtype=object)
-                out_devices_data = np.append(out_devices_data, out_devices_line, axis=0)
-                print(print_prefix + ' Writing output devices CSV file...')
-                np.savetxt(out_devices_file, out_devices_data, fmt='"%s"', delimiter=',', comments='')
-            out_device_ids = out_devices_data[:, 0]
-            out_device_types = out_devices_data[:, 1]
-            out_device_index = np.where(out_device_types == probe_type)[0][0]
-            out_device_id = out_device_ids[out_device_index]
-
-            if probe_organization not in out_organizations_data[:, 1]:
-                organization_id += 1
-                out_organizations_line = \
-                    np.array([[organization_id, probe_organization, organization_country, organization_link]],
-                             dtype=object)
-                out_organizations_data = np.append(out_organizations_data, out_organizations_line, axis=0)
-                print(print_prefix + ' Writing output organizations CSV file...')
-                np.savetxt(out_organizations_file, out_organizations_data,
-                           fmt='"%s"', delimiter=',', comments='')
-            out_organization_ids = out_organizations_data[:, 0]
-            out_organization_names = out_organizations_data[:, 1]
-            out_organization_index = np.where(out_organization_names == probe_organization)[0][0]
-            out_organization_id = out_organization_ids[out_organization_index]
-
-            probe_id += 1
-            variable_ids = []
-            for variable_standard_name in out_standard_names:
-                variable_index = in_fields_standard_name_list.index(variable_standard_name)
-                variable_ids.append(str(in_variable_ids[variable_index]))
-                out_variable_ids = out_variables_data[:, 0]
-                if in_variable_ids[variable_index] not in out_variable_ids:
-                    standard_name_index = np.where(variable_standard_names == variable_standard_name)[0][0]
-
-                    variable_long_name = variable_standard_names[standard_name_index]
-                    variable_unit = variable_units[standard_name_index]
-                    out_variables_line = np.array(
-                        [[in_variable_ids[variable_index], variable_standard_name,
-                          variable_long_name, variable_unit]], dtype=object)
-                    out_variables_data = np.append(out_variables_data, out_variables_line, axis=0)
-                    print(print_prefix + ' Writing output variables CSV file...')
-                    np.savetxt(out_variables_file, out_variables_data, fmt='"%s"', delimiter=',',
-                               comments='')
-
-            out_probes_line = \
-                np.array([[probe_id, platform_code, probe_name, probe_wmo, out_device_id, out_organization_id,
-                           ';'.join(variable_ids),
-                           ';'.join(mean_longitudes), ';'.join(mean_latitudes),
-                           ';'.join(start_dates), ';'.join(end_dates),
-                           ';'.join(sampling_times), ';'.join(valid_depth_levels),
-                           ';'.join(quality_controls), ';'.join(notes_array), organization_link]], dtype=object)
-            # out_probes_line = \
-            #     np.array([[probe_id, platform_code, out_platform_name, wmo, platform_type, organization_name,
-            #                ';'.join(out_standard_names),
-            #                ';'.join(mean_longitudes), ';'.join(mean_latitudes),
-            #                ';'.join(start_dates), ';'.join(end_dates),
-            #                ';'.join(sampling_times), ';'.join(valid_depth_levels),
-            #                ';'.join(quality_controls), ';'.join(notes_array), organization_link]], dtype=object)
-
-            out_probes_data = np.append(out_probes_data, out_probes_line, axis=0)
-            print(print_prefix + ' Writing output probes CSV file...')
-            np.savetxt(out_probes_file, out_probes_data, fmt='"%s"', delimiter=',', comments='')
+                [probe_record_start, probe_record_end, probe_sampling_time, probe_depth, out_stat_variable] = \
+                    variable_results
+                if routine_qc_iterations >= 0:
+                    rejection_standard_names.append(variable_standard_name)
+                    if not out_stat:
+                        out_stat = out_stat_variable
+                    else:
+                        for stat_column in out_stat_variable.keys():
+                            out_stat[stat_column] += ';' + out_stat_variable[stat_column]
+
+                out_standard_names.append(variable_standard_name)
+                mean_longitudes.append(probe_longitude)
+                mean_latitudes.append(probe_latitude)
+                start_dates.append(probe_record_start)
+                end_dates.append(probe_record_end)
+                sampling_times.append(probe_sampling_time)
+                valid_depth_levels.append(probe_depth)
+                quality_controls.append(field_quality_controls_str)
+                notes_array.append(field_notes_str)
+
+            if len(out_standard_names) > 0:
+                if probe_type not in out_devices_ids:
+                    device_id += 1
+                    out_devices_ids[probe_type] = device_id
+                    print(print_prefix + ' Writing output devices CSV file...')
+                    metadata_table_writer.metadata_table_append(out_devices_table, [device_id, probe_type])
+                out_device_id = out_devices_ids[probe_type]
+
+                if probe_organization not in out_organizations_ids:
+                    organization_id += 1
+                    out_organizations_ids[probe_organization] = organization_id
+                    print(print_prefix + ' Writing output organizations CSV file...')
+                    metadata_table_writer.metadata_table_append(out_organizations_table,
+                                                                [organization_id, probe_organization,
+                                                                 organization_country, organization_link])
+                out_organization_id = out_organizations_ids[probe_organization]
+
+                probe_id += 1
+                variable_ids = []
+                for variable_standard_name in out_standard_names:
+                    variable_index = in_fields_standard_name_list.index(variable_standard_name)
+                    variable_ids.append(str(in_variable_ids[variable_index]))
+                    if in_variable_ids[variable_index] not in out_variable_ids:
+                        out_variable_ids.add(in_variable_ids[variable_index])
+                        standard_name_index = np.where(variable_standard_names == variable_standard_name)[0][0]
+
+                        variable_long_name = variable_standard_names[standard_name_index]
+                        variable_unit = variable_units[standard_name_index]
+                        print(print_prefix + ' Writing output variables CSV file...')
+                        metadata_table_writer.metadata_table_append(out_variables_table,
+                                                                    [in_variable_ids[variable_index],
+                                                                     variable_standard_name,
+                                                                     variable_long_name, variable_unit])
+
+                out_probes_line = \
+                    [probe_id, platform_code, probe_name, probe_wmo, out_device_id, out_organization_id,
+                     ';'.join(variable_ids),
+                     ';'.join(mean_longitudes), ';'.join(mean_latitudes),
+                     ';'.join(start_dates), ';'.join(end_dates),
+                     ';'.join(sampling_times), ';'.join(valid_depth_levels),
+                     ';'.join(quality_controls), ';'.join(notes_array), organization_link]
+                # out_probes_line = \
+                #     np.array([[probe_id, platform_code, out_platform_name, wmo, platform_type, organization_name,
+                #                ';'.join(out_standard_names),
+                #                ';'.join(mean_longitudes), ';'.join(mean_latitudes),
+                #                ';'.join(start_dates), ';'.join(end_dates),
+                #                ';'.join(sampling_times), ';'.join(valid_depth_levels),
+                #                ';'.join(quality_controls), ';'.join(notes_array), organization_link]], dtype=object)
+
+                print(print_prefix + ' Writing output probes CSV file...')
+                metadata_table_writer.metadata_table_append(out_probes_table, out_probes_line)
+                out_probes_platform_codes.add(platform_code)
+
+                if routine_qc_iterations >= 0:
+                    out_rejection_line = \
+                        [platform_code, ';'.join(rejection_standard_names), out_stat['data_total'],
+                         out_stat['filled_data']]
+                    if global_range_check_enabled:
+                        try:
+                            out_rejection_line.append(out_stat['range_check_rejection'])
+                        except KeyError:
+                            out_stat_length = len(out_stat['data_total'].split(';'))
+                            out_stat_line = ';'.join(map(str, np.zeros(out_stat_length, dtype=int).tolist()))
+                            out_rejection_line.append(out_stat_line)
+                    if spike_test_enabled:
+                        out_rejection_line.append(out_stat['spike_test_rejection'])
+                    if stuck_value_test_enabled:
+                        out_rejection_line.append(out_stat['stuck_value_rejection'])
+                    if routine_qc_iterations >= 1:
+                        for iteration in range(1, routine_qc_iterations + 1):
+                            out_rejection_line.append(out_stat['statistic_rejection_' + str(iteration)])
+
+                    print(print_prefix + ' Writing output rejection CSV file...')
+                    metadata_table_writer.metadata_table_append(out_rejection_table, out_rejection_line)
 
-            if routine_qc_iterations >= 0:
-                out_rejection_line = \
-                    np.array([[platform_code, ';'.join(rejection_standard_names), out_stat['data_total'],
-                               out_stat['filled_data']]], dtype=object)
-                if global_range_check_enabled:
-                    try:
-                        out_rejection_line = np.append(out_rejection_line,
-                                                       np.array([[out_stat['range_check_rejection']]]), axis=1)
-                    except KeyError:
-                        out_stat_length = len(out_stat['data_total'].split(';'))
-                        out_stat_line = ';'.join(map(str, np.zeros(out_stat_length, dtype=int).tolist()))
-                        out_rejection_line = np.append(out_rejection_line, np.array([[out_stat_line]]), axis=1)
-                if spike_test_enabled:
-                    out_rejection_line = np.append(out_rejection_line,
-                                                   np.array([[out_stat['spike_test_rejection']]]), axis=1)
-                if stuck_value_test_enabled:
-                    out_rejection_line = np.append(out_rejection_line,
-                                                   np.array([[out_stat['stuck_value_rejection']]]), axis=1)
-                if routine_qc_iterations >= 1:
-                    for iteration in range(1, routine_qc_iterations + 1):
-                        out_rejection_line = np.append(out_rejection_line,
-                                                       np.array([[out_stat['statistic_rejection_' + str(iteration)]]]),
-                                                       axis=1)
-
-                out_rejection_data = np.append(out_rejection_data, out_rejection_line, axis=0)
-                print(print_prefix + ' Writing output rejection CSV file...')
-                np.savetxt(out_rejection_file, out_rejection_data, fmt='"%s"', delimiter=',', comments='')
-
-        for variable_standard_name in out_standard_names:
-            work_field_dir = work_dir + '/' + variable_standard_name + '/'
-            out_field_file_name = out_file_name + '_' + variable_standard_name
-            in_situ_raw_file = work_field_dir + out_field_file_name + '_raw.nc'
-            if not os.path.isfile(in_situ_raw_file):
-                in_situ_raw_file = work_field_dir + out_field_file_name + '_derived.nc'
-                if not os.path.isfile(in_situ_raw_file):
-                    continue
-            out_raw_dir = out_dir + '/raw/'
-            if not os.path.exists(out_raw_dir):
-                print(' Creating raw data folder.')
-                os.makedirs(out_raw_dir)
-            out_raw_field_dir = out_raw_dir + variable_standard_name + '/'
-            if not os.path.exists(out_raw_field_dir):
-                print(' Creating ' + variable_standard_name + ' raw data folder.')
-                os.makedirs(out_raw_field_dir)
-            out_raw_file = out_raw_field_dir + out_field_file_name + '_raw.nc'
-            print(print_prefix + ' copying raw file to output directory.')
-            shutil.copy2(in_situ_raw_file, out_raw_file)
-            if routine_qc_iterations >= 0:
-                quality_checked_file = work_field_dir + out_field_file_name + '_quality-checked.nc'
-                if not os.path.isfile(quality_checked_file):
-                    quality_checked_file = work_field_dir + out_field_file_name + '_derived.nc'
-                    if not os.path.isfile(quality_checked_file):
-                        continue
-                out_quality_checked_dir = out_dir + '/quality-checked/'
-                if not os.path.exists(out_quality_checked_dir):
-                    print(' Creating quality checked data folder.')
-                    os.makedirs(out_quality_checked_dir)
-                out_quality_checked_field_dir = out_quality_checked_dir + variable_standard_name + '/'
-                if not os.path.exists(out_quality_checked_field_dir):
-                    print(' Creating ' + variable_standard_name + ' quality checked data folder.')
-                    os.makedirs(out_quality_checked_field_dir)
-                out_quality_checked_file = out_quality_checked_field_dir + out_field_file_name + '_quality-checked.nc'
-                print(print_prefix + ' copying file to output directory.')
-                shutil.copy2(quality_checked_file, out_quality_checked_file)
-                to_average_file = quality_checked_file
-            else:
-                to_average_file = in_situ_raw_file
-            to_average_sampling_time_seconds = time_calc.time_calc(to_average_file, verbose=False)
-            under_one_hour = True
-            under_one_day = True
-            under_one_month = True
-            under_one_year = True
-            if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600:
-                under_one_hour = False
-            if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600 * 24:
-                under_one_day = False
-            if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600 * 24 * 31:
-                under_one_month = False
-            if to_average_sampling_time_seconds > (1 + time_step_tolerance / 100) * 3600 * 24 * 365:
-                under_one_year = False
-            for record_type in record_folders:
-                if (record_type == 'hm') and not under_one_hour:
-                    continue
-                if ((record_type == 'dm') or (record_type == 'dm_shift')) and not under_one_day:
-                    continue
-                if (record_type == 'mm') and not under_one_month:
-                    continue
-                if (record_type == 'ym') and not under_one_year:
-                    continue
-                out_record_dir = out_dir + '/' + record_type + '/'
-                if not os.path.exists(out_record_dir):
-                    print(' Creating ' + record_type + ' data folder.')
-                    os.makedirs(out_record_dir)
-                out_field_dir = out_record_dir + variable_standard_name + '/'
-                if not os.path.exists(out_field_dir):
-                    print(' Creating ' + variable_standard_name + ' ' + record_type + ' data folder.')
-                    os.makedirs(out_field_dir)
-                averaged_file = work_field_dir + out_field_file_name + '_' + record_type + '.nc'
-                out_averaged_file = out_field_dir + out_field_file_name + '_' + record_type + '.nc'
-                if record_type == 'hm':
-                    out_record_time_str = '01:00:00'
-                elif (record_type == 'dm') or (record_type == 'dm_shift'):
-                    out_record_time_str = '24:00:00'
-                elif record_type == 'mm':
-                    out_record_time_str = '01'
-                elif record_type == 'ym':
-                    out_record_time_str = '12'
-                if record_type == 'dm_shift':
-                    half_time_step_shift = True
-                else:
-                    half_time_step_shift = False
-                print(print_prefix + ' computing weighted ' + record_type + ' time average.')
-                time_averager.time_averager(to_average_file, out_record_time_str,
-                                            averaged_file, variable_standard_name,
-                                            half_time_step_shift=half_time_step_shift, verbose=verbose)
-                if os.path.isfile(averaged_file):
-                    print(print_prefix + ' copying file to output directory.')
-                    shutil.copy2(averaged_file, out_averaged_file)
+            for variable_standard_name in out_standard_names:
+                averaging_arguments = [work_dir, out_dir, out_file_name, variable_standard_name, routine_qc_iterations,
+                                       print_prefix, verbose]
+                if workers > 1:
+                    averaging_jobs.append(executor.submit(probe_variable_averaging, *averaging_arguments))
                 else:
-                    time.sleep(sleep_time)
-                    print(' Warning:' + print_prefix + ' ' + record_type + ' mean files not produced for field '
-                          + variable_standard_name + '.', file=sys.stderr)
-                    time.sleep(sleep_time)
-                    print(print_prefix + ' -------------------------')
-                    continue
+                    probe_variable_averaging(*averaging_arguments)
 
-        time_diff = time.gmtime(calendar.timegm(time.gmtime()) - run_time)
-        print(print_prefix + ' -------------------------')
-        print(print_prefix + ' input file completed. ETA is ' + time.strftime('%H:%M:%S', time_diff))
-        print(print_prefix + ' -------------------------')
+            time_diff = time.gmtime(calendar.timegm(time.gmtime()) - run_time)
+            print(print_prefix + ' -------------------------')
+            print(print_prefix + ' input file completed. ETA is ' + time.strftime('%H:%M:%S', time_diff))
+            print(print_prefix + ' -------------------------')
 
-        # break  # to post process only the first archive in the list
+            # break  # to post process only the first archive in the list
+
+        if workers > 1:
+            for averaging_job in averaging_jobs:
+                averaging_job.result()
+    finally:
+        # Pending jobs are cancelled and output tables closed also when a probe variable fails
+        for pending_job in list(variable_jobs.values()) + averaging_jobs:
+            if pending_job is not None:
+                pending_job.cancel()
+        if executor is not None:
+            executor.shutdown()
+        for out_table in out_tables:
+            metadata_table_writer.metadata_table_close(out_table)
 
     print(' -------------------------')
     total_run_time = time.gmtime(calendar.timegm(time.gmtime()) - start_run_time)
@@ -1104,10 +1240,20 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
         in_instrument_types_str = None
 
     try:
-        verbose = string_to_bool(sys.argv[13])
+        workers = int(sys.argv[13])
+    except (IndexError, ValueError):
+        workers = 1
+
+    try:
+        incremental_mode = string_to_bool(sys.argv[14])
+    except (IndexError, ValueError):
+        incremental_mode = False
+
+    try:
+        verbose = string_to_bool(sys.argv[15])
     except (IndexError, ValueError):
         verbose = True
 
     obs_postpro(in_csv_dir, in_dir, in_fields_standard_name_str, work_dir, out_dir,
                 routine_qc_iterations, climatology_dir, first_date_str, last_date_str,
-                region_boundaries_str, med_sea_masking, in_instrument_types_str, verbose)
+                region_boundaries_str, med_sea_masking, in_instrument_types_str, workers, incremental_mode, verbose)
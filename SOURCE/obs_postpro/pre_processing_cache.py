@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import hashlib
+import pickle
+
+# Global variables
+cache_version = '1'  # to be increased when the cached processing chain changes its outputs
+cache_results_file_name = 'results.pkl'
+cache_index_extension = '.key'
+
+
+def file_fingerprint(in_file):
+    in_file_stat = os.stat(in_file)
+    return [os.path.abspath(in_file), in_file_stat.st_size, in_file_stat.st_mtime_ns]
+
+
+def cache_key(in_files, processing_arguments):
+    # Content address of a processing: input files path, size and modification time plus processing arguments
+    key_data = [cache_version, [file_fingerprint(in_file) for in_file in in_files], processing_arguments]
+    return hashlib.sha256(repr(key_data).encode('utf-8')).hexdigest()
+
+
+def cache_load(cache_dir, key):
+    # Returns the stored results and restores the stored output files in their original position,
+    # or None if the key is not in cache or the entry is incomplete
+    entry_dir = cache_dir + '/' + key
+    try:
+        with open(entry_dir + '/' + cache_results_file_name, 'rb') as results_stream:
+            [results, out_files] = pickle.load(results_stream)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    for out_file in out_files:
+        if not os.path.isfile(entry_dir + '/' + os.path.basename(out_file)):
+            return None
+    for out_file in out_files:
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        shutil.copy2(entry_dir + '/' + os.path.basename(out_file), out_file)
+    return results
+
+
+def cache_store(cache_dir, key, results, out_files, group_name=None):
+    # Entries are written in a temporary folder and then renamed, so interrupted runs never leave readable
+    # incomplete entries. If group_name is provided, only the last stored entry of that group is kept
+    entry_dir = cache_dir + '/' + key
+    temporary_entry_dir = entry_dir + '_' + str(os.getpid()) + '.tmp'
+    if os.path.exists(temporary_entry_dir):
+        shutil.rmtree(temporary_entry_dir)
+    os.makedirs(temporary_entry_dir)
+    for out_file in out_files:
+        shutil.copy2(out_file, temporary_entry_dir + '/' + os.path.basename(out_file))
+    with open(temporary_entry_dir + '/' + cache_results_file_name, 'wb') as results_stream:
+        pickle.dump([results, out_files], results_stream)
+    if os.path.exists(entry_dir):
+        shutil.rmtree(entry_dir)
+    os.rename(temporary_entry_dir, entry_dir)
+    if group_name is not None:
+        cache_group_prune(cache_dir, key, group_name)
+
+
+def cache_group_prune(cache_dir, key, group_name):
+    # Remove the previous entry of the group (if different from key) and index key as the group entry
+    group_index_file = cache_dir + '/' + group_name + cache_index_extension
+    try:
+        with open(group_index_file, 'r') as index_stream:
+            previous_key = index_stream.read().strip()
+    except OSError:
+        previous_key = ''
+    if previous_key.isalnum() and (previous_key != key) and os.path.exists(cache_dir + '/' + previous_key):
+        shutil.rmtree(cache_dir + '/' + previous_key)
+    with open(group_index_file, 'w') as index_stream:
+        index_stream.write(key)
@@ -20,7 +20,7 @@ def string_to_bool(string):
 
 # Functional version
 def quality_check_applier(in_file=None, in_variable_standard_name=None, valid_qc_values=None, out_file=None,
-                          iteration=-1, verbose=True):
+                          iteration=-1, in_memory=None, verbose=True):
     if __name__ == '__main__':
         return
     if verbose:
@@ -60,11 +60,11 @@ def quality_check_applier(in_file=None, in_variable_standard_name=None, valid_qc
 
     if verbose:
         print(' Opening input dataset.')
-    # Open input dataset
-    in_data = netCDF4.Dataset(in_file, mode='r')
-    in_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', in_variable_standard_name,
-                                                             verbose=False)
+    # Open input dataset (from its netCDF contents if already loaded in memory)
+    in_data = netCDF4.Dataset(in_file, mode='r', memory=in_memory)
     try:
+        in_variable_name = find_variable_name.dataset_variable_name(in_data, 'standard_name',
+                                                                    in_variable_standard_name)
         in_variable = in_data.variables[in_variable_name]
     except KeyError:
         time.sleep(sleep_time)
@@ -250,4 +250,4 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
     except (IndexError, ValueError):
         verbose = True
 
-    quality_check_applier(in_file, in_variable_standard_name, valid_qc_values, out_file, iteration, verbose)
+    quality_check_applier(in_file, in_variable_standard_name, valid_qc_values, out_file, iteration, None, verbose)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# Foreign seas masked for Mediterranean Sea processing.
+# Basins are defined by longitude - latitude limits (two values, open box) or by polygon vertices (three or more values)
+# and are masked only when the selected region overlaps them. Basins with "closed_west" are masked only when the region
+# west boundary is inside the basin longitude range (no connection with the open ocean west of the basin).
+foreign_seas = [
+    {'name': 'Biscay Gulf', 'longitudes': [-9.25, -1.15], 'latitudes': [43.28, 46], 'closed_west': True},
+    {'name': 'Marmara Sea', 'longitudes': [26.83, 29.94], 'latitudes': [40.3, 41.08], 'closed_west': False},
+    {'name': 'Black Sea', 'longitudes': [27.32, 41.96], 'latitudes': [40.91, 46.8], 'closed_west': False},
+    {'name': 'Azov Sea', 'longitudes': [34.81, 39.3], 'latitudes': [45.28, 47.28], 'closed_west': False}]
+
+
+def region_boundaries_parse(region_boundaries_str):
+    # min_lon, max_lon (deg E); min_lat, max_lat (deg N)
+    return [np.float32(boundary) for boundary in region_boundaries_str.split(' ')[:4]]
+
+
+def positions_parse(positions_strings):
+    # Positions strings to single precision (unreadable positions are not a number)
+    try:
+        return np.array(positions_strings, dtype=np.float32)
+    except ValueError:
+        positions = np.empty(len(positions_strings), dtype=np.float32)
+        for position_index in range(len(positions_strings)):
+            try:
+                positions[position_index] = np.float32(positions_strings[position_index])
+            except ValueError:
+                positions[position_index] = np.nan
+        return positions
+
+
+def basin_mask(longitudes, latitudes, basin_longitudes, basin_latitudes):
+    if len(basin_longitudes) == 2:
+        return (basin_longitudes[0] < longitudes) & (longitudes < basin_longitudes[1]) & \
+            (basin_latitudes[0] < latitudes) & (latitudes < basin_latitudes[1])
+    # Even - odd rule polygon test, computed on all the points for every polygon edge
+    inside_mask = np.zeros(longitudes.shape, dtype=bool)
+    vertices_number = len(basin_longitudes)
+    for vertex in range(vertices_number):
+        lon_a = basin_longitudes[vertex]
+        lat_a = basin_latitudes[vertex]
+        lon_b = basin_longitudes[(vertex + 1) % vertices_number]
+        lat_b = basin_latitudes[(vertex + 1) % vertices_number]
+        if lat_a == lat_b:
+            continue
+        crossing_mask = (lat_a > latitudes) != (lat_b > latitudes)
+        crossing_longitudes = lon_a + (latitudes - lat_a) * (lon_b - lon_a) / (lat_b - lat_a)
+        inside_mask ^= crossing_mask & (longitudes < crossing_longitudes)
+    return inside_mask
+
+
+def masked_basins(region_boundaries, med_sea_masking, basins=None):
+    # Basins to mask for the selected region, evaluated once per run
+    if basins is None:
+        basins = foreign_seas
+    if not med_sea_masking:
+        return list()
+    [west_boundary, east_boundary, south_boundary, north_boundary] = region_boundaries
+    region_basins = list()
+    for basin in basins:
+        basin_min_lon = np.min(basin['longitudes'])
+        basin_max_lon = np.max(basin['longitudes'])
+        basin_min_lat = np.min(basin['latitudes'])
+        basin_max_lat = np.max(basin['latitudes'])
+        if basin.get('closed_west', False):
+            overlap = (basin_min_lon < west_boundary < basin_max_lon) and (east_boundary > basin_min_lon)
+        else:
+            overlap = (west_boundary < basin_max_lon) and (east_boundary > basin_min_lon)
+        if overlap and (south_boundary < basin_max_lat) and (north_boundary > basin_min_lat):
+            region_basins.append(basin)
+    return region_basins
+
+
+def region_mask(longitudes, latitudes, region_boundaries, region_basins):
+    # True where positions are strictly inside the region boundaries and outside every masked basin
+    # (not a number positions are always outside)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    [west_boundary, east_boundary, south_boundary, north_boundary] = region_boundaries
+    in_area_mask = (west_boundary < longitudes) & (longitudes < east_boundary) & \
+        (south_boundary < latitudes) & (latitudes < north_boundary)
+    for basin in region_basins:
+        in_area_mask &= np.invert(basin_mask(longitudes, latitudes, basin['longitudes'], basin['latitudes']))
+    return in_area_mask
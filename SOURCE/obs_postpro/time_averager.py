@@ -8,7 +8,7 @@ import datetime
 import dateutil
 import time
 import calendar
-from SOURCE import find_variable_name
+from SOURCE import find_variable_name, time_calc
 
 # Global variables
 sleep_time = 0.1  # seconds
@@ -55,38 +55,181 @@ def round_down(datetime_variable, resolution):
                                  second=datetime_variable.second)
 
 
-def round_up(datetime_variable, resolution):
-    if resolution == 'AS':
-        return round_down(datetime_variable, resolution) + dateutil.relativedelta.relativedelta(years=1)
-    if resolution == 'MS':
-        return round_down(datetime_variable, resolution) + dateutil.relativedelta.relativedelta(months=1)
-    elif resolution == 'D':
-        return round_down(datetime_variable, resolution) + datetime.timedelta(days=1)
-    elif resolution == 'H':
-        return round_down(datetime_variable, resolution) + datetime.timedelta(hours=1)
-    elif resolution == 'T':
-        return round_down(datetime_variable, resolution) + datetime.timedelta(minutes=1)
-    elif resolution == 'S':
-        return round_down(datetime_variable, resolution) + datetime.timedelta(seconds=1)
+def round_up_time_stamps(time_stamps, resolution):
+    # Vectorized version of round up to the next resolution step of a pandas DatetimeIndex
+    period_frequency = {'AS': 'Y', 'MS': 'M', 'D': 'D', 'H': 'H', 'T': 'T', 'S': 'S'}[resolution]
+    return (time_stamps.to_period(period_frequency) + 1).to_timestamp()
+
+
+def resample_bins_left_bounds(time_index, freq_str):
+    # Left bounds of pandas resample bins covering time index (they only depend on its first and last time stamps)
+    return pd.Series(np.zeros(time_index.shape[0]), index=time_index).resample(freq_str).size().index
+
+
+def nested_bins(bins_left_bounds, out_bins_left_bounds):
+    # True if every output bin is made of whole input bins (output bins edges are input bins edges)
+    in_bounds = bins_left_bounds.asi8
+    out_bounds = out_bins_left_bounds.asi8
+    return np.all(np.isin(out_bounds[out_bounds > in_bounds[0]], in_bounds))
+
+
+def time_weights(in_time_stamps, out_time_stamps, bins_left_bounds, resolution):
+    # Duration weights over bins (resample bins left bounds) of input time stamps. Output time stamps are added as
+    # vacant records, ending the previous samples, and the last record of each bin lasts up to the round up of its
+    # time stamp to resolution. Returns input records positions in the work records, work records bins,
+    # bins starts positions and work records weights (nanoseconds)
+    in_time_index = pd.DatetimeIndex(in_time_stamps)
+    work_time_index = in_time_index.union(out_time_stamps)
+    work_time = work_time_index.asi8
+    work_bins = np.searchsorted(bins_left_bounds.asi8, work_time, side='right') - 1
+    bin_starts = np.flatnonzero(np.diff(work_bins, prepend=-1))
+    bin_ends = np.append(bin_starts[1:], work_time.shape[0]) - 1
+    weights = np.diff(work_time, append=0)
+    weights[bin_ends] = round_up_time_stamps(work_time_index[bin_ends], resolution).asi8 - work_time[bin_ends]
+    return [work_time_index.get_indexer(in_time_index), work_bins, bin_starts, weights]
+
+
+def time_weighted_sums(in_time_stamps, in_values, out_time_stamps, bins_left_bounds, resolution):
+    # Time weighted sums over bins (resample bins left bounds) of input values (time or time, depth),
+    # masked or NaN values excluded, with time_weights duration weights.
+    # Returns first bin index, weighted sums and weights sums (nanoseconds, zero where no valid data)
+    # of the bins from the first to the last one with samples
+    [in_positions, work_bins, bin_starts, weights] = \
+        time_weights(in_time_stamps, out_time_stamps, bins_left_bounds, resolution)
+    first_bin = work_bins[0]
+
+    # Work values with NaN in the vacant records
+    in_values = np.ma.filled(np.ma.array(in_values, dtype=np.float64), np.nan)
+    work_values = np.full((work_bins.shape[0],) + in_values.shape[1:], np.nan)
+    work_values[in_positions, ...] = in_values
+
+    # Weighted sums and weights sums for all samples columns at once
+    valid = np.logical_not(np.isnan(work_values))
+    weights = weights.reshape((-1,) + (1,) * (work_values.ndim - 1))
+    weighted_sums = np.zeros((work_bins[-1] - first_bin + 1,) + in_values.shape[1:])
+    weights_sums = np.zeros((work_bins[-1] - first_bin + 1,) + in_values.shape[1:], dtype=np.int64)
+    weighted_sums[work_bins[bin_starts] - first_bin, ...] = \
+        np.add.reduceat(np.where(valid, work_values * weights, 0.), bin_starts, axis=0)
+    weights_sums[work_bins[bin_starts] - first_bin, ...] = \
+        np.add.reduceat(np.where(valid, weights, 0), bin_starts, axis=0)
+    return [first_bin, weighted_sums, weights_sums]
+
+
+def time_weighted_sums_rollup(bins_left_bounds, first_bin, weighted_sums, weights_sums, out_bins_left_bounds):
+    # Roll up time weighted sums of consecutive bins, from first_bin on, to coarser nested output bins.
+    # Returns first output bin index, output weighted sums and weights sums
+    out_bins = np.searchsorted(out_bins_left_bounds.asi8,
+                               bins_left_bounds.asi8[first_bin: first_bin + weighted_sums.shape[0]], side='right') - 1
+    # Input bins before the first output one contain only vacant records
+    out_bins = np.maximum(out_bins, 0)
+    out_first_bin = out_bins[0]
+    out_bins -= out_first_bin
+    out_bins_starts = np.flatnonzero(np.diff(out_bins, prepend=-1))
+    out_weighted_sums = np.zeros((out_bins[-1] + 1,) + weighted_sums.shape[1:])
+    out_weights_sums = np.zeros((out_bins[-1] + 1,) + weights_sums.shape[1:], dtype=np.int64)
+    out_weighted_sums[out_bins[out_bins_starts], ...] = np.add.reduceat(weighted_sums, out_bins_starts, axis=0)
+    out_weights_sums[out_bins[out_bins_starts], ...] = np.add.reduceat(weights_sums, out_bins_starts, axis=0)
+    return [out_first_bin, out_weighted_sums, out_weights_sums]
+
+
+def time_weighted_sums_merge(sums, other_sums):
+    # Merge time weighted sums of consecutive bins [first bin index, weighted sums, weights sums]
+    if sums is None:
+        return other_sums
+    first_bin = min(sums[0], other_sums[0])
+    last_bin = max(sums[0] + sums[1].shape[0], other_sums[0] + other_sums[1].shape[0])
+    weighted_sums = np.zeros((last_bin - first_bin,) + sums[1].shape[1:])
+    weights_sums = np.zeros((last_bin - first_bin,) + sums[2].shape[1:], dtype=np.int64)
+    for [merged_first_bin, merged_weighted_sums, merged_weights_sums] in [sums, other_sums]:
+        merged_bins = slice(merged_first_bin - first_bin, merged_first_bin - first_bin + merged_weighted_sums.shape[0])
+        weighted_sums[merged_bins, ...] += merged_weighted_sums
+        weights_sums[merged_bins, ...] += merged_weights_sums
+    return [first_bin, weighted_sums, weights_sums]
+
+
+def time_chunks(in_time_stamps, chunk_edges, chunk_records_number=None):
+    # Input records ranges and time ranges of consecutive chunks of at least chunk_records_number records (if
+    # possible) cut at chunk edges (int64 nanoseconds). If chunk_records_number is None a single chunk is returned
+    in_time = pd.DatetimeIndex(in_time_stamps).asi8
+    chunks = [[0, in_time.shape[0], np.iinfo(np.int64).min, np.iinfo(np.int64).max]]
+    if chunk_records_number is None:
+        return chunks
+    edges_indices = np.searchsorted(in_time, chunk_edges, side='left')
+    for edge_index, chunk_edge in zip(edges_indices, chunk_edges):
+        if (edge_index - chunks[-1][0] >= chunk_records_number) and (in_time.shape[0] - edge_index > 0):
+            chunks[-1][1] = edge_index
+            chunks[-1][3] = chunk_edge
+            chunks.append([edge_index, in_time.shape[0], chunk_edge, np.iinfo(np.int64).max])
+    return chunks
+
+
+def average_step_parameters(average_step_str):
+    # Output cell methods average string, round resolution, resample frequency string, time step (seconds) and half
+    # time step (pandas Timedelta, None for months) of an average step string (hh:mm:ss or MM)
+    if len(average_step_str) >= 3:
+        out_average_str = ''
+        half_time_delta = pd.Timedelta(average_step_str) / 2
+        days = 0
+        hours = int(average_step_str.split(':')[0])
+        minutes = int(average_step_str.split(':')[1])
+        while minutes >= 60:
+            hours += 1
+            minutes -= 60
+        while hours >= 24:
+            days += 1
+            hours -= 24
+        if days > 0:
+            out_average_str += str(days) + ' days:'
+        if hours > 0:
+            out_average_str += str(hours) + ' hours:'
+        if minutes > 0:
+            out_average_str += str(minutes) + ' minutes:'
+        if minutes > 0:
+            round_resolution = 'T'
+        elif hours > 0:
+            round_resolution = 'H'
+        elif days > 0:
+            round_resolution = 'D'
+        freq_str = str(days) + 'D' + str(hours) + 'H' + str(minutes) + 'T0S'
+        out_time_step = days * 86400 + hours * 3600 + minutes * 60
+    else:
+        out_average_str = average_step_str + ' months'
+        half_time_delta = None
+        months = int(average_step_str)
+        out_time_step = months * 30 * 86400
+        if months == 12:
+            round_resolution = 'AS'
+            freq_str = '1AS'
+        else:
+            round_resolution = 'MS'
+            freq_str = str(months) + 'MS'
+    return [out_average_str, round_resolution, freq_str, out_time_step, half_time_delta]
 
 
-def time_weighted_average(timeseries_data, resolution):
-    try:
-        timeseries_data.index[-1]
-    except IndexError:
-        return np.nan
-    data_end = pd.DatetimeIndex([round_up(timeseries_data.index[-1], resolution)])
-    indices = np.where(np.logical_not(np.isnan(timeseries_data)))[0]
-    if indices.shape[0] > 0:
-        return np.average(timeseries_data.to_numpy()[indices],
-                          weights=np.diff(timeseries_data.index.append(data_end).asi8)[indices])
-    else:
-        return np.nan
+def output_time_bounds(in_time_stamps, round_resolution, freq_str, out_time_step, half_time_delta,
+                       half_time_step_shift=False):
+    # Output left time bounds, time stamps and right time bounds of an average step covering input time stamps
+    start = round_down(in_time_stamps[0], round_resolution)
+    end = round_down(in_time_stamps[in_time_stamps.shape[0] - 1], round_resolution)
+    if half_time_step_shift:
+        start -= pd.Timedelta(seconds=np.floor_divide(out_time_step, 2))
+        end -= pd.Timedelta(seconds=np.floor_divide(out_time_step, 2))
+    out_left_time_bounds = pd.date_range(start, end, freq=freq_str)
+    if (round_resolution != 'MS') and (round_resolution != 'AS'):
+        out_time_stamps = out_left_time_bounds + half_time_delta
+        out_right_time_bounds = out_time_stamps + half_time_delta
+    elif round_resolution == 'MS':
+        out_time_stamps = out_left_time_bounds + pd.Timedelta(days=14)
+        out_right_time_bounds = pd.date_range(start, end + dateutil.relativedelta.relativedelta(months=1), freq='M')
+    elif round_resolution == 'AS':
+        out_time_stamps = out_left_time_bounds + pd.Timedelta(days=182)
+        out_right_time_bounds = pd.date_range(start, end + dateutil.relativedelta.relativedelta(years=1), freq='A')
+    return [out_left_time_bounds, out_time_stamps, out_right_time_bounds]
 
 
 # Functional version
 def time_averager(in_file=None, average_step_str=None, out_file=None, in_variable_standard_name=None,
-                  half_time_step_shift=False, verbose=True):
+                  half_time_step_shift=False, chunk_records_number=None, verbose=True):
     if __name__ == '__main__':
         return
     if verbose:
@@ -95,29 +238,43 @@ def time_averager(in_file=None, average_step_str=None, out_file=None, in_variabl
         print(' -------------------------')
     if in_file is None or average_step_str is None or out_file is None:
         time.sleep(sleep_time)
-        print(' Error: 3 of 6 maximum arguments (3 optionals) not provided.', file=sys.stderr)
+        print(' Error: 3 of 7 maximum arguments (4 optionals) not provided.', file=sys.stderr)
         print(' 1) input file;', file=sys.stderr)
-        print(' 2) output average step:', file=sys.stderr)
+        print(' 2) output average step (or space separated list of average steps):', file=sys.stderr)
         print('    accepted values:', file=sys.stderr)
         print('        a) hh:mm:ss;', file=sys.stderr)
         print('        b) MM (months number, if 12 it will be yearly average).', file=sys.stderr)
-        print(' 3) output file;', file=sys.stderr)
+        print(' 3) output file (or space separated list of output files, one for each average step);',
+              file=sys.stderr)
         print(' 4) (optional) input variable standard_name to average (default: process all 1D - 2D variables);',
               file=sys.stderr)
         print(' 5) (optional) half time step average shifting (True or False) (default: False);', file=sys.stderr)
-        print(' 6) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
+        print(' 6) (optional) input records number of streaming time chunks, cut at average bins boundaries',
+              '(default: None, whole records);', file=sys.stderr)
+        print(' 7) (optional) verbosity switch (True or False) (default: True).', file=sys.stderr)
         time.sleep(sleep_time)
         return
+    average_steps = average_step_str.split(' ')
+    out_files = out_file.split(' ')
+    if len(out_files) != len(average_steps):
+        time.sleep(sleep_time)
+        print(' Error. Output files number is different from average steps number.', file=sys.stderr)
+        time.sleep(sleep_time)
+        print(' -------------------------')
+        return
     if verbose:
         print(' Input file = ' + in_file)
-        if len(average_step_str) >= 3:
-            print(' Time step = ' + average_step_str + ' HH:MM:SS')
-        else:
-            print(' Time step = ' + average_step_str + ' months')
-        print(' Output file = ' + out_file)
+        for average_step, step_out_file in zip(average_steps, out_files):
+            if len(average_step) >= 3:
+                print(' Time step = ' + average_step + ' HH:MM:SS')
+            else:
+                print(' Time step = ' + average_step + ' months')
+            print(' Output file = ' + step_out_file)
         print(' Input variable standard_name = ' + str(in_variable_standard_name) +
               ' (if None all 1D or 2D variables will be processed)')
         print(' Half time step shift for series is ' + str(half_time_step_shift))
+        print(' Streaming time chunks records number = ' + str(chunk_records_number) +
+              ' (if None whole records will be averaged at once)')
         print(' Verbosity switch = ' + str(verbose))
         print(' -------------------------')
 
@@ -173,72 +330,32 @@ def time_averager(in_file=None, average_step_str=None, out_file=None, in_variabl
 
         print(' Most representative time step: ' + time_step_str)
 
-    if len(average_step_str) >= 3:
-        out_average_str = ''
-        out_time_delta = pd.Timedelta(average_step_str)
-        half_time_delta = out_time_delta / 2
-        days = 0
-        hours = int(average_step_str.split(':')[0])
-        minutes = int(average_step_str.split(':')[1])
-        while minutes >= 60:
-            hours += 1
-            minutes -= 60
-        while hours >= 24:
-            days += 1
-            hours -= 24
-        if days > 0:
-            out_average_str += str(days) + ' days:'
-        if hours > 0:
-            out_average_str += str(hours) + ' hours:'
-        if minutes > 0:
-            out_average_str += str(minutes) + ' minutes:'
-        if minutes > 0:
-            round_resolution = 'T'
-        elif hours > 0:
-            round_resolution = 'H'
-        elif days > 0:
-            round_resolution = 'D'
-        freq_str = str(days) + 'D' + str(hours) + 'H' + str(minutes) + 'T0S'
-        out_time_step = days * 86400 + hours * 3600 + minutes * 60
-        half_days = half_time_delta.days
-        half_hours = 0
-        half_minutes = 0
-        half_seconds = half_time_delta.seconds
-        while half_seconds >= 60:
-            half_minutes += 1
-            half_seconds -= 60
-        while half_minutes >= 60:
-            half_hours += 1
-            half_minutes -= 60
-        while half_hours >= 24:
-            half_days += 1
-            half_hours -= 24
-    else:
-        out_average_str = average_step_str + ' months'
-        months = int(average_step_str)
-        out_time_step = months * 30 * 86400
-        if months == 12:
-            round_resolution = 'AS'
-            freq_str = '1AS'
-        else:
-            round_resolution = 'MS'
-            freq_str = str(months) + 'MS'
-
-    if time_step > (1 + time_step_tolerance / 100) * out_time_step:
-        time.sleep(sleep_time)
-        print(' Error. Dataset time step and added tolerance are greater than specified output time step. Exiting.',
-              file=sys.stderr)
-        time.sleep(sleep_time)
-        print(' -------------------------')
+    # Average steps parameters, sorted by increasing time step
+    steps_parameters = []
+    for average_step, step_out_file in zip(average_steps, out_files):
+        [out_average_str, round_resolution, freq_str, out_time_step, half_time_delta] = \
+            average_step_parameters(average_step)
+        if time_step > (1 + time_step_tolerance / 100) * out_time_step:
+            time.sleep(sleep_time)
+            print(' Error. Dataset time step and added tolerance are greater than specified output time step ' +
+                  average_step + '. Skipping.', file=sys.stderr)
+            time.sleep(sleep_time)
+            print(' -------------------------')
+            continue
+        applied_tolerance = False
+        if (time_step_tolerance > 0) and (time_step > out_time_step):
+            time.sleep(sleep_time)
+            print(' Warning. Dataset time step is greater than specified output time step but under tolerance.',
+                  ' Rounding down and averaging...', file=sys.stderr)
+            time.sleep(sleep_time)
+            print(' -------------------------')
+            applied_tolerance = True
+        steps_parameters.append([out_time_step, out_average_str, round_resolution, freq_str, half_time_delta,
+                                 applied_tolerance, step_out_file])
+    if len(steps_parameters) == 0:
+        in_data.close()
         return
-    applied_tolerance = False
-    if (time_step_tolerance > 0) and (time_step > out_time_step):
-        time.sleep(sleep_time)
-        print(' Warning. Dataset time step is greater than specified output time step but under tolerance.',
-              ' Rounding down and averaging...', file=sys.stderr)
-        time.sleep(sleep_time)
-        print(' -------------------------')
-        applied_tolerance = True
+    steps_parameters.sort(key=lambda step_parameters: step_parameters[0])
 
     if verbose:
         print(' Starting process...')
@@ -250,9 +367,10 @@ def time_averager(in_file=None, average_step_str=None, out_file=None, in_variabl
 
     # Get input and output time stamps for the two time series
     in_time_stamps = pd.Series((in_time_data - time_shift) * 1.e9, dtype='datetime64[ns]')
+    in_records_indices = np.arange(in_time_stamps.shape[0])
 
     # Round to nearest sub multiple of time step and remove generated duplicates to take into account of tolerance
-    if applied_tolerance:
+    if any([step_parameters[5] for step_parameters in steps_parameters]):
         if time_step < 29:
             round_frequency = '10ms'
         elif time_step < 60:
@@ -272,92 +390,111 @@ def time_averager(in_file=None, average_step_str=None, out_file=None, in_variabl
         else:
             round_frequency = 'D'
         in_time_stamps = in_time_stamps.dt.round(round_frequency)
-        [in_time_stamps, unique_indices] = \
+        [in_time_stamps, in_records_indices] = \
             np.unique(in_time_stamps, return_index=True)
-        duplicated_indices = np.unique(list(set(np.arange(in_time_stamps.shape[0])) - set(unique_indices)))
         in_time_stamps = pd.Series(in_time_stamps)
-    start = round_down(in_time_stamps[0], round_resolution)
-    end = round_down(in_time_stamps[in_time_stamps.shape[0] - 1], round_resolution)
-    if half_time_step_shift:
-        start -= pd.Timedelta(seconds=np.floor_divide(out_time_step, 2))
-        end -= pd.Timedelta(seconds=np.floor_divide(out_time_step, 2))
-    out_left_time_bounds = pd.date_range(start, end, freq=freq_str)
-    if (round_resolution != 'MS') and (round_resolution != 'AS'):
-        out_time_stamps = out_left_time_bounds + half_time_delta
-        out_right_time_bounds = out_time_stamps + half_time_delta
-    elif round_resolution == 'MS':
-        out_time_stamps = out_left_time_bounds + pd.Timedelta(days=14)
-        out_right_time_bounds = pd.date_range(start, end + dateutil.relativedelta.relativedelta(months=1), freq='M')
-    elif round_resolution == 'AS':
-        out_time_stamps = out_left_time_bounds + pd.Timedelta(days=182)
-        out_right_time_bounds = pd.date_range(start, end + dateutil.relativedelta.relativedelta(years=1), freq='A')
-
-    if verbose:
-        print(' Creating output dataset.')
-    # Create output dataset
-    out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
-
-    if verbose:
-        print(' Creating dimensions.')
-    # Create new dimensions
-    for dimension_name in in_data.dimensions:
-        out_data.createDimension(dimension_name, in_data.dimensions[dimension_name].size
-                                 if not in_data.dimensions[dimension_name].isunlimited() else None)
+    steps_time_bounds = [output_time_bounds(in_time_stamps, step_parameters[2], step_parameters[3],
+                                            step_parameters[0], step_parameters[4], half_time_step_shift)
+                         for step_parameters in steps_parameters]
+
+    # Resample bins of each step and finer step to roll up sums from (-1: computed from samples). Sums are rolled up
+    # only from nested bins with the same samples weights, so that they are the ones computed from samples
+    in_time_index = pd.DatetimeIndex(in_time_stamps)
+    steps_bins_left_bounds = [resample_bins_left_bounds(in_time_index[[0, -1]].union(time_bounds[1]),
+                                                        step_parameters[3])
+                              for step_parameters, time_bounds in zip(steps_parameters, steps_time_bounds)]
+    steps_samples_weights = []
+    for step_parameters, time_bounds, bins_left_bounds in \
+            zip(steps_parameters, steps_time_bounds, steps_bins_left_bounds):
+        [in_positions, work_bins, bin_starts, weights] = \
+            time_weights(in_time_index, time_bounds[1], bins_left_bounds, step_parameters[2])
+        steps_samples_weights.append(weights[in_positions])
+    steps_sources = []
+    for step in range(len(steps_parameters)):
+        steps_sources.append(-1)
+        for finer_step in reversed(range(step)):
+            if nested_bins(steps_bins_left_bounds[finer_step], steps_bins_left_bounds[step]) and \
+                    np.array_equal(steps_samples_weights[finer_step], steps_samples_weights[step]):
+                steps_sources[step] = finer_step
+                break
+    del steps_samples_weights
+    # Streaming time chunks, cut at bins edges shared by the steps computed from samples
+    chunk_edges = steps_bins_left_bounds[0].asi8
+    for step in range(1, len(steps_parameters)):
+        if steps_sources[step] == -1:
+            chunk_edges = np.intersect1d(chunk_edges, steps_bins_left_bounds[step].asi8)
+    chunks = time_chunks(in_time_index, chunk_edges, chunk_records_number)
 
-    try:
-        out_data.createDimension('axis_nbounds', 2)
-    except RuntimeError:
-        pass
+    out_dimension_variables = ['lon', 'lat', 'depth', 'time']
 
+    # Create output datasets
+    steps_out_data = []
+    for step_parameters, [out_left_time_bounds, out_time_stamps, out_right_time_bounds] in \
+            zip(steps_parameters, steps_time_bounds):
+        out_average_str = step_parameters[1]
+        [out_time_data, out_time_bounds_data] = \
+            time_calc.time_axis_seconds(out_time_stamps, out_left_time_bounds, out_right_time_bounds)
+        if verbose:
+            print(' Creating output dataset ' + step_parameters[6] + '.')
+        out_data = netCDF4.Dataset(step_parameters[6], mode='w', format='NETCDF4')
+        steps_out_data.append(out_data)
 
-    if verbose:
-        print(' Creating dimension variables.')
+        if verbose:
+            print(' Creating dimensions.')
+        # Create new dimensions
+        for dimension_name in in_data.dimensions:
+            out_data.createDimension(dimension_name, in_data.dimensions[dimension_name].size
+                                     if not in_data.dimensions[dimension_name].isunlimited() else None)
 
-    out_dimension_variables = ['lon', 'lat', 'depth', 'time']
+        try:
+            out_data.createDimension('axis_nbounds', 2)
+        except RuntimeError:
+            pass
 
-    for dimension_variable_name in out_dimension_variables:
-        in_dimension_variable = in_data.variables[dimension_variable_name]
         if verbose:
-            print(' Attaching dimension variable ' + dimension_variable_name)
-        if dimension_variable_name == 'time':
-            out_dimension_variable = out_data.createVariable(dimension_variable_name, in_dimension_variable.datatype,
-                                                             dimensions=(dimension_variable_name,),
-                                                             zlib=True, complevel=1)
-            out_dimension_variable[...] = np.array([(t - np.datetime64('1970-01-01')).total_seconds()
-                                                    for t in out_time_stamps]) + out_reference_data
-            out_dimension_variable.long_name = 'Time'
-            out_dimension_variable.standard_name = 'time'
-            out_dimension_variable.units = 'seconds since ' + out_time_reference
-            out_dimension_variable.calendar = 'gregorian'
-            out_dimension_variable.cell_methods = 'time: ' + out_average_str + ' mean'
-            out_dimension_variable.axis = 'T'
-            out_dimension_variable.bounds = 'time_bounds'
-        elif 'time' not in in_dimension_variable.dimensions:
-            out_dimension_variable = out_data.createVariable(dimension_variable_name, in_dimension_variable.datatype,
-                                                             dimensions=in_dimension_variable.dimensions)
-            out_dimension_variable[...] = in_dimension_variable[...]
-            variable_attributes = [attribute for attribute in in_dimension_variable.ncattrs()
-                                   if attribute not in '_FillValue']
-            out_dimension_variable.setncatts({attribute: in_dimension_variable.getncattr(attribute)
-                                              for attribute in variable_attributes})
-        if dimension_variable_name == 'depth':
-            try:
-                if out_dimension_variable[...].shape[0] > 1:
-                    out_dimension_variable.valid_min =\
-                        np.float32(np.min(out_dimension_variable[...]))
-                    out_dimension_variable.valid_max =\
-                        np.float32(np.max(out_dimension_variable[...]))
-            except UnboundLocalError:
-                pass
-
-    print(' Attaching dimension variable time_bounds')
-    out_time_bounds = out_data.createVariable('time_bounds', in_time.datatype,
-                                              dimensions=('time', 'axis_nbounds'), zlib=True, complevel=1)
-    out_time_bounds[..., 0] = np.array([(t - np.datetime64('1970-01-01')).total_seconds()
-                                        for t in out_left_time_bounds]) + out_reference_data
-    out_time_bounds[..., 1] = np.array([(t - np.datetime64('1970-01-01')).total_seconds()
-                                        for t in out_right_time_bounds]) + out_reference_data
-    out_time_bounds.units = 'seconds since ' + out_time_reference
+            print(' Creating dimension variables.')
+
+        for dimension_variable_name in out_dimension_variables:
+            in_dimension_variable = in_data.variables[dimension_variable_name]
+            if verbose:
+                print(' Attaching dimension variable ' + dimension_variable_name)
+            if dimension_variable_name == 'time':
+                out_dimension_variable = out_data.createVariable(dimension_variable_name,
+                                                                 in_dimension_variable.datatype,
+                                                                 dimensions=(dimension_variable_name,),
+                                                                 zlib=True, complevel=1)
+                out_dimension_variable[...] = out_time_data + out_reference_data
+                out_dimension_variable.long_name = 'Time'
+                out_dimension_variable.standard_name = 'time'
+                out_dimension_variable.units = 'seconds since ' + out_time_reference
+                out_dimension_variable.calendar = 'gregorian'
+                out_dimension_variable.cell_methods = 'time: ' + out_average_str + ' mean'
+                out_dimension_variable.axis = 'T'
+                out_dimension_variable.bounds = 'time_bounds'
+            elif 'time' not in in_dimension_variable.dimensions:
+                out_dimension_variable = out_data.createVariable(dimension_variable_name,
+                                                                 in_dimension_variable.datatype,
+                                                                 dimensions=in_dimension_variable.dimensions)
+                out_dimension_variable[...] = in_dimension_variable[...]
+                variable_attributes = [attribute for attribute in in_dimension_variable.ncattrs()
+                                       if attribute not in '_FillValue']
+                out_dimension_variable.setncatts({attribute: in_dimension_variable.getncattr(attribute)
+                                                  for attribute in variable_attributes})
+            if dimension_variable_name == 'depth':
+                try:
+                    if out_dimension_variable[...].shape[0] > 1:
+                        out_dimension_variable.valid_min =\
+                            np.float32(np.min(out_dimension_variable[...]))
+                        out_dimension_variable.valid_max =\
+                            np.float32(np.max(out_dimension_variable[...]))
+                except UnboundLocalError:
+                    pass
+
+        print(' Attaching dimension variable time_bounds')
+        out_time_bounds = out_data.createVariable('time_bounds', in_time.datatype,
+                                                  dimensions=('time', 'axis_nbounds'), zlib=True, complevel=1)
+        out_time_bounds[...] = out_time_bounds_data + out_reference_data
+        out_time_bounds.units = 'seconds since ' + out_time_reference
 
     print(' Averaging selected variables.')
 
@@ -370,76 +507,92 @@ def time_averager(in_file=None, average_step_str=None, out_file=None, in_variabl
 
     for variable_name in out_variables:
         in_variable = in_data.variables[variable_name]
-        in_variable_data = in_variable[...]
-        if not np.ma.is_masked(in_variable_data):
-            in_variable_data = np.ma.array(in_variable_data, mask=np.zeros(shape=in_variable_data.shape, dtype=bool),
-                                           fill_value=out_fill_value, dtype=in_variable_data.dtype)
-
-        # Remove duplicates if there is tolerance application
-        if applied_tolerance and in_variable_data.shape[0] > len(in_time_stamps):
-            delete_mask = np.ones(in_variable_data.shape, dtype=bool)
-            delete_mask[duplicated_indices, ...] = False
-            in_variable_data = in_variable_data[delete_mask, ...]
-        # Compute time weighted average
-        out_variable = out_data.createVariable(variable_name, in_variable.datatype,
-                                               dimensions=in_variable.dimensions,
-                                               fill_value=out_fill_value, zlib=True, complevel=1)
-        variable_attributes = [attribute for attribute in in_variable.ncattrs() if attribute not in '_FillValue']
-        out_variable.setncatts({attribute: in_variable.getncattr(attribute) for attribute in variable_attributes})
         if verbose:
             print(' Computing time weighted average for variable ' + variable_name)
-        if len(in_variable_data.shape) == 2:
-            out_time_series = np.ma.empty(shape=(out_time_stamps.shape[0], in_variable_data.shape[-1]),
-                                          fill_value=out_fill_value, dtype=in_variable.dtype)
-            for depth in range(in_variable_data.shape[-1]):
-                if verbose:
-                    print(' Depth index: ' + str(depth))
-                in_variable_depth_slice = in_variable_data[:, depth, ...]
-                in_depth_time_series = pd.Series(data=in_variable_depth_slice, index=in_time_stamps)
-                # Add the vacant indices in input time series and place NaN values in them
-                work_depth_time_series = in_depth_time_series.reindex(in_depth_time_series.index.union(out_time_stamps))
-                # Compute the time average
-                out_depth_time_series = work_depth_time_series.resample(freq_str).apply(time_weighted_average,
-                                                                                        resolution=round_resolution)
-                out_depth_time_series_data = np.ma.array(out_depth_time_series.to_numpy().real,
-                                                         mask=np.isnan(out_depth_time_series.to_numpy().real),
-                                                         fill_value=out_fill_value, dtype=in_variable.dtype)
-                out_time_series[:, depth] = out_depth_time_series_data
-        elif len(in_variable_data.shape) == 1:
-            in_time_series = pd.Series(data=in_variable_data, index=in_time_stamps)
-            # Add the vacant indices in input time series and place NaN values in them
-            work_time_series = in_time_series.reindex(in_time_series.index.union(out_time_stamps))
-            # Compute the time average
-            out_time_series = work_time_series.resample(freq_str).apply(time_weighted_average,
-                                                                        resolution=round_resolution)
-            out_time_series = np.ma.array(out_time_series.to_numpy().real,
-                                          mask=np.isnan(out_time_series.to_numpy().real),
-                                          fill_value=out_fill_value, dtype=in_variable.dtype)
-        out_variable[...] = out_time_series
-        out_variable.cell_methods = 'time: ' + out_average_str + ' mean'
-        out_variable.valid_min = np.float32(np.ma.min(out_time_series))
-        out_variable.valid_max = np.float32(np.ma.max(out_time_series))
+        steps_out_variables = []
+        for step_parameters, out_data in zip(steps_parameters, steps_out_data):
+            out_variable = out_data.createVariable(variable_name, in_variable.datatype,
+                                                   dimensions=in_variable.dimensions,
+                                                   fill_value=out_fill_value, zlib=True, complevel=1)
+            variable_attributes = [attribute for attribute in in_variable.ncattrs() if attribute not in '_FillValue']
+            out_variable.setncatts({attribute: in_variable.getncattr(attribute) for attribute in variable_attributes})
+            out_variable.cell_methods = 'time: ' + step_parameters[1] + ' mean'
+            steps_out_variables.append(out_variable)
+        steps_pending_sums = [None] * len(steps_parameters)
+        steps_valid_range = [[None, None] for step_parameters in steps_parameters]
+        for [chunk_start, chunk_stop, chunk_start_time, chunk_stop_time] in chunks:
+            if verbose and len(chunks) > 1:
+                print(' Averaging records ' + str(chunk_start) + ' - ' + str(chunk_stop - 1))
+            # Read chunk records (removing duplicates if there is tolerance application)
+            chunk_records_indices = in_records_indices[chunk_start: chunk_stop]
+            in_variable_data = in_variable[chunk_records_indices[0]: chunk_records_indices[-1] + 1, ...]
+            in_variable_data = in_variable_data[chunk_records_indices - chunk_records_indices[0], ...]
+
+            # Compute time weighted sums for all steps, from samples or rolled up from finer steps
+            steps_chunk_sums = []
+            for step, step_parameters in enumerate(steps_parameters):
+                if steps_sources[step] == -1:
+                    out_time_stamps = steps_time_bounds[step][1]
+                    chunk_sums = time_weighted_sums(
+                        in_time_index[chunk_start: chunk_stop], in_variable_data,
+                        out_time_stamps[(out_time_stamps.asi8 >= chunk_start_time) &
+                                        (out_time_stamps.asi8 < chunk_stop_time)],
+                        steps_bins_left_bounds[step], step_parameters[2])
+                else:
+                    chunk_sums = time_weighted_sums_rollup(steps_bins_left_bounds[steps_sources[step]],
+                                                           *steps_chunk_sums[steps_sources[step]],
+                                                           steps_bins_left_bounds[step])
+                steps_chunk_sums.append(chunk_sums)
+                pending_sums = time_weighted_sums_merge(steps_pending_sums[step], chunk_sums)
+
+                # Append time weighted averages of the bins completed up to this chunk, carry the others
+                if chunk_stop == in_time_index.shape[0]:
+                    completed_bins = pending_sums[1].shape[0]
+                else:
+                    completed_bins = np.searchsorted(steps_bins_left_bounds[step].asi8, chunk_stop_time,
+                                                     side='right') - 1 - pending_sums[0]
+                if completed_bins > 0:
+                    with np.errstate(invalid='ignore'):
+                        out_time_series = pending_sums[1][:completed_bins] / pending_sums[2][:completed_bins]
+                    out_time_series = np.ma.array(out_time_series, mask=np.isnan(out_time_series),
+                                                  fill_value=out_fill_value, dtype=in_variable.dtype)
+                    steps_out_variables[step][pending_sums[0]: pending_sums[0] + completed_bins, ...] = \
+                        out_time_series
+                    if out_time_series.count() > 0:
+                        steps_valid_range[step] = \
+                            [np.ma.min(out_time_series) if steps_valid_range[step][0] is None
+                             else min(steps_valid_range[step][0], np.ma.min(out_time_series)),
+                             np.ma.max(out_time_series) if steps_valid_range[step][1] is None
+                             else max(steps_valid_range[step][1], np.ma.max(out_time_series))]
+                    pending_sums = [pending_sums[0] + completed_bins, pending_sums[1][completed_bins:],
+                                    pending_sums[2][completed_bins:]]
+                steps_pending_sums[step] = pending_sums
+        for out_variable, valid_range in zip(steps_out_variables, steps_valid_range):
+            out_variable.valid_min = np.float32(valid_range[0] if valid_range[0] is not None else np.ma.masked)
+            out_variable.valid_max = np.float32(valid_range[1] if valid_range[1] is not None else np.ma.masked)
 
     if verbose:
         print(' Setting global attributes.')
     # Set global attributes
     global_attributes = [element for element in in_data.ncattrs() if not element.startswith('history')]
-    out_data.setncatts({attribute: in_data.getncattr(attribute) for attribute in global_attributes})
+    for step_parameters, out_data in zip(steps_parameters, steps_out_data):
+        out_data.setncatts({attribute: in_data.getncattr(attribute) for attribute in global_attributes})
 
-    if applied_tolerance:
-        out_data.history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
-            ' : Computed ' + out_average_str + ' weighted average with tolerance of ' + \
-            str(time_step_tolerance) + '% on dataset time step\n' + in_data.history
-    else:
-        out_data.history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
-            ' : Computed ' + out_average_str + ' weighted average\n' + in_data.history
+        if step_parameters[5]:
+            out_data.history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
+                ' : Computed ' + step_parameters[1] + ' weighted average with tolerance of ' + \
+                str(time_step_tolerance) + '% on dataset time step\n' + in_data.history
+        else:
+            out_data.history = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + \
+                ' : Computed ' + step_parameters[1] + ' weighted average\n' + in_data.history
 
     if verbose:
         print(' Closing datasets.')
         print(' -------------------------')
     # Close input and output datasets
     in_data.close()
-    out_data.close()
+    for out_data in steps_out_data:
+        out_data.close()
 
 
 # Stand alone version
@@ -466,8 +619,14 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
         half_time_step_shift = False
 
     try:
-        verbose = string_to_bool(sys.argv[6])
+        chunk_records_number = int(sys.argv[6])
+    except (IndexError, ValueError):
+        chunk_records_number = None
+
+    try:
+        verbose = string_to_bool(sys.argv[7])
     except (IndexError, ValueError):
         verbose = True
 
-    time_averager(in_file, average_step_str, out_file, in_variable_standard_name, half_time_step_shift, verbose)
+    time_averager(in_file, average_step_str, out_file, in_variable_standard_name, half_time_step_shift,
+                  chunk_records_number, verbose)
@@ -2,14 +2,12 @@
 import sys
 import os
 import numpy as np
-from sklearn.neighbors import KernelDensity
-from scipy import interpolate
-from sklearn.linear_model import LinearRegression
+from scipy import ndimage, signal
 import netCDF4
 import pandas as pd
 import time
 import calendar
-from SOURCE import find_variable_name, time_calc
+from SOURCE import find_variable_name, time_calc, dataset_memory
 
 plotting = False
 
@@ -35,11 +33,17 @@ stuck_value_test_enabled = True
 stuck_minimum_count = 100
 stuck_neighborhood_test_points = 100
 stuck_values_multiplier = 5
+# Incremental update: records loaded before the first new one, to fill the spike test neighborhood and to let
+# the stuck value test count the repetitions of the last processed values
+incremental_warm_up_records = 10 * stuck_minimum_count
 # Statistic QC iterations
 statistic_probability_threshold = 5 / 100
 valid_data_minimum_days = 15  # For blocking statistic monthly part
 # delta_x for density computation
 delta_x = 0.1
+density_bandwidth = 0.2  # gaussian kernel bandwidth
+density_binning_refinement = 10  # binning grid points per delta_x
+density_kernel_truncation = 6  # bandwidths
 # Isolated points test
 isolated_points_test_enabled = False
 neighborhood_time_steps_threshold = 15  # time steps
@@ -53,10 +57,256 @@ def string_to_bool(string):
         return False
 
 
+def spike_test_mask(in_data, neighborhood_points=spiked_neighborhood_test_points,
+                    range_multiplier=spiked_range_multiplier):
+    # Sliding window spike test along the record axis: valid data farther from the average of its
+    # 2 * neighborhood_points neighbours than range_multiplier times their range is spiked.
+    # The test is evaluated only where the whole window (data and neighbours) is valid
+    in_values = np.ma.getdata(in_data).astype(np.float64)
+    in_valid_mask = np.invert(np.ma.getmaskarray(in_data))
+    spiked_mask = np.zeros(in_values.shape, dtype=bool)
+    window_size = 2 * neighborhood_points + 1
+    records_number = in_values.shape[0]
+    if records_number < window_size:
+        return spiked_mask
+    center = slice(neighborhood_points, records_number - neighborhood_points)
+    valid_cumulative_sum = np.zeros((records_number + 1,) + in_values.shape[1:], dtype=np.int64)
+    np.cumsum(in_valid_mask, axis=0, out=valid_cumulative_sum[1:])
+    enabled_mask = valid_cumulative_sum[window_size:] - valid_cumulative_sum[: -window_size] == window_size
+    # Running extremes of neighborhood_points long blocks (block_maximum[i] = max(in_values[i: i + points])),
+    # computed in linear time whatever the window size: preceding and following blocks give the neighbours extremes
+    block_maximum = ndimage.maximum_filter1d(np.where(in_valid_mask, in_values, -np.inf), neighborhood_points,
+                                             axis=0, origin=-(neighborhood_points // 2))
+    block_minimum = ndimage.minimum_filter1d(np.where(in_valid_mask, in_values, np.inf), neighborhood_points,
+                                             axis=0, origin=-(neighborhood_points // 2))
+    preceding_blocks = slice(0, records_number - 2 * neighborhood_points)
+    following_blocks = slice(neighborhood_points + 1, records_number - neighborhood_points + 1)
+    with np.errstate(invalid='ignore', over='ignore'):
+        neighbours_range = \
+            np.maximum(block_maximum[preceding_blocks], block_maximum[following_blocks]) - \
+            np.minimum(block_minimum[preceding_blocks], block_minimum[following_blocks])
+        # Neighbours are summed nearest first, following and then preceding, as the masked arrays test did
+        neighbours_sum = np.zeros(neighbours_range.shape, dtype=np.float64)
+        for point in range(1, neighborhood_points + 1):
+            neighbours_sum += in_values[neighborhood_points + point: records_number - neighborhood_points + point]
+            neighbours_sum += in_values[neighborhood_points - point: records_number - neighborhood_points - point]
+        neighbours_average = neighbours_sum / np.float64(2 * neighborhood_points)
+        spiked_mask[center] = enabled_mask & \
+            (np.abs(in_values[center] - neighbours_average) > range_multiplier * neighbours_range)
+    return spiked_mask
+
+
+def stuck_values_search(in_values, minimum_count=stuck_minimum_count,
+                        neighborhood_points=stuck_neighborhood_test_points, values_multiplier=stuck_values_multiplier):
+    # Stuck values of every column (depth) of a 2D array: values repeated more than minimum_count times and more than
+    # values_multiplier times the most repeated of their neighborhood_points preceding and following distinct values.
+    # Repetitions are counted on the distinct values found with a hash table, then only these values are sorted
+    columns_number = in_values.shape[-1]
+    [value_codes, distinct_values] = pd.factorize(in_values.ravel())
+    # Not a number values (sentinel code) as the last distinct value
+    if np.any(value_codes < 0):
+        value_codes[value_codes < 0] = len(distinct_values)
+        distinct_values = np.append(distinct_values, np.array([np.nan], dtype=distinct_values.dtype))
+    value_order = np.argsort(distinct_values)
+    value_ranks = np.empty(len(value_order), dtype=np.int64)
+    value_ranks[value_order] = np.arange(len(value_order))
+    # Repetitions of each (column, sorted distinct value) pair
+    pair_counts = np.bincount(np.tile(np.arange(columns_number) * len(distinct_values), in_values.shape[0]) +
+                              value_ranks[value_codes],
+                              minlength=columns_number * len(distinct_values))
+    pair_counts = pair_counts.reshape(columns_number, len(distinct_values))
+    [columns, value_indices] = np.nonzero(pair_counts)
+    values = distinct_values[value_order][value_indices]
+    counts = pair_counts[columns, value_indices]
+    not_filled_mask = values != out_fill_value
+    columns = columns[not_filled_mask]
+    values = values[not_filled_mask]
+    counts = counts[not_filled_mask]
+    # Counts of each column in a zero padded row, neighbours extremes from the preceding and following
+    # neighborhood_points long blocks (block_maximum[i] = max(padded_counts[i: i + points]))
+    column_sizes = np.bincount(columns, minlength=columns_number)
+    positions = np.arange(len(counts)) - (np.cumsum(column_sizes) - column_sizes)[columns]
+    padded_counts = np.zeros((columns_number, np.max(column_sizes, initial=0) + 2 * neighborhood_points),
+                             dtype=counts.dtype)
+    padded_counts[columns, positions + neighborhood_points] = counts
+    block_maximum = ndimage.maximum_filter1d(padded_counts, neighborhood_points, axis=1,
+                                             origin=-(neighborhood_points // 2))
+    neighborhood_max_counts = np.maximum(block_maximum[columns, positions],
+                                         block_maximum[columns, positions + neighborhood_points + 1])
+    stuck_values_mask = (counts > minimum_count) & (counts > values_multiplier * neighborhood_max_counts)
+    return [values[stuck_values_mask & (columns == column)] for column in range(columns_number)]
+
+
+def binned_kernel_density(in_data, density_samples, bandwidth=density_bandwidth,
+                          binning_refinement=density_binning_refinement,
+                          kernel_truncation=density_kernel_truncation):
+    # Gaussian kernel density of every depth column at once: data are linearly binned on a grid
+    # binning_refinement times finer than the (evenly spaced) density samples and convolved with the sampled kernel.
+    # As the per depth KernelDensity fit did, the whole records axis (masked records underlying data included)
+    # is the density normalization
+    in_values = np.ma.getdata(in_data).astype(np.float64)
+    records_number = in_values.shape[0]
+    columns_number = in_values.shape[1]
+    grid_step = (density_samples[1] - density_samples[0]) / binning_refinement
+    margin_points = int(np.ceil(kernel_truncation * bandwidth / grid_step))
+    samples_points = (len(density_samples) - 1) * binning_refinement + 1
+    grid_points = samples_points + 2 * margin_points
+    with np.errstate(invalid='ignore', over='ignore'):
+        grid_positions = (in_values - (density_samples[0] - margin_points * grid_step)) / grid_step
+        binned_mask = (grid_positions >= 0) & (grid_positions < grid_points - 1)
+    grid_positions = grid_positions[binned_mask]
+    lower_points = np.floor(grid_positions).astype(np.int64)
+    upper_weights = grid_positions - lower_points
+    lower_points += grid_points * np.broadcast_to(np.arange(columns_number), in_values.shape)[binned_mask]
+    binned_counts = \
+        np.bincount(lower_points, weights=1 - upper_weights, minlength=columns_number * grid_points) + \
+        np.bincount(lower_points + 1, weights=upper_weights, minlength=columns_number * grid_points)
+    binned_counts = binned_counts.reshape(columns_number, grid_points).T
+    kernel_offsets = np.arange(-margin_points, margin_points + 1) * grid_step
+    kernel = np.exp(-0.5 * (kernel_offsets / bandwidth) ** 2) / (np.sqrt(2 * np.pi) * bandwidth)
+    grid_density = signal.fftconvolve(binned_counts, kernel[:, np.newaxis], mode='same', axes=0) / records_number
+    return np.maximum(grid_density[margin_points: margin_points + samples_points: binning_refinement], 0)
+
+
+def linear_trend(in_time_data, in_data):
+    # Least squares linear trend of every depth column at once, from the masked sums of the anomalies with respect
+    # to the column averages (raw time sums would lose precision). As the per depth LinearRegression fit, score and
+    # predict did, single record columns have no slope and not a number score and constant columns have unit score.
+    # Columns with not finite valid data are not fitted
+    in_values = np.ma.getdata(in_data).astype(np.float64)
+    valid_mask = np.invert(np.ma.getmaskarray(in_data))
+    in_time_data = np.asarray(in_time_data, dtype=np.float64)[:, np.newaxis]
+    records_number = np.sum(valid_mask, axis=0)
+    with np.errstate(invalid='ignore', over='ignore', divide='ignore'):
+        fitted_mask = (records_number > 0) & np.all(np.isfinite(in_values) | np.invert(valid_mask), axis=0)
+        valid_mask &= fitted_mask
+        averaging_number = np.maximum(records_number, 1)
+        time_average = np.sum(np.where(valid_mask, in_time_data, 0), axis=0) / averaging_number
+        values_average = np.sum(np.where(valid_mask, in_values, 0), axis=0) / averaging_number
+        time_anomalies = np.where(valid_mask, in_time_data - time_average, 0)
+        values_anomalies = np.where(valid_mask, in_values - values_average, 0)
+        time_variance = np.sum(time_anomalies ** 2, axis=0)
+        slope = np.where(time_variance > 0, np.sum(time_anomalies * values_anomalies, axis=0) / time_variance, 0)
+        intercept = values_average - slope * time_average
+        residuals_sum = np.sum((values_anomalies - slope * time_anomalies) ** 2, axis=0)
+        total_sum = np.sum(values_anomalies ** 2, axis=0)
+        score = np.where(total_sum > 0, 1 - residuals_sum / total_sum, np.where(residuals_sum > 0, 0., 1.))
+    score[records_number < 2] = np.nan
+    trend_line = slope * in_time_data + intercept
+    return slope, intercept, score, trend_line, fitted_mask
+
+
+def monthly_groups(in_month_series, columns_number):
+    # Flat month of year - column group of every data value
+    month_indices = np.asarray(in_month_series, dtype=np.int64) - 1
+    return (month_indices[:, np.newaxis] * columns_number + np.arange(columns_number)).ravel()
+
+
+def monthly_valid_count(in_month_series, in_data):
+    # Valid data number for every month of year (rows) and depth column
+    columns_number = in_data.shape[1]
+    return np.bincount(monthly_groups(in_month_series, columns_number),
+                       weights=np.invert(np.ma.getmaskarray(in_data)).ravel(),
+                       minlength=12 * columns_number).reshape(12, columns_number)
+
+
+def monthly_climatology(in_month_series, in_data):
+    # Month of year average and (population) standard deviation of every depth column with grouped sums over the
+    # month - column groups. Months without valid data are masked
+    columns_number = in_data.shape[1]
+    groups = monthly_groups(in_month_series, columns_number)
+    valid_mask = np.invert(np.ma.getmaskarray(in_data)).ravel()
+    in_values = np.ma.getdata(in_data).astype(np.float64).ravel()
+    valid_count = np.bincount(groups, weights=valid_mask, minlength=12 * columns_number)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        monthly_mean = np.bincount(groups[valid_mask], weights=in_values[valid_mask],
+                                   minlength=12 * columns_number) / valid_count
+        anomalies = in_values[valid_mask] - monthly_mean[groups[valid_mask]]
+        monthly_std = np.sqrt(np.bincount(groups[valid_mask], weights=anomalies ** 2,
+                                          minlength=12 * columns_number) / valid_count)
+    empty_mask = (valid_count == 0).reshape(12, columns_number)
+    return [np.ma.array(monthly_mean.reshape(12, columns_number), mask=empty_mask, dtype=np.float32),
+            np.ma.array(monthly_std.reshape(12, columns_number), mask=empty_mask, dtype=np.float32)]
+
+
+def density_lookup(in_data, density_samples, density_data):
+    # Density of every data point, linearly interpolated from the density of its column (depth) on the uniform
+    # density_samples grid (the grid index is computed arithmetically).
+    # Masked (and set to out_fill_value) where data are masked, not a number or outside the grid
+    in_values = np.ma.getdata(in_data)
+    density_values = np.ma.getdata(density_data).astype(np.float64)
+    samples_number = len(density_samples)
+    sample_step = (density_samples[-1] - density_samples[0]) / (samples_number - 1)
+    with np.errstate(invalid='ignore'):
+        outside_mask = np.invert((in_values >= density_samples[0]) & (in_values <= density_samples[-1]))
+        sample_positions = \
+            np.clip((in_values.astype(np.float64) - density_samples[0]) / sample_step, 0, samples_number - 1)
+    sample_positions[outside_mask] = 0
+    sample_indices = np.minimum(sample_positions.astype(np.int64), samples_number - 2)
+    sample_weights = sample_positions - sample_indices
+    columns = np.arange(density_values.shape[-1])
+    interpolated_density = density_values[sample_indices, columns] * (1 - sample_weights) + \
+        density_values[sample_indices + 1, columns] * sample_weights
+    lookup_mask = outside_mask | np.ma.getmaskarray(in_data)
+    interpolated_density[lookup_mask] = out_fill_value
+    return np.ma.array(interpolated_density, mask=lookup_mask, fill_value=out_fill_value)
+
+
+def iteration_statistics(in_data, in_time_data, in_month_series, density_samples, historical_statistics=None):
+    # Monthly climatology, anomaly linear trend and filtered (detrended anomaly) data density of a QC iteration data.
+    # In update mode the historical statistics [monthly mean, monthly standard deviation, trend, filtered density]
+    # are used instead of the ones of in_data
+    depths_number = in_data.shape[-1]
+
+    # Removing monthly climatology from data
+    if historical_statistics is not None:
+        [monthly_mean_climatology_data, monthly_std_climatology_data] = historical_statistics[: 2]
+    else:
+        [monthly_mean_climatology_data, monthly_std_climatology_data] = monthly_climatology(in_month_series, in_data)
+    monthly_mean_series = monthly_mean_climatology_data[in_month_series - 1, :]
+    # monthly_std_series = monthly_std_climatology_data[in_month_series - 1, :]
+    detrended_variable_data = np.ma.copy(in_data) - monthly_mean_series  # / monthly_std_series
+
+    # Removing linear trend from data
+    trend_information_data = np.zeros(shape=(depths_number, 2), dtype=np.float32)
+    trend_line = np.ma.copy(detrended_variable_data) * 0
+    regression_model_score = np.zeros(shape=depths_number, dtype=np.float32)
+    if historical_statistics is None:
+        [trend_slope, trend_intercept, trend_score, trend_fit_line, trend_fitted_mask] = \
+            linear_trend(in_time_data, detrended_variable_data)
+    for depth in range(depths_number):
+        if historical_statistics is not None:
+            trend_information_data[depth] = historical_statistics[2][depth]
+            trend_line[..., depth] = trend_information_data[depth][0] * in_time_data + trend_information_data[depth][1]
+        else:
+            data_selection = np.invert(np.ma.getmaskarray(detrended_variable_data)[..., depth])
+            if np.all(np.invert(data_selection)):
+                continue
+            if not trend_fitted_mask[depth]:
+                print(' Warning: detrending failed. Using direct data instead.', file=sys.stderr)
+            else:
+                regression_model_score[depth] = trend_score[depth]
+                if regression_model_score[depth] < 0:
+                    print(' Warning: regression score too low. Using direct data instead.', file=sys.stderr)
+                else:
+                    trend_information_data[depth] = np.array([trend_slope[depth] * 86400 * 365, trend_intercept[depth]])
+                    trend_line[data_selection, depth] = trend_fit_line[data_selection, depth]
+        detrended_variable_data[..., depth] -= trend_line[..., depth]
+
+    if historical_statistics is not None:
+        filtered_density_data = historical_statistics[3]
+    else:
+        filtered_density_data = \
+            binned_kernel_density(detrended_variable_data, density_samples).astype(detrended_variable_data.dtype)
+    return [monthly_mean_climatology_data, monthly_std_climatology_data, trend_information_data, trend_line,
+            regression_model_score, detrended_variable_data, filtered_density_data]
+
+
 # Functional version
 def time_series_post_processing(in_file=None, in_variable_standard_name=None, update_mode=None,
                                 routine_qc_iterations=None, climatology_file=None,
-                                out_file=None, verbose=True):
+                                out_file=None, in_memory=None, out_memory=False, last_processed_time=None,
+                                verbose=True):
     if __name__ == '__main__':
         return
     if verbose:
@@ -98,8 +348,8 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     # Enable or disable slight time rounding by two units down from the sampling time
     time_rounding = True
 
-    # Open input dataset
-    in_data = netCDF4.Dataset(in_file, mode='r')
+    # Open input dataset (from its netCDF contents if already loaded in memory)
+    in_data = netCDF4.Dataset(in_file, mode='r', memory=in_memory)
 
     # Loading record coordinate
     in_time = in_data.variables['time']
@@ -109,7 +359,19 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     elif 'seconds' in in_time_reference:
         in_time_data = np.round(in_time[...])
 
-    sampling_time_seconds = time_calc.time_calc(in_file, verbose=False)
+    # In incremental update (functional version only) only the records after last_processed_time (seconds) are
+    # loaded, preceded by the warm up records
+    first_record_index = 0
+    if update_mode and (last_processed_time is not None):
+        first_record_index = \
+            max(int(np.searchsorted(in_time_data, last_processed_time, side='right')) - incremental_warm_up_records,
+                0)
+        in_time_data = in_time_data[first_record_index:]
+        if verbose:
+            print(' Incremental update from record ' + str(first_record_index) + '.')
+
+    (time_step_values, time_step_counts) = time_calc.time_steps_count(in_time_data)
+    sampling_time_seconds = int(np.round(time_step_values[np.argmax(time_step_counts)]))
     if verbose:
         sampling_time = time.strftime('%H:%M:%S', time.gmtime(sampling_time_seconds))
         print(' most representative sampling time: ' + sampling_time + ' HH:MM:SS')
@@ -153,7 +415,10 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
 
     try:
         in_depth = in_data.variables['depth']
-        in_depth_data = in_depth[...]
+        if 'time' in in_depth.dimensions:
+            in_depth_data = in_depth[first_record_index:, ...]
+        else:
+            in_depth_data = in_depth[...]
     except KeyError:
         if 'time' in in_data.variables['lon'].dimensions:
             in_depth_data = np.zeros(shape=(out_time_series.shape[0], 1))
@@ -167,10 +432,9 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         in_depth_data = np.ma.array(in_depth_data, mask=np.zeros(shape=in_depth_data.shape, dtype=bool),
                                     fill_value=out_fill_value, dtype=in_depth_data.dtype)
 
-    in_variable_name = find_variable_name.find_variable_name(in_file, 'standard_name', in_variable_standard_name,
-                                                             verbose=False)
+    in_variable_name = find_variable_name.dataset_variable_name(in_data, 'standard_name', in_variable_standard_name)
     in_variable = in_data.variables[in_variable_name]
-    in_variable_data = in_variable[...]
+    in_variable_data = in_variable[first_record_index:, ...]
     try:
         in_variable_data_units = in_variable_data.units
     except AttributeError:
@@ -200,10 +464,6 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         out_variable_data = in_variable_data
 
     out_month_series = out_time_series.month
-    # noinspection PyUnresolvedReferences
-    monthly_mask = np.zeros(shape=(12, + out_time_series.shape[0]), dtype=bool)
-    for month in range(12):
-        monthly_mask[month, ...] = out_month_series == month + 1
     range_check_authorized = range_check_enabled
     if in_variable_standard_name == 'sea_water_practical_salinity':
         range_minimum = 5.
@@ -221,21 +481,18 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         range_maximum = None
         range_check_authorized = False
 
+    # Records of the rejection statistics: in incremental update only the ones after last_processed_time, as the
+    # warm up records were already counted by the previous run
+    stat_records_mask = np.ones(shape=out_time_data.shape[0], dtype=bool)
+    if update_mode and (last_processed_time is not None):
+        stat_records_mask = out_time_data > last_processed_time
+    stat_data_total = out_variable_data[stat_records_mask, ...].size
+
     out_stat = dict()
-    out_stat['data_total'] = str(out_variable_data.size)
-    out_stat['filled_data'] = str(np.sum(out_variable_data.mask))
-
-    detrended_variable_data = dict()
-    monthly_mean_climatology_data = dict()
-    monthly_std_climatology_data = dict()
-    trend_information_data = dict()
-    trend_line = dict()
-    regression_model_score = dict()
-    filtered_data = dict()
-    filtered_density_data = dict()
-    good_data = dict()
-    rejected_data_percentage_profile = dict()
-    good_qc_data = dict()
+    out_stat['data_total'] = str(stat_data_total)
+    out_stat['filled_data'] = str(np.sum(out_variable_data.mask[stat_records_mask, ...]))
+
+    historical_statistics = None
     if update_mode and (routine_qc_iterations >= 1):
         try:
             climatology_data = netCDF4.Dataset(climatology_file, mode='r')
@@ -266,6 +523,9 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
             filtered_density_history_data = \
                 climatology_data.variables[in_variable_standard_name + '_filtered_density'][..., index_depth_data]
             climatology_data.close()
+            historical_statistics = [monthly_mean_climatology_average_data,
+                                     monthly_mean_climatology_standard_deviation_data, trend_history_data,
+                                     filtered_density_history_data]
         except FileNotFoundError:
             time.sleep(sleep_time)
             print(' Warning: platform climatology file not found.',
@@ -282,211 +542,103 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     if 'ISPRA' in in_data_institution and in_variable_standard_name == 'sea_water_temperature':
         ispra_temperature_stuck_test = True
 
+    # QC iterations keep only the previous and current good data, iterative outputs are stacked along the last axis.
+    # Intermediate data history is kept only for plotting
+    iterations_number = routine_qc_iterations + 1
+    density_samples = np.arange(-10, 10, delta_x)
+    depths_number = in_depth_data.shape[-1]
+    monthly_mean_climatology_data = np.ma.masked_all((12, depths_number, iterations_number), dtype=np.float32)
+    monthly_std_climatology_data = np.ma.masked_all((12, depths_number, iterations_number), dtype=np.float32)
+    trend_line_data = np.ma.masked_all(out_variable_data.shape + (iterations_number,), dtype=np.float32)
+    filtered_data = np.ma.masked_all(out_variable_data.shape + (iterations_number,), dtype=np.float32)
+    filtered_density_data = np.ma.masked_all((len(density_samples), depths_number, iterations_number),
+                                             dtype=np.float32)
+    good_qc_data = np.empty(out_variable_data.shape + (iterations_number,), dtype=np.int8)
+    rejected_data_percentage_profile = np.empty(shape=(depths_number, iterations_number))
+    good_data = np.ma.copy(out_variable_data)
+    if plotting:
+        good_data_history = {-1: good_data}
     for iteration in range(routine_qc_iterations + 1):
         rejected_data_mask = np.zeros(out_variable_data.shape, dtype=bool)
-        if iteration == 0:
-            good_data[iteration - 1] = np.ma.copy(out_variable_data)
-            good_qc_data[iteration - 1] = np.array(1 + out_variable_data.mask * 3)
 
-        filtered_data[iteration - 1] = np.ma.copy(good_data[iteration - 1])
+        # Statistics of the previous iteration data (of the original data at first)
+        [monthly_mean_climatology_iteration, monthly_std_climatology_iteration, trend_information_data,
+         trend_line, regression_model_score, distribution_variable, filtered_density_iteration] = \
+            iteration_statistics(good_data, out_time_data, out_month_series, density_samples,
+                                 historical_statistics if update_mode and (iteration >= 1) else None)
+        if iteration >= 1:
+            monthly_mean_climatology_data[..., iteration - 1] = monthly_mean_climatology_iteration
+            monthly_std_climatology_data[..., iteration - 1] = monthly_std_climatology_iteration
+            trend_line_data[..., iteration - 1] = trend_line
+            filtered_data[..., iteration - 1] = distribution_variable
+            filtered_density_data[..., iteration - 1] = filtered_density_iteration
+        elif plotting:
+            [first_trend_information_data, first_trend_line, first_regression_model_score,
+             first_detrended_variable_data] = \
+                [trend_information_data, trend_line, regression_model_score, distribution_variable]
 
-        # Removing monthly climatology from data
-        if update_mode and (iteration >= 1):
-            monthly_mean_climatology_data[iteration - 1] = monthly_mean_climatology_average_data
-            monthly_std_climatology_data[iteration - 1] = monthly_mean_climatology_standard_deviation_data
-        else:
-            monthly_mean_climatology_data[iteration - 1] = np.ma.masked_all(shape=(12, in_depth_data.shape[-1]),
-                                                                            dtype=np.float32)
-            monthly_std_climatology_data[iteration - 1] = np.ma.masked_all(shape=(12, in_depth_data.shape[-1]),
-                                                                           dtype=np.float32)
-            for month in range(12):
-                if not np.invert(monthly_mask[month, ...]).all():
-                    monthly_mean_climatology_data[iteration - 1][month, :] = \
-                        np.ma.mean(filtered_data[iteration - 1][monthly_mask[month, ...]], axis=0)
-                    monthly_std_climatology_data[iteration - 1][month, :] = \
-                        np.ma.std(filtered_data[iteration - 1][monthly_mask[month, ...]], axis=0)
-
-        monthly_mean_series_iteration = monthly_mean_climatology_data[iteration - 1][out_month_series - 1, :]
-        # monthly_std_series_iteration = monthly_std_climatology_data[iteration - 1][out_month_series - 1, :]
-
-        filtered_data[iteration - 1] = \
-            (filtered_data[iteration - 1] - monthly_mean_series_iteration)  # / monthly_std_series_iteration
-
-        # Removing linear trend from data
-        detrended_variable_data[iteration - 1] = np.ma.copy(filtered_data[iteration - 1])
-        trend_information_data[iteration - 1] = np.zeros(shape=(in_depth_data.shape[-1], 2), dtype=np.float32)
-        trend_line[iteration - 1] = np.ma.copy(detrended_variable_data[iteration - 1]) * 0
-        regression_model_score[iteration - 1] = np.zeros(shape=in_depth_data.shape[-1], dtype=np.float32)
-        for depth in range(in_depth_data.shape[-1]):
-            if update_mode and (iteration >= 1):
-                trend_information_data[iteration - 1][depth] = trend_history_data[depth]
-                trend_line[iteration - 1][..., depth] = \
-                    trend_information_data[iteration - 1][depth][0] * out_time_data + \
-                    trend_information_data[iteration - 1][depth][1]
-            else:
-                data_selection = np.invert(detrended_variable_data[iteration - 1].mask[..., depth])
-                if np.all(np.invert(data_selection)):
-                    continue
-                not_filled_time_data = out_time_data[data_selection]
-                not_filled_time_series = detrended_variable_data[iteration - 1][data_selection, depth]
-                try:
-                    regression_model = \
-                        LinearRegression().fit(not_filled_time_data[:, np.newaxis], not_filled_time_series)
-                    regression_model_score[iteration - 1][depth] = \
-                        regression_model.score(not_filled_time_data[:, np.newaxis], not_filled_time_series)
-                    if regression_model_score[iteration - 1][depth] < 0:
-                        print(' Warning: regression score too low. Using direct data instead.', file=sys.stderr)
-                    else:
-                        trend_information_data[iteration - 1][depth] = \
-                            np.array([regression_model.coef_[0] * 86400 * 365, regression_model.intercept_])
-                        trend_line[iteration - 1][data_selection, depth] = \
-                            regression_model.predict(out_time_data[data_selection, np.newaxis])
-                except ValueError:
-                    print(' Warning: detrending failed. Using direct data instead.', file=sys.stderr)
-
-            detrended_variable_data[iteration - 1][..., depth] -= trend_line[iteration - 1][..., depth]
-            filtered_data[iteration - 1][..., depth] = \
-                np.ma.copy(detrended_variable_data[iteration - 1][..., depth])
-
-        distribution_variable = np.ma.copy(filtered_data[iteration - 1])
-        density_samples = np.arange(-10, 10, delta_x)
-        if update_mode and (iteration >= 1):
-            filtered_density_data[iteration - 1] = filtered_density_history_data
-        else:
-            filtered_density_data[iteration - 1] = \
-                np.empty(shape=(density_samples.shape[0], in_depth_data.shape[-1]),
-                         dtype=distribution_variable.dtype)
-            # start_run_time_iteration = calendar.timegm(time.gmtime())
-            for depth in range(in_depth_data.shape[-1]):
-                kernel_density = \
-                    KernelDensity(kernel='gaussian', bandwidth=0.2).fit(distribution_variable[..., depth, np.newaxis])
-                # noinspection PyUnresolvedReferences
-                filtered_density_data[iteration - 1][..., depth] = \
-                    np.exp(kernel_density.score_samples(density_samples[..., np.newaxis]))
-        # Define data distribution AS density (approximation)
-        filtered_distribution = filtered_density_data[iteration - 1]
-        interpolated_data = interpolate.interp1d(density_samples, filtered_distribution,
-                                                 kind='linear', axis=0,
-                                                 bounds_error=False, fill_value=out_fill_value)
-        interpolated_distribution = interpolated_data(distribution_variable.data)[..., 0]
-        interpolated_distribution = \
-            np.ma.masked_where(interpolated_distribution == out_fill_value, interpolated_distribution)
         if iteration == 0:
             if range_check_authorized:
                 # 1) Range check
                 if verbose:
                     print(' Compute range check.')
-                range_test_data = np.ma.filled(good_data[iteration - 1], range_minimum)
+                range_test_data = np.ma.filled(good_data, range_minimum)
                 out_of_range_mask = range_test_data < range_minimum
                 out_of_range_mask = \
                     np.logical_or(out_of_range_mask, range_test_data > range_maximum)
-                out_of_range_data_number = len(np.where(out_of_range_mask)[0])
+                out_of_range_data_number = len(np.where(out_of_range_mask[stat_records_mask, ...])[0])
                 out_stat['range_check_rejection'] = str(out_of_range_data_number)
                 out_of_range_data_percentage = \
-                    np.round(out_of_range_data_number / good_qc_data[iteration - 1].size * 100, decimals=2)
+                    np.round(out_of_range_data_number / max(stat_data_total, 1) * 100, decimals=2)
                 if verbose:
                     print(' Rejected data by range check for all depth levels: '
                           + str(out_of_range_data_number) + ' (' + str(out_of_range_data_percentage) + '%)')
                 rejected_data_mask = np.logical_or(rejected_data_mask, out_of_range_mask)
-                range_checked_data = np.ma.array(good_data[iteration - 1], mask=rejected_data_mask)
+                range_checked_data = np.ma.array(good_data, mask=rejected_data_mask)
             else:
-                range_checked_data = np.ma.copy(good_data[iteration - 1])
+                range_checked_data = np.ma.copy(good_data)
             # 2) Spike test
             if spike_test_enabled:
                 if verbose:
                     print(' Compute spike test.')
-                spike_test_data = np.ma.copy(range_checked_data)
-                spiked_test_maximum = np.ma.masked_all(spike_test_data.shape)
-                spiked_test_minimum = np.ma.masked_all(spike_test_data.shape)
-                spiked_test_sum = np.ma.array(np.zeros(spike_test_data.shape),
-                                              mask=np.ones(spike_test_data.shape, dtype=bool))
-                spiked_test_count = np.ma.array(np.zeros(spike_test_data.shape),
-                                                mask=np.ones(spike_test_data.shape, dtype=bool))
-                for point in range(1, spiked_neighborhood_test_points + 1):
-                    spiked_test_maximum[: -point, ...] = np.ma.max([spiked_test_maximum[: -point, ...],
-                                                                    spike_test_data[point:, ...]], axis=0)
-                    spiked_test_maximum[point:, ...] = np.ma.max([spiked_test_maximum[point:, ...],
-                                                                  spike_test_data[: -point]], axis=0)
-                    spiked_test_minimum[: -point, ...] = np.ma.min([spiked_test_minimum[: -point, ...],
-                                                                    spike_test_data[point:, ...]], axis=0)
-                    spiked_test_minimum[point:, ...] = np.ma.min([spiked_test_minimum[point:, ...],
-                                                                  spike_test_data[: -point]], axis=0)
-                    spiked_test_sum.mask[: -point, ...][np.invert(spike_test_data[point:, ...].mask)] = False
-                    spiked_test_sum.data[: -point, ...] += spike_test_data[point:, ...]
-                    spiked_test_sum.mask[point:, ...][np.invert(spike_test_data[: -point].mask)] = False
-                    spiked_test_sum.data[point:, ...] += spike_test_data[: -point, ...]
-                    spiked_test_count.mask[: -point, ...][np.invert(spike_test_data[point:, ...].mask)] = False
-                    spiked_test_count.data[: -point, ...][np.invert(spike_test_data[point:, ...].mask)] += 1
-                    spiked_test_count.mask[point:, ...][np.invert(spike_test_data[: -point].mask)] = False
-                    spiked_test_count.data[point:, ...][np.invert(spike_test_data[: -point].mask)] += 1
-
-                disabled_spike_test_mask = np.logical_or(spike_test_data.mask,
-                                                         np.ma.filled(spiked_test_count, fill_value=0)
-                                                         < 2 * spiked_neighborhood_test_points)
-                spiked_test_range = np.ma.masked_where(disabled_spike_test_mask,
-                                                       spiked_test_maximum - spiked_test_minimum)
-                spiked_test_average = np.ma.masked_where(disabled_spike_test_mask,
-                                                         spiked_test_sum / spiked_test_count)
-                spiked_data_mask = \
-                    np.abs(spike_test_data - spiked_test_average) > spiked_range_multiplier * spiked_test_range
-                spiked_data_mask = np.ma.filled(spiked_data_mask, fill_value=False)
-                spiked_data_number = len(np.where(spiked_data_mask)[0])
+                spiked_data_mask = spike_test_mask(range_checked_data)
+                spiked_data_number = len(np.where(spiked_data_mask[stat_records_mask, ...])[0])
                 out_stat['spike_test_rejection'] = str(spiked_data_number)
                 spiked_data_percentage = \
-                    np.round(spiked_data_number / good_qc_data[iteration - 1].size * 100, decimals=2)
+                    np.round(spiked_data_number / max(stat_data_total, 1) * 100, decimals=2)
                 if verbose:
                     print(' Rejected data by spike test for all depth levels: '
                           + str(spiked_data_number) + ' (' + str(spiked_data_percentage) + '%)')
                 rejected_data_mask = np.logical_or(rejected_data_mask, spiked_data_mask)
-                spike_checked_data = np.ma.array(good_data[iteration - 1], mask=rejected_data_mask)
+                spike_checked_data = np.ma.array(good_data, mask=rejected_data_mask)
             else:
-                spike_checked_data = np.ma.copy(good_data[iteration - 1])
+                spike_checked_data = np.ma.copy(good_data)
             # 3) Stuck values test
             if stuck_value_test_enabled:
                 if verbose:
                     print(' Compute stuck value test.')
                 stuck_values_mask = np.zeros(shape=rejected_data_mask.shape, dtype=bool)
+                stuck_values_list = stuck_values_search(spike_checked_data.data)
                 for depth in range(in_depth_data.shape[-1]):
-                    [unique_values, unique_counts] = \
-                        np.unique(spike_checked_data[..., depth].data, return_counts=True)
-                    try:
-                        out_fill_value_index = np.where(unique_values == out_fill_value)[0][0]
-                        unique_values = np.delete(unique_values, out_fill_value_index)
-                        unique_counts = np.delete(unique_counts, out_fill_value_index)
-                    except (IndexError, TypeError):
-                        pass
-                    # stuck value test
-                    if stuck_value_test_enabled:
-                        neighborhood_max_counts = np.zeros(unique_counts.shape)
-                        for point in range(1, stuck_neighborhood_test_points + 1):
-                            neighborhood_max_counts[: -point] = np.maximum(neighborhood_max_counts[: -point],
-                                                                           unique_counts[point:])
-                            neighborhood_max_counts[point:] = np.maximum(neighborhood_max_counts[point:],
-                                                                         unique_counts[: -point])
-                        stuck_values_bool = \
-                            np.logical_and(unique_counts > stuck_minimum_count,
-                                           unique_counts > stuck_values_multiplier * neighborhood_max_counts)
-                    stuck_values = unique_values[stuck_values_bool]
-                    # stuck_counts = unique_counts[stuck_values_bool]
-                    if ispra_temperature_stuck_test and (20. in unique_values) and (20. not in stuck_values):
+                    stuck_values = stuck_values_list[depth]
+                    if ispra_temperature_stuck_test and (20. not in stuck_values) and \
+                            np.any(spike_checked_data.data[..., depth] == 20.):
                         stuck_values = np.append(stuck_values, 20.)
-                        # stuck_counts = np.append(stuck_counts, unique_counts[unique_values == 20.])
                     if verbose and len(stuck_values) > 0:
                         print(' Detected possible stuck values at level ' + str(depth) + ': ' + str(stuck_values))
-                    stuck_values_mask[..., depth] = \
-                        np.any(spike_checked_data.data[..., depth, np.newaxis] == stuck_values, axis=-1)
+                    stuck_values_mask[..., depth] = np.isin(spike_checked_data.data[..., depth], stuck_values)
 
-                stuck_values_number = len(np.where(stuck_values_mask)[0])
+                stuck_values_number = len(np.where(stuck_values_mask[stat_records_mask, ...])[0])
                 out_stat['stuck_value_rejection'] = str(stuck_values_number)
                 stuck_values_percentage = \
-                    np.round(stuck_values_number / good_qc_data[iteration - 1].size * 100, decimals=2)
+                    np.round(stuck_values_number / max(stat_data_total, 1) * 100, decimals=2)
                 if verbose:
                     print(' Rejected data by stuck value test for all depth levels: '
                           + str(stuck_values_number) + ' (' + str(stuck_values_percentage) + '%)')
                 rejected_data_mask = np.logical_or(rejected_data_mask, stuck_values_mask)
-                stuck_value_checked_data = np.ma.array(good_data[iteration - 1], mask=rejected_data_mask)
+                stuck_value_checked_data = np.ma.array(good_data, mask=rejected_data_mask)
             else:
-                stuck_value_checked_data = np.ma.copy(good_data[iteration - 1])
+                stuck_value_checked_data = np.ma.copy(good_data)
         else:
             # Statistic QC low probable test
             if verbose:
@@ -494,122 +646,51 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
                     print(' Compute out of statistic quality check ' + str(iteration) + '.')
                 else:
                     print(' Compute out of climatological statistic quality check ' + str(iteration) + '.')
+            # Define data distribution AS density (approximation)
+            interpolated_distribution = \
+                density_lookup(distribution_variable, density_samples, filtered_density_iteration)
             statistic_data_mask = \
                 interpolated_distribution < statistic_probability_threshold * delta_x
-            high_data_mask = np.ones(shape=good_data[iteration - 1].shape, dtype=bool)
+            high_data_mask = np.ones(shape=good_data.shape, dtype=bool)
             if not update_mode:
-                for depth in range(in_depth_data.shape[-1]):
-                    for month in range(12):
-                        valid_data_depth_month = \
-                            np.where(np.invert(good_data[iteration - 1].mask[monthly_mask[month, ...], depth]))[0]
-                        if len(valid_data_depth_month) * sampling_time_seconds / 86400. < valid_data_minimum_days:
-                            high_data_mask[monthly_mask[month, ...], depth] = False
+                # Data in months with less than valid_data_minimum_days of valid data are not tested
+                monthly_valid_days = \
+                    monthly_valid_count(out_month_series, good_data) * sampling_time_seconds / 86400.
+                high_data_mask = np.invert(monthly_valid_days < valid_data_minimum_days)[out_month_series - 1, :]
 
             statistic_data_mask = np.logical_and(statistic_data_mask, high_data_mask)
-            statistic_data_number = len(np.where(statistic_data_mask)[0])
+            statistic_data_number = len(np.where(statistic_data_mask[stat_records_mask, ...])[0])
             statistic_data_mask = np.ma.filled(statistic_data_mask, fill_value=False)
             out_stat['statistic_rejection_' + str(iteration)] = str(statistic_data_number)
             statistic_data_percentage = \
-                np.round(statistic_data_number / good_qc_data[iteration - 1].size * 100, decimals=2)
+                np.round(statistic_data_number / max(stat_data_total, 1) * 100, decimals=2)
             if verbose:
                 print(' Rejected data at iteration ' + str(iteration) + ' for all depth levels: '
                       + str(statistic_data_number) + ' (' + str(statistic_data_percentage) + '%)')
             rejected_data_mask = np.logical_or(rejected_data_mask, statistic_data_mask)
 
-        good_data[iteration] = np.ma.copy(good_data[iteration - 1])
-        good_data[iteration][rejected_data_mask] = out_fill_value
-        good_data[iteration] = np.ma.masked_where(good_data[iteration] == out_fill_value, good_data[iteration])
-
-        good_qc_data[iteration] = np.copy(good_qc_data[iteration - 1])
-        if good_qc_data[iteration][rejected_data_mask].size > 0:
-            good_qc_data[iteration][rejected_data_mask] = 4
+        good_data = np.ma.copy(good_data)
+        good_data[rejected_data_mask] = out_fill_value
+        good_data = np.ma.masked_where(good_data == out_fill_value, good_data)
+        if plotting:
+            good_data_history[iteration] = good_data
 
-        good_qc_data[iteration] = \
-            np.ma.masked_where(good_qc_data[iteration] == out_fill_value, good_qc_data[iteration])
+        if iteration == 0:
+            good_qc_data[..., iteration] = 1 + out_variable_data.mask * 3
+        else:
+            good_qc_data[..., iteration] = good_qc_data[..., iteration - 1]
+        good_qc_data[..., iteration][rejected_data_mask] = 4
 
-        rejected_data_percentage_profile[iteration] = np.empty(shape=in_depth_data.shape[-1])
-        for depth in range(in_depth_data.shape[-1]):
-            rejected_data_depth_number = len(np.where(rejected_data_mask[..., depth])[0])
-            rejected_data_percentage_profile[iteration][depth] = \
-                np.round(rejected_data_depth_number / good_qc_data[iteration - 1][:, depth].size * 100, decimals=2)
+        rejected_data_percentage_profile[..., iteration] = \
+            np.round(np.sum(rejected_data_mask, axis=0) / out_variable_data.shape[0] * 100, decimals=2)
 
         if iteration == routine_qc_iterations:
-            filtered_data[iteration] = np.ma.copy(good_data[iteration])
-            
-            # Removing monthly climatology from data
-            if update_mode and (iteration >= 1):
-                monthly_mean_climatology_data[iteration] = monthly_mean_climatology_average_data
-                monthly_std_climatology_data[iteration] = monthly_mean_climatology_standard_deviation_data
-            else:
-                monthly_mean_climatology_data[iteration] = np.ma.masked_all(shape=(12, in_depth_data.shape[-1]),
-                                                                            dtype=np.float32)
-                monthly_std_climatology_data[iteration] = np.ma.masked_all(shape=(12, in_depth_data.shape[-1]),
-                                                                           dtype=np.float32)
-                for month in range(12):
-                    if not np.invert(monthly_mask[month, ...]).all():
-                        monthly_mean_climatology_data[iteration][month, :] = \
-                            np.ma.mean(filtered_data[iteration][monthly_mask[month, ...]], axis=0)
-                        monthly_std_climatology_data[iteration][month, :] = \
-                            np.ma.std(filtered_data[iteration][monthly_mask[month, ...]], axis=0)
-
-            monthly_mean_series_iteration = monthly_mean_climatology_data[iteration][out_month_series - 1, :]
-            # monthly_std_series_iteration = monthly_std_climatology_data[iteration][out_month_series - 1, :]
-
-            filtered_data[iteration] = \
-                (filtered_data[iteration] - monthly_mean_series_iteration)  # / monthly_std_series_iteration
-
-            # Removing linear trend from data
-            detrended_variable_data[iteration] = np.ma.copy(filtered_data[iteration])
-            trend_information_data[iteration] = np.zeros(shape=(in_depth_data.shape[-1], 2), dtype=np.float32)
-            trend_line[iteration] = np.ma.copy(detrended_variable_data[iteration]) * 0
-            regression_model_score[iteration] = np.zeros(shape=in_depth_data.shape[-1], dtype=np.float32)
-            for depth in range(in_depth_data.shape[-1]):
-                if update_mode and (iteration >= 1):
-                    trend_information_data[iteration][depth] = trend_history_data[depth]
-                    trend_line[iteration][..., depth] = \
-                        trend_information_data[iteration][depth][0] * out_time_data + \
-                        trend_information_data[iteration][depth][1]
-                else:
-                    data_selection = np.invert(detrended_variable_data[iteration].mask[..., depth])
-                    if np.all(np.invert(data_selection)):
-                        continue
-                    not_filled_time_data = out_time_data[data_selection]
-                    not_filled_time_series = detrended_variable_data[iteration][data_selection, depth]
-                    try:
-                        regression_model = \
-                            LinearRegression().fit(not_filled_time_data[:, np.newaxis], not_filled_time_series)
-                        regression_model_score[iteration][depth] = \
-                            regression_model.score(not_filled_time_data[:, np.newaxis], not_filled_time_series)
-                        if regression_model_score[iteration][depth] < 0:
-                            print(' Warning: regression score too low. Using direct data instead.', file=sys.stderr)
-                        else:
-                            trend_information_data[iteration][depth] = \
-                                np.array([regression_model.coef_[0] * 86400 * 365, regression_model.intercept_])
-                            trend_line[iteration][data_selection, depth] = \
-                                regression_model.predict(out_time_data[data_selection, np.newaxis])
-                    except ValueError:
-                        print(' Warning: detrending failed. Using direct data instead.', file=sys.stderr)
-
-                detrended_variable_data[iteration][..., depth] -= trend_line[iteration][..., depth]
-                filtered_data[iteration][..., depth] = \
-                    np.ma.copy(detrended_variable_data[iteration][..., depth])
-
-            distribution_variable = np.ma.copy(filtered_data[iteration])
-            density_samples = np.arange(-10, 10, delta_x)
-            if update_mode and (iteration >= 1):
-                filtered_density_data[iteration] = filtered_density_history_data
-            else:
-                filtered_density_data[iteration] = \
-                    np.empty(shape=(density_samples.shape[0], in_depth_data.shape[-1]),
-                             dtype=distribution_variable.dtype)
-                # start_run_time_iteration = calendar.timegm(time.gmtime())
-                for depth in range(in_depth_data.shape[-1]):
-                    kernel_density = \
-                        KernelDensity(kernel='gaussian', bandwidth=0.2).fit(
-                            distribution_variable[..., depth, np.newaxis])
-                    # noinspection PyUnresolvedReferences
-                    filtered_density_data[iteration - 1][..., depth] = \
-                        np.exp(kernel_density.score_samples(density_samples[..., np.newaxis]))
+            # Statistics of the last iteration data
+            [monthly_mean_climatology_data[..., iteration], monthly_std_climatology_data[..., iteration],
+             trend_information_data, trend_line_data[..., iteration], regression_model_score,
+             filtered_data[..., iteration], filtered_density_data[..., iteration]] = \
+                iteration_statistics(good_data, out_time_data, out_month_series, density_samples,
+                                     historical_statistics if update_mode and (iteration >= 1) else None)
 
         # time_diff_iteration = time.gmtime(calendar.timegm(time.gmtime()) - start_run_time_iteration)
         # if verbose:
@@ -621,16 +702,15 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     # Plotting part (OPTIONAL)
     if plotting:
         for depth in range(in_depth_data.shape[-1]):
-            plt.plot(out_time_series, good_data[-1][..., depth] - np.ma.mean(good_data[-1][..., depth]),
+            plt.plot(out_time_series,
+                     good_data_history[-1][..., depth] - np.ma.mean(good_data_history[-1][..., depth]),
                      label='Original data')
-            plt.plot(out_time_series, detrended_variable_data[-1][..., depth], label='Detrended data, slope = ' +
-                                                                                     str(np.around(
-                                                                                         trend_information_data[-1][
-                                                                                             0, 0], decimals=3)) +
-                                                                                     ', score = ' + str(
-                np.around(regression_model_score[-1][depth], decimals=3)))
-
-            plt.plot(out_time_series, trend_line[-1][..., depth], label='Regression trend line')
+            plt.plot(out_time_series, first_detrended_variable_data[..., depth],
+                     label='Detrended data, slope = ' +
+                           str(np.around(first_trend_information_data[0, 0], decimals=3)) +
+                           ', score = ' + str(np.around(first_regression_model_score[depth], decimals=3)))
+
+            plt.plot(out_time_series, first_trend_line[..., depth], label='Regression trend line')
             plt.legend()
             plt.title(os.path.basename(in_file) + ' trend view ' + str(in_depth_data[depth]) + 'm')
             manager = plt.get_current_fig_manager()
@@ -652,9 +732,9 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
             # plt.plot(out_time_series, out_variable_data[:, depth, ...], label='Original data')
             for iteration in range(routine_qc_iterations + 1):
                 if iteration == 0:
-                    plt.plot(out_time_series, good_data[iteration][:, depth, ...], label='Gross check')
+                    plt.plot(out_time_series, good_data_history[iteration][:, depth, ...], label='Gross check')
                 else:
-                    plt.plot(out_time_series, good_data[iteration][:, depth, ...],
+                    plt.plot(out_time_series, good_data_history[iteration][:, depth, ...],
                              label='Statistic QC ' + str(iteration))
 
                 if iteration == routine_qc_iterations:
@@ -667,9 +747,9 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
 
             for iteration in range(routine_qc_iterations + 1):
                 if iteration == 0:
-                    plt.plot(out_time_series, filtered_data[iteration][:, depth, ...], label='Gross check')
+                    plt.plot(out_time_series, filtered_data[:, depth, iteration], label='Gross check')
                 else:
-                    plt.plot(out_time_series, filtered_data[iteration][:, depth, ...],
+                    plt.plot(out_time_series, filtered_data[:, depth, iteration],
                              label='Statistic QC ' + str(iteration))
 
                 if iteration == routine_qc_iterations:
@@ -683,10 +763,10 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
 
             for iteration in range(routine_qc_iterations + 1):
                 if iteration == 0:
-                    plt.plot(density_samples, filtered_density_data[iteration][:, depth, ...],
+                    plt.plot(density_samples, filtered_density_data[:, depth, iteration],
                              label='Gross check')
                 else:
-                    plt.plot(density_samples, filtered_density_data[iteration][:, depth, ...],
+                    plt.plot(density_samples, filtered_density_data[:, depth, iteration],
                              label='Statistic QC ' + str(iteration))
 
                 if iteration == routine_qc_iterations:
@@ -700,8 +780,12 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
 
     if verbose:
         print(' Creating output dataset.')
-    # Create output dataset
-    out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
+    # Create output dataset (in memory if out_memory, returning its netCDF contents with the statistics)
+    if out_memory:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4',
+                                   memory=dataset_memory.dataset_memory_size(in_data))
+    else:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
 
     if verbose:
         print(' Creating dimensions.')
@@ -716,7 +800,10 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     out_dimension_variables = ['lon', 'lat', 'depth', 'time']
     for dimension_variable_name in out_dimension_variables:
         in_dimension_variable = in_data.variables[dimension_variable_name]
-        in_dimension_variable_data = in_dimension_variable[...]
+        if 'time' in in_dimension_variable.dimensions:
+            in_dimension_variable_data = in_dimension_variable[first_record_index:, ...]
+        else:
+            in_dimension_variable_data = in_dimension_variable[...]
         if verbose:
             print(' Attaching dimension variable ' + dimension_variable_name)
         if 'time' in in_dimension_variable.dimensions:
@@ -801,8 +888,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     out_rejected_data_percentage_profile_variable = out_data.createVariable('rejected_data_percentage_profile',
                                                                             datatype=np.float32,
                                                                             dimensions=('depth', 'iteration'))
-    for iteration in range(routine_qc_iterations + 1):
-        out_rejected_data_percentage_profile_variable[..., iteration] = rejected_data_percentage_profile[iteration]
+    out_rejected_data_percentage_profile_variable[...] = rejected_data_percentage_profile
     out_rejected_data_percentage_profile_variable.long_name = 'Rejected Data Percentage Vertical Profile'
     out_rejected_data_percentage_profile_variable.standard_name = 'rejected_data_percentage_profile'
     out_rejected_data_percentage_profile_variable.units = 'percentile'
@@ -815,8 +901,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     out_variable_qc = out_data.createVariable(in_variable_standard_name + '_qc', datatype=np.float32,
                                               dimensions=('time', 'depth', 'iteration'),
                                               zlib=True, complevel=1)
-    for iteration in range(routine_qc_iterations + 1):
-        out_variable_qc[..., iteration] = good_qc_data[iteration]
+    out_variable_qc[...] = good_qc_data
     out_variable_qc.long_name = 'quality flag'
     out_variable_qc.flag_values = '1, 4'
     out_variable_qc.flag_meanings = '1 = good_data, 4 = bad_data'
@@ -830,8 +915,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
                                                                 dimensions=('month', 'depth', 'iteration'),
                                                                 fill_value=out_fill_value,
                                                                 zlib=True, complevel=1)
-    for iteration in range(routine_qc_iterations + 1):
-        monthly_mean_climatology_variable[..., iteration] = monthly_mean_climatology_data[iteration]
+    monthly_mean_climatology_variable[...] = monthly_mean_climatology_data
     monthly_mean_climatology_variable.missing_value = np.float32(out_fill_value)
     monthly_mean_climatology_variable.long_name = 'Monthly Climatology Iterative Average'
     monthly_mean_climatology_variable.standard_name = 'monthly_mean_climatology'
@@ -846,8 +930,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     monthly_std_climatology_variable = \
         out_data.createVariable(in_variable_standard_name + '_ms_clim',  datatype=np.float32,
                                 dimensions=('month', 'depth', 'iteration'), fill_value=out_fill_value)
-    for iteration in range(routine_qc_iterations + 1):
-        monthly_std_climatology_variable[..., iteration] = monthly_std_climatology_data[iteration]
+    monthly_std_climatology_variable[...] = monthly_std_climatology_data
     monthly_std_climatology_variable.missing_value = np.float32(out_fill_value)
     monthly_std_climatology_variable.long_name = 'Monthly Climatology Iterative Standard Deviation'
     monthly_std_climatology_variable.standard_name = 'monthly_std_climatology'
@@ -861,8 +944,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         print(' Creating iterative trend line data.')
     out_trend_line_variable = out_data.createVariable(in_variable_standard_name + '_trend', datatype=np.float32,
                                                       dimensions=('time', 'depth', 'iteration'))
-    for iteration in range(routine_qc_iterations + 1):
-        out_trend_line_variable[..., iteration] = trend_line[iteration]
+    out_trend_line_variable[...] = trend_line_data
     out_trend_line_variable.long_name = 'Anomaly Trend Line Data'
     out_trend_line_variable.standard_name = 'anomaly_trend_line_data'
     out_trend_line_variable.units = in_variable.units
@@ -877,8 +959,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         out_data.createVariable(in_variable_standard_name + '_filtered', datatype=np.float32,
                                 dimensions=('time', 'depth', 'iteration'),
                                 fill_value=out_fill_value, zlib=True, complevel=1)
-    for iteration in range(routine_qc_iterations + 1):
-        filtered_variable[..., iteration] = filtered_data[iteration]
+    filtered_variable[...] = filtered_data
     filtered_variable.missing_value = np.float32(out_fill_value)
     filtered_variable.long_name = 'Iterative Filtered Data'
     filtered_variable.standard_name = 'filtered_data'
@@ -894,8 +975,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         out_data.createVariable(in_variable_standard_name + '_filtered_density', datatype=np.float32,
                                 dimensions=('samples', 'depth', 'iteration'),
                                 fill_value=out_fill_value, zlib=True, complevel=1)
-    for iteration in range(routine_qc_iterations + 1):
-        filtered_density_variable[..., iteration] = filtered_density_data[iteration]
+    filtered_density_variable[...] = filtered_density_data
     filtered_density_variable.missing_value = np.float32(out_fill_value)
     filtered_density_variable.long_name = 'Iterative Filtered Data Density'
     filtered_density_variable.standard_name = 'filtered_data_density'
@@ -927,7 +1007,10 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     if verbose:
         print(' Closing output dataset.')
         print(' -------------------------')
-    out_data.close()
+    if out_memory:
+        out_contents = bytes(out_data.close())
+    else:
+        out_data.close()
 
     if not update_mode:
         if verbose:
@@ -1013,7 +1096,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
                                                                                 dimensions=('time', 'depth'),
                                                                                 fill_value=out_fill_value,
                                                                                 zlib=True, complevel=1)
-        monthly_mean_climatology_variable[...] = monthly_mean_climatology_data[routine_qc_iterations]
+        monthly_mean_climatology_variable[...] = monthly_mean_climatology_data[..., routine_qc_iterations]
         monthly_mean_climatology_variable.missing_value = np.float32(out_fill_value)
         monthly_mean_climatology_variable.long_name = 'Monthly Climatology Average'
         monthly_mean_climatology_variable.standard_name = 'monthly_mean_climatology'
@@ -1028,7 +1111,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         monthly_std_climatology_variable = \
             out_climatology_data.createVariable(in_variable_standard_name + '_ms_clim', datatype=np.float32,
                                                 dimensions=('time', 'depth'), fill_value=out_fill_value)
-        monthly_std_climatology_variable[...] = monthly_std_climatology_data[routine_qc_iterations]
+        monthly_std_climatology_variable[...] = monthly_std_climatology_data[..., routine_qc_iterations]
         monthly_std_climatology_variable.missing_value = np.float32(out_fill_value)
         monthly_std_climatology_variable.long_name = 'Monthly Climatology Standard Deviation'
         monthly_std_climatology_variable.standard_name = 'monthly_std_climatology'
@@ -1043,7 +1126,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
         trend_information_variable = out_climatology_data.createVariable(in_variable_standard_name + '_trend',
                                                                          datatype=np.float32,
                                                                          dimensions=('depth', 'axis_nbounds'))
-        trend_information_variable[...] = trend_information_data[routine_qc_iterations]
+        trend_information_variable[...] = trend_information_data
         trend_information_variable.long_name = 'Trend Information Data Vertical Profile'
         trend_information_variable.standard_name = 'trend_information_data'
         trend_information_variable.units = in_variable.units
@@ -1058,7 +1141,7 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
             out_climatology_data.createVariable(in_variable_standard_name + '_filtered_density', datatype=np.float32,
                                                 dimensions=('samples', 'depth'),
                                                 fill_value=out_fill_value, zlib=True, complevel=1)
-        filtered_density_variable[...] = filtered_density_data[routine_qc_iterations]
+        filtered_density_variable[...] = filtered_density_data[..., routine_qc_iterations]
         filtered_density_variable.missing_value = np.float32(out_fill_value)
         filtered_density_variable.long_name = 'Filtered Data Density'
         filtered_density_variable.standard_name = 'filtered_data_density'
@@ -1090,6 +1173,8 @@ def time_series_post_processing(in_file=None, in_variable_standard_name=None, up
     # Close input dataset
     in_data.close()
 
+    if out_memory:
+        return [out_stat, out_contents]
     return out_stat
 
 
@@ -1118,4 +1203,4 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
         verbose = True
 
     time_series_post_processing(in_file, in_variable_standard_name, update_mode, routine_qc_iterations,
-                                climatology_file, out_file, verbose)
+                                climatology_file, out_file, None, False, None, verbose)
@@ -33,7 +33,7 @@ def intersect(string_list):
 
 # Functional version
 def pointwise_datasets_concatenator(in_list=None, out_file=None, in_fields_standard_name_str=None,
-                                    first_date_str=None, last_date_str=None, verbose=True):
+                                    first_date_str=None, last_date_str=None, out_memory=False, verbose=True):
     """
     Script to concatenate pointwise devices dataset with preserving timestep ordering
 
@@ -51,7 +51,10 @@ def pointwise_datasets_concatenator(in_list=None, out_file=None, in_fields_stand
 
         5) Last date in YYYYMMDD or in YYYY-MM-DD HH:MM:SS (OPTIONAL);
 
-        6) Verbosity switch (OPTIONAL)
+        6) In memory output switch (OPTIONAL, functional version only): the concatenated dataset is not written to
+            disk and its netCDF contents are returned, to be opened with netCDF4.Dataset(out_file, memory=...);
+
+        7) Verbosity switch (OPTIONAL)
 
     Written Nov 9, 2017 by Paolo Oliveri
     """
@@ -117,6 +120,7 @@ def pointwise_datasets_concatenator(in_list=None, out_file=None, in_fields_stand
               ' (if None it will be the first available date on each device)')
         print(' Last date to process = ' + str(last_date_str) +
               ' (if None it will be the last available date on each device)')
+        print(' In memory output switch = ' + str(out_memory))
         print(' verbosity switch = ' + str(verbose))
         print(' -------------------------')
         print(' Starting process...')
@@ -906,7 +910,13 @@ def pointwise_datasets_concatenator(in_list=None, out_file=None, in_fields_stand
 
         if verbose:
             print(' Creating output dataset ' + out_file + '.')
-        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
+        if out_memory:
+            # Initial in memory size from the uncompressed data to avoid buffer reallocations
+            out_memory_size = out_time_data.nbytes + \
+                int(np.sum([out_variable_data[variable_name].nbytes for variable_name in out_variables]))
+            out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4', memory=out_memory_size)
+        else:
+            out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
         for dimension_number in range(len(output_dimensions)):
             dimension_name = output_dimensions[dimension_number]
             dimension_size = output_dimensions_sizes[dimension_number]
@@ -990,6 +1000,8 @@ def pointwise_datasets_concatenator(in_list=None, out_file=None, in_fields_stand
         if verbose:
             print(' Closing output dataset ' + out_file + '.')
             print(' -------------------------')
+        if out_memory:
+            return bytes(out_data.close())
         out_data.close()
 
 
@@ -1025,4 +1037,4 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
         verbose = True
 
     pointwise_datasets_concatenator(in_list, out_file, in_fields_standard_name_str,
-                                    first_date_str, last_date_str, verbose)
+                                    first_date_str, last_date_str, False, verbose)
@@ -1,9 +1,9 @@
 import sys
 import os
-import shutil
 import time
 import numpy as np
 import netCDF4
+from SOURCE import dataset_memory
 
 # Global variables
 sleep_time = 0.1  # seconds
@@ -18,7 +18,7 @@ def string_to_bool(string):
 
 
 # Functional version
-def records_monotonicity_fixer(in_file=None, out_file=None, verbose=True):
+def records_monotonicity_fixer(in_file=None, out_file=None, in_memory=None, out_memory=False, verbose=True):
     # if __name__ == '__main__':
     #     return
     if verbose:
@@ -38,7 +38,8 @@ def records_monotonicity_fixer(in_file=None, out_file=None, verbose=True):
         print(' Output file = ' + out_file)
         print(' Verbosity switch = ' + str(verbose))
 
-    in_data = netCDF4.Dataset(in_file, mode='r')
+    # Open input dataset (from its netCDF contents if already loaded in memory)
+    in_data = netCDF4.Dataset(in_file, mode='r', memory=in_memory)
     in_time_data = in_data.variables['time'][:]
     sort_indices = np.argsort(in_time_data)
 
@@ -47,15 +48,18 @@ def records_monotonicity_fixer(in_file=None, out_file=None, verbose=True):
             print(' No reversed time step segments found. Copying input file to output file and exiting.')
             print(' -------------------------')
         in_data.close()
-        shutil.copy2(in_file, out_file)
-        return
+        return dataset_memory.dataset_copy(in_file, out_file, in_memory, out_memory)
 
     if verbose:
         print(' Starting process...')
         print(' -------------------------')
         print(' Creating output dataset.')
-    # Create output dataset
-    out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
+    # Create output dataset (in memory if out_memory, returning its netCDF contents)
+    if out_memory:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4',
+                                   memory=dataset_memory.dataset_memory_size(in_data))
+    else:
+        out_data = netCDF4.Dataset(out_file, mode='w', format='NETCDF4')
 
     # Copy fixed dimensions in output dataset
     if verbose:
@@ -98,6 +102,8 @@ def records_monotonicity_fixer(in_file=None, out_file=None, verbose=True):
         print(' -------------------------')
     # Close input and output datasets
     in_data.close()
+    if out_memory:
+        return bytes(out_data.close())
     out_data.close()
 
 
@@ -117,4 +123,4 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
     except (IndexError, ValueError):
         verbose = True
 
-    records_monotonicity_fixer(in_file, out_file, verbose)
+    records_monotonicity_fixer(in_file, out_file, None, False, verbose)
@@ -15,6 +15,28 @@ def string_to_bool(string):
         return False
 
 
+def time_steps_count(in_time_data):
+    # Not null time steps values and occurrences of already loaded (and rounded) time data
+    if np.ma.is_masked(in_time_data):
+        in_time_data = in_time_data[np.invert(in_time_data.mask)]
+    in_time_data = np.sort(in_time_data)
+    time_step_array = in_time_data[1:] - in_time_data[: -1]
+    (time_step_values, time_step_counts) = np.unique(time_step_array, return_counts=True)
+    if (len(time_step_values) > 0) and (0 in time_step_values):
+        zero_value_index = np.where(time_step_values == 0)[0][0]
+        time_step_values = np.delete(time_step_values, zero_value_index)
+        time_step_counts = np.delete(time_step_counts, zero_value_index)
+    return time_step_values, time_step_counts
+
+
+def time_axis_seconds(time_stamps, left_time_bounds, right_time_bounds):
+    # CF time axis data (seconds since 1970-01-01T00:00:00Z, int64) of pandas DatetimeIndex time stamps and
+    # boundaries: returns time data and (time, 2) time bounds data
+    time_data = time_stamps.asi8 // 1000000000
+    time_bounds_data = np.stack([left_time_bounds.asi8 // 1000000000, right_time_bounds.asi8 // 1000000000], axis=-1)
+    return time_data, time_bounds_data
+
+
 # Functional version
 def time_calc(in_file=None, verbose=True):
     # if __name__ == '__main__':
@@ -45,15 +67,7 @@ def time_calc(in_file=None, verbose=True):
         in_time_data = np.round(in_time[...] * 86400.)
     elif 'seconds' in time_reference:
         in_time_data = np.round(in_time[...])
-    if np.ma.is_masked(in_time_data):
-        in_time_data = in_time_data[np.invert(in_time_data.mask)]
-    in_time_data = np.sort(in_time_data)
-    time_step_array = in_time_data[1:] - in_time_data[: -1]
-    (time_step_values, time_step_counts) = np.unique(time_step_array, return_counts=True)
-    if (len(time_step_values) > 0) and (0 in time_step_values):
-        zero_value_index = np.where(time_step_values == 0)[0][0]
-        time_step_values = np.delete(time_step_values, zero_value_index)
-        time_step_counts = np.delete(time_step_counts, zero_value_index)
+    (time_step_values, time_step_counts) = time_steps_count(in_time_data)
     if verbose:
         for i in range(time_step_values.shape[0]):
             if time_step_counts[i] > 1:
@@ -16,7 +16,7 @@ def string_to_bool(string):
 
 
 # Functional version
-def time_check(in_file=None, verbose=True):
+def time_check(in_file=None, in_memory=None, verbose=True):
     # if __name__ == '__main__':
     #     return
     if verbose:
@@ -35,7 +35,8 @@ def time_check(in_file=None, verbose=True):
         print(' Verbosity switch = ' + str(verbose))
         print(' -------------------------')
 
-    in_data = netCDF4.Dataset(in_file, mode='r')
+    # Open input dataset (from its netCDF contents if already loaded in memory)
+    in_data = netCDF4.Dataset(in_file, mode='r', memory=in_memory)
     try:
         in_time = in_data.variables['time']
     except KeyError:
@@ -121,5 +122,5 @@ if os.path.basename(sys.argv[0]) == os.path.basename(__file__):
     except (IndexError, ValueError):
         verbose = True
 
-    status = time_check(in_file, verbose)
+    status = time_check(in_file, None, verbose)
     print(status)
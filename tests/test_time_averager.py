@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import netCDF4
+import pytest
+from SOURCE.obs_postpro import time_averager
+
+
+def regular_series_file(in_file, records_number, sampling_seconds, depths_number=2):
+    # Regular gap free time series (with some masked values) in the time_averager input layout
+    random_generator = np.random.default_rng(0)
+    in_data = netCDF4.Dataset(in_file, mode='w', format='NETCDF4')
+    in_data.createDimension('time', None)
+    in_data.createDimension('depth', depths_number)
+    in_data.createDimension('latitude', 1)
+    in_data.createDimension('longitude', 1)
+    in_time = in_data.createVariable('time', 'f8', dimensions=('time',))
+    in_time.units = 'seconds since 1970-01-01T00:00:00Z'
+    in_time[...] = 1528848000. + np.arange(records_number) * sampling_seconds
+    in_data.createVariable('depth', 'f4', dimensions=('depth',))[...] = np.arange(depths_number) * 10. + 1.
+    in_data.createVariable('lat', 'f4', dimensions=('latitude',))[...] = 40.
+    in_data.createVariable('lon', 'f4', dimensions=('longitude',))[...] = 10.
+    in_variable = in_data.createVariable('TEMP', 'f4', dimensions=('time', 'depth'), fill_value=1.e20)
+    in_variable.standard_name = 'sea_water_temperature'
+    in_variable_data = np.ma.array(15. + 5. * np.sin(np.arange(records_number)[:, np.newaxis] / 50.) +
+                                   random_generator.normal(0., 1., (records_number, depths_number)))
+    in_variable_data[random_generator.random(in_variable_data.shape) < 0.05] = np.ma.masked
+    in_variable[...] = in_variable_data
+    in_data.history = 'regular series'
+    in_data.close()
+
+
+@pytest.mark.parametrize('records_number, sampling_seconds, chunk_records_number',
+                         [(720, 1200, None), (720, 1200, 100), (10000, 3600, None), (3000, 420, None)])
+def test_multiple_steps_equal_single_steps(tmp_path, records_number, sampling_seconds, chunk_records_number):
+    # Averages computed in one pass for several steps (rolled up from finer steps when possible) must be
+    # the ones computed for every step alone
+    in_file = str(tmp_path / 'in.nc')
+    regular_series_file(in_file, records_number, sampling_seconds)
+    average_steps = ['01:00:00', '24:00:00', '1', '12']
+    out_files = [str(tmp_path / ('multiple_' + str(step) + '.nc')) for step in range(len(average_steps))]
+    time_averager.time_averager(in_file, ' '.join(average_steps), ' '.join(out_files), 'sea_water_temperature',
+                                chunk_records_number=chunk_records_number, verbose=False)
+    for average_step, out_file in zip(average_steps, out_files):
+        single_out_file = str(tmp_path / 'single.nc')
+        time_averager.time_averager(in_file, average_step, single_out_file, 'sea_water_temperature',
+                                    verbose=False)
+        single_data = netCDF4.Dataset(single_out_file, mode='r')
+        multiple_data = netCDF4.Dataset(out_file, mode='r')
+        for variable_name in ['time', 'time_bounds', 'TEMP']:
+            single_variable_data = single_data.variables[variable_name][...]
+            multiple_variable_data = multiple_data.variables[variable_name][...]
+            assert np.array_equal(np.ma.getmaskarray(single_variable_data),
+                                  np.ma.getmaskarray(multiple_variable_data))
+            np.testing.assert_allclose(np.ma.filled(multiple_variable_data, 0.),
+                                       np.ma.filled(single_variable_data, 0.), rtol=1.e-6, atol=0.)
+        single_data.close()
+        multiple_data.close()
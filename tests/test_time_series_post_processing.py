@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from SOURCE.obs_postpro import time_series_post_processing
+
+# Accuracy of the binned kernel density with respect to the per depth sklearn KernelDensity fit it replaced:
+# relative error below density_tolerance where the density is above 1% of its column peak
+# and absolute error below density_tolerance times the column peak everywhere
+density_tolerance = 1.e-3  # relative
+
+
+def test_binned_kernel_density_matches_sklearn():
+    kernel_density = pytest.importorskip('sklearn.neighbors').KernelDensity
+    random_generator = np.random.default_rng(0)
+    records_number = 3000
+    in_data = np.ma.array(np.column_stack([
+        random_generator.normal(0, 1, records_number),
+        random_generator.normal(2, 0.5, records_number),
+        random_generator.standard_t(3, records_number),
+        np.concatenate([random_generator.normal(-3, 2, records_number // 2),
+                        random_generator.normal(4, 1, records_number - records_number // 2)])]))
+    # Masked records with the fill value underneath, as in the post processing detrended data
+    in_data[random_generator.random(in_data.shape) < 0.2] = np.ma.masked
+    in_data.data[in_data.mask] = time_series_post_processing.out_fill_value
+    density_samples = np.arange(-10, 10, time_series_post_processing.delta_x)
+
+    binned_density = time_series_post_processing.binned_kernel_density(in_data, density_samples)
+    reference_density = np.column_stack(
+        [np.exp(kernel_density(kernel='gaussian', bandwidth=0.2).fit(
+            np.ma.getdata(in_data)[:, depth, np.newaxis]).score_samples(density_samples[:, np.newaxis]))
+         for depth in range(in_data.shape[1])])
+
+    assert binned_density.shape == reference_density.shape
+    peak_density = np.max(reference_density, axis=0)
+    assert np.all(np.abs(binned_density - reference_density) <= density_tolerance * peak_density)
+    significant_mask = reference_density > peak_density / 100
+    assert np.all(np.abs(binned_density - reference_density)[significant_mask] <=
+                  density_tolerance * reference_density[significant_mask])